@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -9,6 +10,16 @@ from motor.motor_asyncio import AsyncIOMotorClient
 
 from app.config import settings
 from app.routers import user_router, recipe_router, review_router, collection_router
+from app.utils.indexes import ensure_indexes
+from app.utils.loaders import user_loader_metrics
+from app.utils.search import ensure_search_index
+from app.utils.storage import create_storage
+from app.utils.similarity import build_similarity_index
+from app.utils.foryou import build_foryou_pool, refresh_periodically
+from app.utils.token import load_revoked_tokens, refresh_revoked_tokens_periodically
+from app.utils.mail import create_mailer
+from app.utils.jobs import run_pending_jobs
+from app.utils.responses import FastJSONResponse
 
 # Define the startup and shutdown logic using async context manager
 @asynccontextmanager
@@ -22,17 +33,53 @@ async def app_lifespan(app: FastAPI):
         await app.mongodb["users"].drop()
         await app.mongodb["recipes"].drop()
         await app.mongodb["collections"].drop()
+        await app.mongodb["reviews"].drop()
+        await app.mongodb["recipe_search"].drop()
+        await app.mongodb["revoked_tokens"].drop()
+        await app.mongodb["jobs"].drop()
+        await app.mongodb["follows"].drop()
+        await app.mongodb["timelines"].drop()
 
     else:
         app.mongodb_client = AsyncIOMotorClient(settings.DB_URL)
         app.mongodb = app.mongodb_client[settings.DB_NAME]
-    
+
+    # Create the indexes the routers depend on, failing fast on conflicts
+    await ensure_indexes(app.mongodb)
+    await ensure_search_index(app.mongodb)
+
+    # A single storage client is shared by every upload
+    app.storage = create_storage(settings)
+
+    app.similarity = await build_similarity_index(app.mongodb)
+
+    # The foryou candidate pool is ranked now and re-ranked periodically
+    app.foryou = await build_foryou_pool(app.mongodb)
+    app.foryou_task = asyncio.create_task(refresh_periodically(app.foryou, app.mongodb))
+
+    # Revocations are reloaded periodically to pick up logouts on other instances
+    await load_revoked_tokens(app.mongodb)
+    app.revoked_tokens_task = asyncio.create_task(refresh_revoked_tokens_periodically(app.mongodb, settings.REVOKED_TOKENS_REFRESH))
+
+    # Outgoing mail is sent in the background by the queue workers
+    app.mailer = create_mailer(settings)
+    await app.mailer.start()
+
+    # Resume the jobs an earlier process left unfinished
+    app.jobs_task = asyncio.create_task(run_pending_jobs(app.mongodb))
+
     yield  # The application runs while this yield is active
 
     # Shutdown logic
+    background_tasks = [app.jobs_task, app.foryou_task, app.revoked_tokens_task]
+    for task in background_tasks:
+        task.cancel()
+    # Wait for them to stop before closing the client they use
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await app.mailer.stop()
     app.mongodb_client.close()
 
-app = FastAPI(lifespan=app_lifespan)
+app = FastAPI(lifespan=app_lifespan, default_response_class=FastJSONResponse)
 
 # Allow all origins for development purposes, to be able to use
 # the local / deployed backend either with a local or deployed frontend.
@@ -43,8 +90,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-User-DB-Calls", "X-Total-Count"],
 )
 
+# Report the number of user queries each request needed
+app.middleware("http")(user_loader_metrics)
+
 app.include_router(user_router.router, tags=["users"], prefix="/user")
 app.include_router(recipe_router.router, tags=["recipes"], prefix="/recipe")
 app.include_router(review_router.router, tags=["reviews"], prefix="/review")
@@ -0,0 +1,95 @@
+"""
+JSON response benchmark.
+
+Renders lists of realistic recipe documents the way FastAPI does by default
+(jsonable_encoder, then the standard json module) and with FastJSONResponse,
+both after jsonable_encoder, as routes that return plain values get it, and
+directly, as the list handlers return it. Also compares jsonable_encoder and
+to_document for the models stored on insert.
+
+    python app/benchmarks/json_benchmark.py --recipes 100 --repeat 200
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import argparse
+import random
+import time
+import uuid
+import warnings
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models.recipe_model import RecipeModel
+from app.utils import responses
+from app.utils.responses import FastJSONResponse, to_document
+
+# Model ids are generated as UUIDs for str fields, as in the routers
+warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
+
+INGREDIENTS = ["tomato", "garlic", "olive oil", "onion", "pasta", "basil", "salt", "pepper", "rice", "chicken", "lemon", "flour"]
+
+
+def recipe_model(rng: random.Random) -> RecipeModel:
+    created = datetime(2024, 1, 1) + timedelta(minutes=rng.randrange(500000))
+    return RecipeModel(
+        name=f"Recipe {rng.randrange(10000)}",
+        ingredients=[
+            {"name": name, "quantity": rng.randrange(1, 500), "unit": rng.choice(["g", "ml", "count"])}
+            for name in rng.sample(INGREDIENTS, rng.randrange(4, 10))
+        ],
+        instructions=[{"body": "Mix everything and cook it slowly until it is done. " * 3, "step_number": i} for i in range(rng.randrange(3, 9))],
+        cooking_time=rng.randrange(5, 120),
+        difficulty=rng.randrange(1, 5),
+        main_image=f"https://storage.googleapis.com/kasula/{uuid.UUID(int=rng.getrandbits(128))}.jpg",
+        images=[f"https://storage.googleapis.com/kasula/{uuid.UUID(int=rng.getrandbits(128))}.jpg" for _ in range(rng.randrange(3))],
+        username=f"user{rng.randrange(1000)}",
+        user_id=str(uuid.UUID(int=rng.getrandbits(128))),
+        creation_date=created,
+        updated_at=created,
+        average_rating=round(rng.uniform(1, 5), 1),
+        history="A family recipe.",
+    )
+
+
+def time_per_call(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(count: int, repeat: int):
+    rng = random.Random(42)
+    models = [recipe_model(rng) for _ in range(count)]
+    # Documents as Motor returns them: stored JSON safe, except updated_at, which updates set as a date
+    documents = []
+    for model in models:
+        document = to_document(model)
+        document["updated_at"] = model.updated_at
+        documents.append(document)
+
+    paths = {
+        "default (jsonable_encoder + json)": lambda: JSONResponse(jsonable_encoder(documents)),
+        "jsonable_encoder + FastJSONResponse": lambda: FastJSONResponse(jsonable_encoder(documents)),
+        "FastJSONResponse": lambda: FastJSONResponse(documents),
+    }
+
+    print(f"{count} recipes, {len(JSONResponse(jsonable_encoder(documents)).body) / 1024:.0f} KiB, serializer: {'orjson' if responses.orjson else 'json'}")
+    print(f"{'path':>38} {'ms/response':>12}")
+    for name, function in paths.items():
+        print(f"{name:>38} {time_per_call(function, repeat) * 1000:>12.3f}")
+
+    print(f"\n{'model to document':>38} {'us/model':>12}")
+    for name, function in (("jsonable_encoder", jsonable_encoder), ("to_document", to_document)):
+        print(f"{name:>38} {time_per_call(lambda: [function(model) for model in models], repeat) / count * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the JSON response paths on recipe lists")
+    parser.add_argument("--recipes", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    main(args.recipes, args.repeat)
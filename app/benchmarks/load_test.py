@@ -0,0 +1,396 @@
+"""
+HTTP API load test.
+
+Seeds a reproducible data set through the API (users, recipes, follows and
+reviews), then runs concurrent scripted user journeys against it: log in, then
+repeatedly read a feed from /recipe/magic, open a recipe and its reviews, and
+sometimes review it, like a review or follow someone. Reports the p50, p95 and
+p99 latency and the requests per second of every endpoint.
+
+The app runs in process, either on mongomock or on a local mongod. The mongod
+backend runs the real app in test mode, which drops the collections of the
+--db-name database on startup, so point it at a database meant for benchmarks.
+It connects to localhost unless --db-url is given, and refuses any other host
+without --allow-remote.
+
+Results can be saved as a baseline and later runs compared against it. A run
+fails when a percentile of an endpoint with enough samples, the median by
+default, grows past the threshold, or when an endpoint has more failed
+requests than in the baseline. Tail percentiles of an in-process run mostly
+measure queueing behind other requests and vary a lot between runs on a busy
+machine, so compare them (--metric p95) on a quiet one.
+
+    python app/benchmarks/load_test.py --save-baseline
+    python app/benchmarks/load_test.py --compare
+    python app/benchmarks/load_test.py --backend mongod --compare
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+import httpx
+
+from app.config import settings
+
+BASELINES_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+PASSWORD = "benchmarkpassword"
+
+INGREDIENTS = ["tomato", "garlic", "olive oil", "onion", "pasta", "basil", "salt", "pepper", "rice", "chicken", "lemon", "flour",
+               "butter", "egg", "milk", "sugar", "potato", "carrot", "beef", "cheese"]
+UNITS = ["g", "ml", "count", "tbsp", "cup"]
+COMMENTS = ["Delicious!", "Too salty for me.", "My kids loved it.", "Easy and quick.", None]
+
+# Hosts --db-url may point to without --allow-remote
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+# Probabilities of the optional steps of a journey
+REVIEW_RATE = 0.2
+LIKE_RATE = 0.3
+FOLLOW_RATE = 0.1
+NEXT_PAGE_RATE = 0.3
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+class Recorder:
+    """Time every request of a run, grouped by endpoint."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+        return response
+
+    def results(self, elapsed: float) -> dict:
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            endpoints[endpoint] = {
+                "count": len(latencies),
+                "errors": self.errors[endpoint],
+                "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+                "rps": round(len(latencies) / elapsed, 1),
+            }
+        requests = sum(len(latencies) for latencies in self.latencies.values())
+        return {"elapsed_s": round(elapsed, 3), "requests": requests, "rps": round(requests / elapsed, 1), "endpoints": endpoints}
+
+
+def generate_dataset(rng: random.Random, users: int, recipes: int, follows: int, reviews: int) -> dict:
+    """Build the users, recipes, follow edges and reviews to seed, deterministically for a seed."""
+    usernames = [f"loaduser{i}" for i in range(users)]
+
+    recipe_documents = []
+    for i in range(recipes):
+        recipe_documents.append((rng.choice(usernames), {
+            "name": f"Load recipe {i}",
+            "ingredients": [
+                {"name": name, "quantity": rng.randrange(1, 500), "unit": rng.choice(UNITS)}
+                for name in rng.sample(INGREDIENTS, rng.randrange(3, 9))
+            ],
+            "instructions": [{"body": "Mix everything and cook it until it is done.", "step_number": step} for step in range(rng.randrange(2, 7))],
+            "cooking_time": rng.randrange(5, 120),
+            "difficulty": rng.randrange(1, 5),
+            "energy": rng.randrange(100, 900),
+        }))
+
+    # Popularity is skewed, as in a real network a few accounts get most followers
+    weights = [1 / (rank + 1) for rank in range(users)]
+    follow_edges = set()
+    for follower in usernames:
+        target = min(follows, users - 1)
+        followed = set()
+        while len(followed) < target:
+            followee = rng.choices(usernames, weights)[0]
+            if followee != follower:
+                followed.add(followee)
+        follow_edges.update((follower, followee) for followee in followed)
+
+    review_pairs = set()
+    while len(review_pairs) < min(reviews, recipes * (users - 1)):
+        username = rng.choice(usernames)
+        recipe_index = rng.randrange(recipes)
+        if recipe_documents[recipe_index][0] != username:
+            review_pairs.add((username, recipe_index))
+
+    return {
+        "usernames": usernames,
+        "recipes": recipe_documents,
+        "follows": sorted(follow_edges),
+        "reviews": sorted(review_pairs),
+    }
+
+
+def review_form(rng: random.Random) -> dict:
+    review = {"rating": rng.randrange(10, 51) / 10, "comment": rng.choice(COMMENTS)}
+    return {"review": (None, json.dumps(review), "application/json")}
+
+
+async def seed(client: httpx.AsyncClient, dataset: dict, rng: random.Random, concurrency: int) -> dict:
+    """Create the data set through the API and return the state the journeys start from."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(method: str, url: str, **kwargs) -> httpx.Response:
+        async with semaphore:
+            response = await client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def register(username: str):
+        response = await call("POST", "/user/", json={"username": username, "email": f"{username}@example.com", "password": PASSWORD})
+        user_id = response.json()["_id"]
+        response = await call("POST", "/user/token", data={"username": username, "password": PASSWORD})
+        return username, {"id": user_id, "headers": {"Authorization": f"Bearer {response.json()['access_token']}"}}
+
+    users = dict(await asyncio.gather(*(register(username) for username in dataset["usernames"])))
+
+    async def post_recipe(username: str, recipe: dict):
+        response = await call("POST", "/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=users[username]["headers"])
+        return response.json()["_id"]
+
+    # Follows go before the recipes, so new recipes are fanned out to the timelines
+    await asyncio.gather(*(
+        call("POST", f"/user/follow/{followee}", headers=users[follower]["headers"])
+        for follower, followee in dataset["follows"]
+    ))
+    recipe_ids = await asyncio.gather(*(post_recipe(username, recipe) for username, recipe in dataset["recipes"]))
+
+    forms = [review_form(rng) for _ in dataset["reviews"]]
+    await asyncio.gather(*(
+        call("POST", f"/review/{recipe_ids[recipe_index]}", files=form, headers=users[username]["headers"])
+        for (username, recipe_index), form in zip(dataset["reviews"], forms)
+    ))
+
+    followed = defaultdict(set)
+    for follower, followee in dataset["follows"]:
+        followed[follower].add(followee)
+    reviewed = defaultdict(set)
+    for username, recipe_index in dataset["reviews"]:
+        reviewed[username].add(recipe_ids[recipe_index])
+
+    return {"users": users, "recipe_ids": recipe_ids, "followed": followed, "reviewed": reviewed}
+
+
+async def journey(recorder: Recorder, state: dict, username: str, rng: random.Random, iterations: int):
+    """Log in, then browse: a feed, a recipe and its reviews, with an occasional review, like or follow."""
+    response = await recorder.request("POST /user/token", "POST", "/user/token", data={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    user_id = state["users"][username]["id"]
+    followed, reviewed = state["followed"][username], state["reviewed"][username]
+
+    for _ in range(iterations):
+        feed_type = rng.choice(["following", "foryou"])
+        endpoint = f"GET /recipe/magic?feedType={feed_type}"
+        params = {"feedType": feed_type, "cursor": "", "size": 10, "view": "card"}
+        page = (await recorder.request(endpoint, "GET", "/recipe/magic", params=params, headers=headers)).json()
+        recipes = page.get("recipes", [])
+        if page.get("next_cursor") and rng.random() < NEXT_PAGE_RATE:
+            page = (await recorder.request(endpoint, "GET", "/recipe/magic", params={**params, "cursor": page["next_cursor"]}, headers=headers)).json()
+            recipes += page.get("recipes", [])
+
+        recipe_id = rng.choice(recipes)["_id"] if recipes else rng.choice(state["recipe_ids"])
+        recipe = (await recorder.request("GET /recipe/{id}", "GET", f"/recipe/{recipe_id}", headers=headers)).json()
+        reviews = (await recorder.request("GET /review/magic/{recipe_id}", "GET", f"/review/magic/{recipe_id}", params={"sort_by": "likes"}, headers=headers)).json()
+
+        if recipe.get("user_id") != user_id and recipe_id not in reviewed and rng.random() < REVIEW_RATE:
+            await recorder.request("POST /review/{recipe_id}", "POST", f"/review/{recipe_id}", files=review_form(rng), headers=headers)
+            reviewed.add(recipe_id)
+
+        likeable = [review for review in reviews if review["user_id"] != user_id and user_id not in review["liked_by"]]
+        if likeable and rng.random() < LIKE_RATE:
+            review = rng.choice(likeable)
+            await recorder.request("PATCH /review/like/{recipe_id}/{review_id}", "PATCH", f"/review/like/{recipe_id}/{review['_id']}", headers=headers)
+
+        candidates = [other for other in state["users"] if other != username and other not in followed]
+        if candidates and rng.random() < FOLLOW_RATE:
+            followee = rng.choice(candidates)
+            await recorder.request("POST /user/follow/{username}", "POST", f"/user/follow/{followee}", headers=headers)
+            followed.add(followee)
+
+
+class CollectionCache:
+    """Database wrapper handing out one collection object per name.
+
+    mongomock_motor wraps the internals of a collection again every time the
+    collection is looked up, so under sustained load every query goes through
+    more wrappers and eventually exceeds the recursion limit. Looking each
+    collection up once keeps the wrappers to the few made on startup.
+    """
+
+    def __init__(self, database):
+        self._database = database
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = self._database[name]
+        return self._collections[name]
+
+    def get_collection(self, name):
+        return self[name]
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+def is_local_url(db_url: str) -> bool:
+    """Whether every host of a MongoDB connection string is the local machine."""
+    if not db_url.startswith("mongodb://"):
+        return False
+    hosts = db_url[len("mongodb://"):].split("/", 1)[0].split("?", 1)[0].rsplit("@", 1)[-1]
+    for host in hosts.split(","):
+        name = host[1:host.find("]")] if host.startswith("[") else host.split(":", 1)[0]
+        if name not in LOCAL_HOSTS:
+            return False
+    return True
+
+
+async def run(args) -> dict:
+    if args.backend == "mongod":
+        # The real app, on the test database it clears on startup
+        settings.TEST_ENV = True
+        settings.DB_URL = args.db_url
+        settings.DB_TEST = args.db_name
+        settings.STORAGE_BACKEND = "local"
+        settings.MAIL_BACKEND = "sink"
+        from app.app_definition import app
+    else:
+        from app.test_app import unit_tests as app
+    settings.BCRYPT_ROUNDS = args.bcrypt_rounds
+
+    rng = random.Random(args.seed)
+    dataset = generate_dataset(rng, args.users, args.recipes, args.follows, args.reviews)
+
+    async with app.router.lifespan_context(app):
+        if args.backend == "mongomock":
+            app.mongodb = CollectionCache(app.mongodb)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            start = time.perf_counter()
+            state = await seed(client, dataset, rng, args.concurrency)
+            # Rank the seeded recipes now instead of waiting for the periodic refresh
+            await app.foryou.refresh(app.mongodb)
+            print(f"Seeded {args.users} users, {args.recipes} recipes, {len(dataset['follows'])} follows "
+                  f"and {len(dataset['reviews'])} reviews in {time.perf_counter() - start:.1f} s")
+
+            recorder = Recorder(client)
+            journeys = [
+                journey(recorder, state, username, random.Random(f"{args.seed}:{username}"), args.iterations)
+                for username in dataset["usernames"][:args.concurrency]
+            ]
+            start = time.perf_counter()
+            await asyncio.gather(*journeys)
+            results = recorder.results(time.perf_counter() - start)
+
+    results["config"] = {
+        option: getattr(args, option)
+        for option in ("backend", "users", "recipes", "follows", "reviews", "concurrency", "iterations", "seed", "bcrypt_rounds")
+    }
+    return results
+
+
+def print_results(results: dict):
+    print(f"\n{'endpoint':<44} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+    for endpoint, stats in results["endpoints"].items():
+        print(f"{endpoint:<44} {stats['count']:>6} {stats['errors']:>6} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['rps']:>8.1f}")
+    print(f"{'total':<44} {results['requests']:>6} {'':>6} {'':>8} {'':>8} {'':>8} {results['rps']:>8.1f}")
+
+
+def compare(results: dict, baseline: dict, metric: str, threshold: float, min_delta_ms: float, min_samples: int) -> List[str]:
+    """Return the regressions of a run against a baseline, judged on one percentile."""
+    if baseline.get("config") != results["config"]:
+        print("\nWarning: the baseline was recorded with other options, latencies may not be comparable")
+
+    key = f"{metric}_ms"
+    regressions = []
+    print(f"\n{'endpoint':<44} {'base ' + metric:>9} {metric:>9} {'change':>8}")
+    for endpoint, stats in results["endpoints"].items():
+        base = baseline["endpoints"].get(endpoint)
+        if base is None:
+            print(f"{endpoint:<44} {'-':>9} {stats[key]:>9.1f} {'new':>8}")
+            continue
+        change = stats[key] / base[key] - 1 if base[key] else 0.0
+        print(f"{endpoint:<44} {base[key]:>9.1f} {stats[key]:>9.1f} {change:>+8.0%}")
+        # Percentiles of rarely called endpoints and small differences on fast ones are noise
+        if stats["count"] >= min_samples and change > threshold and stats[key] - base[key] > min_delta_ms:
+            regressions.append(f"{endpoint}: {metric} {base[key]:.1f} ms -> {stats[key]:.1f} ms ({change:+.0%})")
+        if stats["errors"] > base["errors"]:
+            regressions.append(f"{endpoint}: {base['errors']} -> {stats['errors']} failed requests")
+    return regressions
+
+
+def main(args) -> int:
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    baseline_path = args.baseline or os.path.join(BASELINES_DIR, f"{args.backend}.json")
+    status = 0
+    if args.compare:
+        with open(baseline_path) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.metric, args.threshold, args.min_delta, args.min_samples)
+        if regressions:
+            print("\nRegressions against " + baseline_path + ":\n  " + "\n  ".join(regressions))
+            status = 1
+        else:
+            print("\nNo regressions against " + baseline_path)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"\nSaved the baseline to {baseline_path}")
+
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["mongomock", "mongod"], default="mongomock")
+    parser.add_argument("--db-url", default="mongodb://localhost:27017", help="mongod backend only")
+    parser.add_argument("--allow-remote", action="store_true", help="Allow a --db-url that is not on this machine")
+    parser.add_argument("--db-name", default="kasula_benchmark", help="mongod backend only, its collections are dropped")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--recipes", type=int, default=300)
+    parser.add_argument("--follows", type=int, default=8, help="Users each seeded user follows")
+    parser.add_argument("--reviews", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=4, help="Users browsing at once, at most --users")
+    parser.add_argument("--iterations", type=int, default=50, help="Journeys of each browsing user after logging in")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(settings.BCRYPT_ROUNDS))
+    parser.add_argument("--baseline", help="Baseline file, baselines/<backend>.json by default")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare the results with the baseline, failing on regressions")
+    parser.add_argument("--metric", choices=["p50", "p95", "p99"], default="p50", help="Percentile compared with the baseline")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Allowed relative growth of the compared percentile")
+    parser.add_argument("--min-delta", type=float, default=2.0, help="Growth of the compared percentile always allowed, in ms")
+    parser.add_argument("--min-samples", type=int, default=50, help="Requests an endpoint needs to be compared")
+    args = parser.parse_args()
+    if args.concurrency > args.users:
+        parser.error("--concurrency cannot exceed --users")
+    if args.backend == "mongod" and not args.allow_remote and not is_local_url(args.db_url):
+        parser.error("--db-url is not on this machine and the collections of --db-name would be dropped there, pass --allow-remote to use it anyway")
+
+    sys.exit(main(args))
@@ -0,0 +1,72 @@
+"""
+Login throughput benchmark.
+
+Runs concurrent POST /user/token requests against the mongomock backed test
+app and reports logins per second and the worst event loop stall observed
+while they ran. A stall close to the duration of a bcrypt check means password
+hashing is blocking the loop; with hashing offloaded it stays near zero and
+throughput grows with HASH_WORKERS.
+
+    python app/benchmarks/login_benchmark.py --logins 64 --concurrency 1 8 32
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import argparse
+import asyncio
+import time
+import httpx
+
+from app.config import settings
+from app.test_app import unit_tests
+
+USER = {"username": "benchmark", "email": "benchmark@example.com", "password": "benchmarkpassword"}
+
+
+async def monitor_loop(interval: float, stalls: list):
+    """Record how late the loop wakes up a sleeping task, i.e. how long it was blocked."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def run_logins(client: httpx.AsyncClient, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            response = await client.post("/user/token", data={"username": USER["username"], "password": USER["password"]})
+            response.raise_for_status()
+
+    stalls = []
+    monitor = asyncio.create_task(monitor_loop(0.001, stalls))
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+
+    return logins / elapsed, max(stalls, default=0.0)
+
+
+async def main(logins: int, concurrency_levels: list):
+    async with unit_tests.router.lifespan_context(unit_tests):
+        transport = httpx.ASGITransport(app=unit_tests)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            (await client.post("/user/", json=USER)).raise_for_status()
+
+            print(f"bcrypt rounds: {settings.BCRYPT_ROUNDS}, hash workers: {settings.HASH_WORKERS}")
+            print(f"{'concurrency':>12} {'logins/s':>10} {'max loop stall (ms)':>20}")
+            for concurrency in concurrency_levels:
+                throughput, stall = await run_logins(client, logins, concurrency)
+                print(f"{concurrency:>12} {throughput:>10.1f} {stall * 1000:>20.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64, help="Logins per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    asyncio.run(main(args.logins, args.concurrency))
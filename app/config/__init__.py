@@ -29,7 +29,44 @@ class DatabaseSettings(BaseSettings):
     TEST_ENV: bool = bool(os.getenv("TEST_ENV", False))
 
 
-class Settings(CommonSettings, ServerSettings, DatabaseSettings):
+class StorageSettings(BaseSettings):
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "gcs")  # "gcs" or "local"
+    STORAGE_PROJECT: str = os.getenv("STORAGE_PROJECT", "kasula")
+    STORAGE_BUCKET: str = os.getenv("STORAGE_BUCKET", "bucket-kasula_images")
+    STORAGE_LOCAL_DIR: str = os.getenv("STORAGE_LOCAL_DIR", "uploads")
+    STORAGE_LOCAL_URL: str = os.getenv("STORAGE_LOCAL_URL", "/uploads")
+    MAX_UPLOAD_BYTES: int = os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024)
+    UPLOAD_CONCURRENCY: int = os.getenv("UPLOAD_CONCURRENCY", 4)  # Parallel uploads per request
+
+
+class SecuritySettings(BaseSettings):
+    BCRYPT_ROUNDS: int = os.getenv("BCRYPT_ROUNDS", 12)  # Work factor of new password hashes
+    HASH_WORKERS: int = os.getenv("HASH_WORKERS", 4)  # Threads hashing and verifying passwords
+    TOKEN_CACHE_SIZE: int = os.getenv("TOKEN_CACHE_SIZE", 10000)  # Verified tokens kept in memory
+    TOKEN_CACHE_TTL: int = os.getenv("TOKEN_CACHE_TTL", 3600)  # Seconds, never beyond the token's exp
+    REVOKED_TOKENS_REFRESH: float = os.getenv("REVOKED_TOKENS_REFRESH", 30)  # Seconds between reloads of the revoked tokens
+
+
+class CacheSettings(BaseSettings):
+    COUNT_CACHE_SIZE: int = os.getenv("COUNT_CACHE_SIZE", 1024)  # Cached totals of paginated queries
+    COUNT_CACHE_TTL: int = os.getenv("COUNT_CACHE_TTL", 30)  # Seconds a cached total can be stale
+    REVIEW_PAGE_CACHE_SIZE: int = os.getenv("REVIEW_PAGE_CACHE_SIZE", 2048)  # Cached first pages of review lists
+    REVIEW_PAGE_CACHE_TTL: int = os.getenv("REVIEW_PAGE_CACHE_TTL", 300)  # Seconds, pages are also keyed by reviews_version
+
+
+class MailSettings(BaseSettings):
+    MAIL_BACKEND: str = os.getenv("MAIL_BACKEND", "smtp")  # "smtp" or "sink"
+    SMTP_HOST: str = os.getenv("SMTP_HOST", "smtp.gmail.com")
+    SMTP_PORT: int = os.getenv("SMTP_PORT", 465)  # SMTP over SSL
+    EMAIL_USER: str | None = os.getenv("EMAIL_USER")
+    EMAIL_PASS: str | None = os.getenv("EMAIL_PASS")
+    MAIL_WORKERS: int = os.getenv("MAIL_WORKERS", 2)
+    MAIL_QUEUE_SIZE: int = os.getenv("MAIL_QUEUE_SIZE", 1000)
+    MAIL_MAX_RETRIES: int = os.getenv("MAIL_MAX_RETRIES", 3)
+    MAIL_RETRY_BACKOFF: float = os.getenv("MAIL_RETRY_BACKOFF", 1.0)  # Seconds, doubled on every retry
+
+
+class Settings(CommonSettings, ServerSettings, DatabaseSettings, StorageSettings, SecuritySettings, CacheSettings, MailSettings):
     pass
 
 
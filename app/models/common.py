@@ -1,3 +1,17 @@
-from typing import Optional
+from typing import List, Optional
 import uuid
-from pydantic import BaseModel, Field
\ No newline at end of file
+from pydantic import BaseModel, Field
+
+# Most ids a batch read endpoint accepts in one request
+MAX_BATCH_SIZE = 100
+
+
+class BatchModel(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "ids": ["00010203-0405-0607-0809-0a0b0c0d0e0f", "10111213-1415-1617-1819-1a1b1c1d1e1f"]
+            }
+        }
@@ -1,7 +1,6 @@
 from .common import *
 from .ingredient_model import RecipeIngredient
 from .instruction_model import InstructionModel
-from .review_model import ReviewModel
 from typing import List
 from datetime import datetime
 from pydantic import BaseModel, Field
@@ -21,8 +20,9 @@ class RecipeModel(BaseModel):
     user_id: str = Field(None)
     creation_date: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
-    reviews: List[ReviewModel] = Field(default_factory=list)
     average_rating: Optional[float] = Field(None)
+    rating_sum: float = Field(default=0.0)
+    rating_count: int = Field(default=0)
     history: Optional[str] = Field(None, description="Personal note or history of the recipe")
     is_public: bool = Field(default=True)
 
@@ -57,6 +57,22 @@ class RecipeModel(BaseModel):
         }
 
 
+# Fields returned by the card view of the recipe listing endpoints
+RECIPE_CARD_FIELDS = [
+    "id", "name", "main_image", "average_rating", "rating_count", "cooking_time",
+    "difficulty", "creation_date", "username", "user_id", "is_public",
+]
+
+RECIPE_CARD_PROJECTION = {RecipeModel.model_fields[field].alias or field: 1 for field in RECIPE_CARD_FIELDS}
+
+
+def recipe_projection(view: str, *extra_fields: str) -> Optional[dict]:
+    """Return the projection of a recipe listing view, or None for full documents."""
+    if view != "card":
+        return None
+    return {**RECIPE_CARD_PROJECTION, **{field: 1 for field in extra_fields if field}}
+
+
 class UpdateRecipeModel(BaseModel):
     name: Optional[str] = Field(None, max_length=50)
     ingredients: Optional[List[RecipeIngredient]] = Field(None)
@@ -14,6 +14,7 @@ class ReviewModel(BaseModel):
     likes: int = Field(default=0)
     liked_by: List[str] = Field(default_factory=list)
     user_id: str = Field(None)
+    recipe_id: Optional[str] = Field(None)
 
     @validator('rating')
     def validate_rating(cls, v):
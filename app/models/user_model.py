@@ -13,8 +13,8 @@ class UserModel(BaseModel):
     password: str = Field(...)
     profile_picture: Optional[str] = Field(None)
     bio: Optional[str] = Field(None)
-    followers: List[str] = Field(default_factory=list)
-    following: List[str] = Field(default_factory=list)
+    follower_count: int = Field(default=0)
+    following_count: int = Field(default=0)
     joining_date: datetime = Field(default_factory=datetime.utcnow)
     is_private: bool = Field(default=False)
 
@@ -32,6 +32,10 @@ class UserModel(BaseModel):
         }
 
 
+# Public fields of a user returned in user lists, such as followers
+USER_SUMMARY_FIELDS = ["_id", "username", "profile_picture", "bio"]
+
+
 class UpdateUserModel(BaseModel):
     username: Optional[str] = Field(None)
     email: Optional[str] = Field(None)
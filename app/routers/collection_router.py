@@ -1,6 +1,9 @@
 from .common import *
 from app.models.collection_model import CollectionModel, UpdateCollectionModel
 from app.models.user_model import UserModel
+from app.models.recipe_model import recipe_projection
+from app.utils.pagination import encode_cursor, decode_cursor
+from fastapi import Query
 from typing import Optional, Dict
 
 router = APIRouter()
@@ -9,21 +12,21 @@ def get_database(request: Request):
     return request.app.mongodb
 
 @router.post("/", response_description="Create a new collection")
-async def create_collection(collection: CollectionModel = Body(...), current_user: UserModel = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database)):
+async def create_collection(collection: CollectionModel = Body(...), current_user: UserModel = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database), users: UserLoader = Depends(get_user_loader)):
     collection.user_id = str(current_user["user_id"])
 
     # Retrieve the current user from the database
-    user = await db["users"].find_one({"_id": current_user["user_id"]})
+    user = await users.load(current_user["user_id"])
 
     collection.username = user["username"]
 
     # Check if the user already has a collection with the same name
-    existing_collection = await db["collections"].find_one({"username": collection.username, "name": collection.name})
+    existing_collection = await db["collections"].find_one({"user_id": collection.user_id, "name": collection.name})
     
     if existing_collection:
         raise HTTPException(status_code=400, detail="A collection with the same name already exists for this user")
 
-    new_collection = await db["collections"].insert_one(jsonable_encoder(collection))
+    new_collection = await db["collections"].insert_one(to_document(collection))
     created_collection = await db["collections"].find_one({"_id": new_collection.inserted_id})
     return JSONResponse(status_code=status.HTTP_201_CREATED, content=created_collection)
 
@@ -45,7 +48,7 @@ async def update_collection(collection_id: str, update_data: UpdateCollectionMod
     collection = await db["collections"].find_one({"_id": collection_id})
     if collection and collection["user_id"] == str(current_user["user_id"]):
         if "name" in update_data.dict():
-            existing_collection = await db["collections"].find_one({"username": collection["username"], "name": update_data.name})
+            existing_collection = await db["collections"].find_one({"user_id": collection["user_id"], "name": update_data.name})
             if existing_collection:
                 raise HTTPException(status_code=400, detail="A collection with the same name already exists for this user")
         await db["collections"].update_one({"_id": collection_id}, {"$set": update_data.dict(exclude_unset=True)})
@@ -75,73 +78,111 @@ async def remove_recipe_from_collection(collection_id: str, recipe_id: str, curr
         raise HTTPException(status_code=404, detail="Collection not found or access denied")
 
 @router.get("/user/{username}", response_description="List all collections of a user")
-async def list_collections_by_user(username: str, db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
-    # Current user
-    actual_user = current_user["username"] if current_user else None
-    
+async def list_collections_by_user(username: str, db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user), users: UserLoader = Depends(get_user_loader)):
     # Retrieve the user from the database
-    user = await db["users"].find_one({"username": username})
+    user = await users.load_by_username(username)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+
+    # The owner is recognized by id, the token's username claim is stale after a rename
+    is_owner = current_user is not None and current_user["user_id"] == user["_id"]
     
-    if not user.get("is_private", False) or actual_user == username or (actual_user and actual_user in user.get("followers", [])):
-        collections = await db["collections"].find({"username": username}).to_list(None)
+    if not user.get("is_private", False) or is_owner or (current_user and await is_following(db, current_user["user_id"], user["_id"])):
+        collections = await db["collections"].find({"user_id": user["_id"]}).to_list(None)
         return collections
     else:
         raise HTTPException(status_code=403, detail="User is not public")
     
-@router.get("/{collection_id}/recipes", response_description="List all recipes in a collection")
-async def list_recipes_in_collection(collection_id: str, db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
-    # Current user
-    actual_user = current_user["username"] if current_user else None
-
+@router.get("/{collection_id}/recipes", response_description="List the recipes in a collection, in the collection's order")
+async def list_recipes_in_collection(
+    collection_id: str,
+    view: str = Query("full", regex="^(card|full)$"),
+    size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,  # Pagination token, empty for the first page
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: Optional[Dict[str, str]] = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader)
+):
     collection = await db["collections"].find_one({"_id": collection_id})
 
     if not collection:
         raise HTTPException(status_code=404, detail="Collection not found")
 
     # Get the user that owns the collection
-    user = await db["users"].find_one({"username": collection["username"]})
+    user = await users.load(collection["user_id"])
 
-    # Check if the user creator of the collection is public
-    if not user.get("is_private", False):
-        recipes = await db["recipes"].find({"_id": {"$in": collection["recipe_ids"]}}).to_list(None)
-        return recipes
-    else:
-        # Check if the current user is following the user
-        if actual_user and actual_user in user.get("followers", []):
-            recipes = await db["recipes"].find({"_id": {"$in": collection["recipe_ids"]}}).to_list(None)
-            return recipes
-        else:
+    # Collections of private users are only visible to their followers
+    if user.get("is_private", False):
+        if not (current_user and await is_following(db, current_user["user_id"], user["_id"])):
             raise HTTPException(status_code=403, detail="Access denied")
+
+    recipes, next_cursor = await collection_recipes_page(db, collection, size, cursor, view)
+
+    # Without a cursor only the first page is returned, as a plain list
+    if cursor is None:
+        return FastJSONResponse(recipes)
+    return FastJSONResponse({"recipes": recipes, "next_cursor": next_cursor})
+
+async def collection_recipes_page(db, collection: dict, size: int, cursor: Optional[str], view: str):
+    """Load one page of the recipes of a collection, in the order of recipe_ids, and the cursor of the next page.
+
+    Only the recipes of the page are read. Ids of recipes that no longer exist
+    are skipped, and removed from the collection as they are found.
+    """
+    recipe_ids = collection.get("recipe_ids") or []
+
+    position = 0
+    if cursor:
+        state = decode_cursor(cursor)
+        if not isinstance(state.get("index"), int) or "id" not in state:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        # Recipes removed before the cursor shift it, so it is found by id if it moved
+        if 0 <= state["index"] < len(recipe_ids) and recipe_ids[state["index"]] == state["id"]:
+            position = state["index"] + 1
+        elif state["id"] in recipe_ids:
+            position = recipe_ids.index(state["id"]) + 1
+        else:
+            position = min(max(state["index"], 0), len(recipe_ids))
+
+    recipes, missing = [], []
+    while len(recipes) < size and position < len(recipe_ids):
+        chunk = recipe_ids[position:position + size - len(recipes)]
+        found = {doc["_id"]: doc for doc in await db["recipes"].find({"_id": {"$in": chunk}}, recipe_projection(view)).to_list(None)}
+        for recipe_id in chunk:
+            if recipe_id in found:
+                recipes.append(found[recipe_id])
+            else:
+                missing.append(recipe_id)
+        position += len(chunk)
+
+    if missing:
+        await db["collections"].update_one({"_id": collection["_id"]}, {"$pull": {"recipe_ids": {"$in": missing}}})
+
+    # A full page always ends with a recipe that was found
+    next_cursor = None
+    if position < len(recipe_ids):
+        next_cursor = encode_cursor({"index": position - 1, "id": recipe_ids[position - 1]})
+
+    return recipes, next_cursor
         
 @router.get("/favorites/{username}", response_description="Get the favorites collection of a user")
 async def get_favorites_collection(username: str, db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
-    # Current user
-    username = current_user["username"] if current_user else None
-
-    if username:
-        user = await db["users"].find_one({"username": username})
-
-        if current_user["user_id"] == user["_id"]:
-            if user:
-                collection = await db["collections"].find_one({"username": username, "favorite": True})
-                if collection:
-                    return collection
-                else:
-                    raise HTTPException(status_code=404, detail="Favorites collection not found")
-            else:
-                raise HTTPException(status_code=404, detail="User not found")
-        else:
-            raise HTTPException(status_code=403, detail="Access denied")
-        
-    else:
+    if not current_user:
         raise HTTPException(status_code=403, detail="Access denied")
 
+    # Only the current user's favorites are returned, looked up by id as the
+    # token's username claim is stale after a rename
+    collection = await db["collections"].find_one({"user_id": current_user["user_id"], "favorite": True})
+    if collection:
+        return collection
+    else:
+        raise HTTPException(status_code=404, detail="Favorites collection not found")
+
 @router.patch("/favorites/add_recipe/{recipe_id}", response_description="Add a recipe to the favorites collection of the current user")
 async def add_recipe_to_favorites(recipe_id: str, current_user: UserModel = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database)):
-    collection = await db["collections"].find_one({"username": current_user["username"], "favorite": True})
+    collection = await db["collections"].find_one({"user_id": current_user["user_id"], "favorite": True})
     if collection:
         await db["collections"].update_one({"_id": collection["_id"]}, {"$addToSet": {"recipe_ids": recipe_id}})
         updated_collection = await db["collections"].find_one({"_id": collection["_id"]})
@@ -151,7 +192,7 @@ async def add_recipe_to_favorites(recipe_id: str, current_user: UserModel = Depe
 
 @router.patch("/favorites/remove_recipe/{recipe_id}", response_description="Remove a recipe from the favorites collection of the current user")
 async def remove_recipe_from_favorites(recipe_id: str, current_user: UserModel = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database)):
-    collection = await db["collections"].find_one({"username": current_user["username"], "favorite": True})
+    collection = await db["collections"].find_one({"user_id": current_user["user_id"], "favorite": True})
     if collection:
         await db["collections"].update_one({"_id": collection["_id"]}, {"$pull": {"recipe_ids": recipe_id}})
         updated_collection = await db["collections"].find_one({"_id": collection["_id"]})
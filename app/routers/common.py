@@ -1,8 +1,15 @@
 from fastapi import APIRouter, Body, Request, HTTPException, status, Depends
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
-from app.utils.security import hash_password, verify_password
+from app.utils.security import hash_password_async, verify_password_async, verify_and_update
 from app.utils.token import get_current_user
+from app.utils.loaders import UserLoader, get_user_loader
+from app.utils.storage import ImageStorage, get_storage
+from app.utils.similarity import SimilarityIndex, get_similarity
+from app.utils.foryou import ForYouPool, get_foryou
+from app.utils.mail import MailQueue, get_mailer
+from app.utils.follows import is_following, followed_among, following_ids
+from app.utils.responses import FastJSONResponse, to_document
 from motor.motor_asyncio import AsyncIOMotorClient
 import warnings
 import re
@@ -1,36 +1,35 @@
-import random
+import asyncio
 from .common import *
 from app.models.ingredient_model import RecipeIngredient
 from app.models.instruction_model import InstructionModel
-from app.models.recipe_model import RecipeModel, UpdateRecipeModel
+from app.models.common import BatchModel
+from app.models.recipe_model import RecipeModel, UpdateRecipeModel, recipe_projection
 from app.models.user_model import UserModel
-from fastapi import Form, UploadFile, File
+from fastapi import BackgroundTasks, Form, UploadFile, File, Query, Response
 from datetime import datetime
-from google.cloud import storage
 from pymongo import ASCENDING, DESCENDING
-import time
-from pathlib import Path
+from app.utils.pagination import find_page, encode_cursor, decode_cursor
+from app.utils import search as search_index
+from app.utils import timelines
+from app.utils.counts import cached_count
+from app.utils.etag import make_etag, etag_matches, conditional_headers, not_modified, PUBLIC_CACHE_CONTROL, PRIVATE_CACHE_CONTROL
+from app.utils.similarity import MAX_NEIGHBOURS
 from typing import List, Optional, Dict
 
-project_name = 'kasula'
-bucket_name = 'bucket-kasula_images'
 import json
-import requests
-import os
 
 router = APIRouter()
 
+# Ranked search results checked against the other filters per query
+RELEVANCE_CHUNK_SIZE = 100
+
 def get_database(request: Request):
     return request.app.mongodb
 
-def create_flexible_regex(search_term):
-    pattern = '.*'.join(map(re.escape, search_term))  # This will create a pattern with .* between each character
-    return {'$regex': pattern, '$options': 'i'}
-
 @router.post("/", response_description="Add new recipe")
-async def create_recipe(db: AsyncIOMotorClient = Depends(get_database), recipe: str = Form(...), files: List[UploadFile] = File(None), current_user: UserModel = Depends(get_current_user)):
+async def create_recipe(background_tasks: BackgroundTasks, db: AsyncIOMotorClient = Depends(get_database), recipe: str = Form(...), files: List[UploadFile] = File(None), current_user: UserModel = Depends(get_current_user), users: UserLoader = Depends(get_user_loader), storage: ImageStorage = Depends(get_storage), similarity: SimilarityIndex = Depends(get_similarity)):
     # Retrieve the current user from the database
-    user = await db["users"].find_one({"_id": current_user["user_id"]})
+    user = await users.load(current_user["user_id"])
 
     if user is None:
         raise HTTPException(status_code=404, detail=f"User not found")
@@ -53,49 +52,47 @@ async def create_recipe(db: AsyncIOMotorClient = Depends(get_database), recipe:
         recipe_model.main_image = None
         recipe_model.images = []
     else:
-        image_urls = []
-        for i, file in enumerate(files):
-            fullname = await upload_image(file, file.filename)
-            image_url = f'https://storage.googleapis.com/bucket-kasula_images/{fullname}'
-            if i == 0:
-                recipe_model.main_image = image_url
-            else:
-                image_urls.append(image_url)
-
-        recipe_model.images = image_urls  # Set the images field with the list of URLs
-
-    recipe_dict = jsonable_encoder(recipe_model)
+        # The first file is the main image, the rest go to the images list
+        image_urls = await storage.upload_many(files)
+        recipe_model.main_image = image_urls[0]
+        recipe_model.images = image_urls[1:]
+
+    recipe_dict = to_document(recipe_model)
     new_recipe = await db["recipes"].insert_one(recipe_dict)
     created_recipe = await db["recipes"].find_one({"_id": new_recipe.inserted_id})
 
     if created_recipe is None:
         raise HTTPException(status_code=404, detail=f"Recipe could not be created")
 
+    await search_index.index_recipe(db, created_recipe)
+    similarity.upsert(created_recipe)
+
+    # Followers' timelines are filled once the response is sent
+    background_tasks.add_task(timelines.fan_out_recipe, db, created_recipe)
+
     return JSONResponse(status_code=status.HTTP_201_CREATED, content=created_recipe)
 
 
 @router.get("/", response_description="List all recipes")
-async def list_recipes(db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
-    username = current_user["username"] if current_user else None
-
-    if username:
-        # Retrieve the current user from the database
-        user = await db["users"].find_one({"_id": current_user["user_id"]})
+async def list_recipes(view: str = Query("full", regex="^(card|full)$"), db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
+    user_id = current_user["user_id"] if current_user else None
 
     recipes = []
-    query = {"$or": [{"is_public": True}]}
+    query = visible_to(user_id, await following_ids(db, user_id) if user_id else [])
 
-    if username:
-        query["$or"].append({"username": username})
-        query["$or"].append({"$and": [{"is_public": False}, {"username": {"$in": user.get("following", [])}}]})
-
-    async for doc in db["recipes"].find(query).limit(100):
+    async for doc in db["recipes"].find(query, recipe_projection(view)).limit(100):
         recipes.append(doc)
 
-    if not recipes:
-        return []
+    # Database documents are rendered as they are, without going through jsonable_encoder
+    return FastJSONResponse(recipes)
 
-    return recipes
+def visible_to(user_id: Optional[str], following: List[str]) -> dict:
+    """Filter on the recipes a user can see: public ones, their own and those of the users they follow."""
+    conditions = [{"is_public": True}]
+    if user_id:
+        conditions.append({"user_id": user_id})
+        conditions.append({"$and": [{"is_public": False}, {"user_id": {"$in": following}}]})
+    return {"$or": conditions}
 
   
 @router.get("/magic", response_description="Get recipes with filtering, sorting, and pagination")
@@ -114,8 +111,12 @@ async def get_magic_recipes(
     max_rating: Optional[float] = None,
     search: Optional[str] = None,
     feedType: Optional[str] = None,  # New parameter
+    cursor: Optional[str] = None,  # Keyset pagination token, empty for the first page
+    with_total: bool = False,  # Return the number of matching recipes in X-Total-Count
+    view: str = Query("full", regex="^(card|full)$"),
     db: AsyncIOMotorClient = Depends(get_database),
-    current_user: UserModel = Depends(get_current_user)
+    current_user: UserModel = Depends(get_current_user),
+    foryou: ForYouPool = Depends(get_foryou)
 ):
     query = {}
 
@@ -136,30 +137,31 @@ async def get_magic_recipes(
     if max_rating is not None:
         query.setdefault("average_rating", {})["$lte"] = max_rating
 
-    # Flexible search functionality
-    if search:
-        regex_search = create_flexible_regex(search)
-        query["$or"] = [
-            {"name": regex_search},
-            {"ingredients.name": regex_search},
-            {"username": regex_search}
-        ]
+    # Flexible search functionality, resolved to a bounded list of candidate ids by the search index
+    ranked_ids = await search_index.search_recipe_ids(db, search) if search else None
 
     # Modify existing query based on feedType
     if feedType and current_user:
         if feedType not in ['foryou', 'following']:
             raise HTTPException(status_code=400, detail="Invalid feed type")
 
-        user = await db["users"].find_one({"_id": current_user["user_id"]})
-        following = user.get("following", [])
-        
         if feedType == 'following':
+            # Without other filters or sorting the feed is read from the user's timeline
+            if not query and not search and not sort_by:
+                return await following_feed(db, current_user["user_id"], start, size, cursor, view)
+
             # Filter recipes from followed users, while keeping other filters
-            query["username"] = {"$in": following}
+            query["user_id"] = {"$in": await following_ids(db, current_user["user_id"])}
         
         elif feedType == 'foryou':
+            following = await following_ids(db, current_user["user_id"])
+
+            # Without other filters or sorting the feed is paginated from the ranked pool
+            if not query and not search and not sort_by:
+                return await foryou_feed(db, foryou, set(following) | {current_user["user_id"]}, start, size, cursor, view)
+
             # Filter public recipes not from followed users and not from the current user
-            foryou_conditions = [{"is_public": True}, {"username": {"$nin": following + [current_user["username"]]} }]
+            foryou_conditions = [{"is_public": True}, {"user_id": {"$nin": following + [current_user["user_id"]]} }]
             query = {"$and": [query, *foryou_conditions]} if query else {"$and": foryou_conditions}
 
     # Sorting
@@ -170,71 +172,181 @@ async def get_magic_recipes(
     else:
         sort_params = None  # No sorting
 
-    # Pagination
-    total_recipes = await db["recipes"].count_documents(query)
+    # The sort field is needed to build the next cursor
+    projection = recipe_projection(view, sort_by)
+
+    # Without an explicit sort, search results are returned by relevance, a chunk of ranked ids at a time
+    if search and not sort_params and cursor is None:
+        recipes = await relevance_page(db, query, ranked_ids, start, size, projection)
+        total = None
+        if with_total:
+            total = await cached_count(db["recipes"], with_ids(query, ranked_ids)) if query else len(ranked_ids)
+        return FastJSONResponse(recipes, headers=total_header(with_total, total))
 
-    if start >= total_recipes:
-        raise HTTPException(status_code=400, detail="Start index out of range.")
+    # Other searches filter on the candidate ids
+    if search:
+        query = with_ids(query, ranked_ids)
+
+    # Keyset pagination: resume after the (sort_by value, _id) pair stored in the cursor
+    if cursor is not None:
+        recipes, next_cursor = await find_page(db["recipes"], query, sort_by, order, size, cursor, projection)
+        return FastJSONResponse({"recipes": recipes, "next_cursor": next_cursor})
+
+    # Pagination. Pages past the end are empty, so the total is only counted on request
+    total = await cached_count(db["recipes"], query) if with_total else None
+
+    if total is not None and start >= total:
+        recipes = []
+    else:
+        recipes_cursor = db["recipes"].find(query, projection)
+        if sort_params:
+            recipes_cursor = recipes_cursor.sort(sort_params)
+        recipes = await recipes_cursor.skip(start).limit(size).to_list(length=size)
 
-    if start + size > total_recipes:
-        size = total_recipes - start
+    return FastJSONResponse(recipes, headers=total_header(with_total, total))
 
-    cursor = db["recipes"].find(query)
-    if sort_params:
-        cursor = cursor.sort(sort_params)
-    recipes = await cursor.skip(start).limit(size).to_list(length=size)
 
+def with_ids(query: dict, ids: List[str]) -> dict:
+    condition = {"_id": {"$in": ids}}
+    return {"$and": [query, condition]} if query else condition
+
+
+async def relevance_page(db, query: dict, ranked_ids: List[str], start: int, size: int, projection: dict) -> List[dict]:
+    """Return a page of the recipes matching the query, in the order of the ranked ids.
+
+    The ranked ids are checked against the query a chunk at a time, only until
+    the page is full, instead of in one $in over all of them.
+    """
+    recipes = []
+    skipped = 0
+    for offset in range(0, len(ranked_ids), RELEVANCE_CHUNK_SIZE):
+        chunk = ranked_ids[offset:offset + RELEVANCE_CHUNK_SIZE]
+        found = {doc["_id"]: doc for doc in await db["recipes"].find(with_ids(query, chunk), projection).to_list(None)}
+        for recipe_id in chunk:
+            if recipe_id not in found:
+                continue
+            if skipped < start:
+                skipped += 1
+                continue
+            recipes.append(found[recipe_id])
+            if len(recipes) == size:
+                return recipes
     return recipes
+
+
+def total_header(with_total: bool, total: Optional[int]) -> Optional[Dict[str, str]]:
+    return {"X-Total-Count": str(total)} if with_total else None
+
+
+async def following_feed(db, user_id: str, start: int, size: int, cursor: Optional[str], view: str):
+    """Serve a following feed from the materialized timeline, newest first."""
+    recipe_ids, next_cursor = await timelines.timeline_page(db, user_id, size, 0 if cursor is not None else start, cursor)
+
+    # Recipes deleted since the page was read are left out
+    found = {doc["_id"]: doc for doc in await db["recipes"].find({"_id": {"$in": recipe_ids}}, recipe_projection(view)).to_list(None)}
+    recipes = [found[recipe_id] for recipe_id in recipe_ids if recipe_id in found]
+
+    if cursor is not None:
+        return FastJSONResponse({"recipes": recipes, "next_cursor": next_cursor})
+
+    return FastJSONResponse(recipes)
+
+
+async def foryou_feed(db, foryou: ForYouPool, excluded_users: set, start: int, size: int, cursor: Optional[str], view: str):
+    """Serve a foryou feed from the ranked candidate pool, best first."""
+    after = None
+    if cursor:
+        state = decode_cursor(cursor)
+        if state.get("feed") != "foryou" or "score" not in state or "id" not in state:
+            raise HTTPException(status_code=400, detail="Cursor does not match the requested sorting")
+        after = (state["score"], state["id"])
+
+    entries, has_more = foryou.page(excluded_users, size, 0 if cursor is not None else start, after)
+    recipe_ids = [entry.recipe_id for entry in entries]
+
+    # Recipes deleted or made private since the last refresh are left out
+    found = {doc["_id"]: doc for doc in await db["recipes"].find({"_id": {"$in": recipe_ids}, "is_public": True}, recipe_projection(view)).to_list(None)}
+    recipes = [found[recipe_id] for recipe_id in recipe_ids if recipe_id in found]
+
+    if cursor is not None:
+        next_cursor = encode_cursor({"feed": "foryou", "score": entries[-1].score, "id": entries[-1].recipe_id}) if has_more else None
+        return FastJSONResponse({"recipes": recipes, "next_cursor": next_cursor})
+
+    return FastJSONResponse(recipes)
+
   
   
 @router.get("/similar/{id}", response_description="List similar recipes")
-async def list_similar_recipes(id: str, db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
-    username = current_user["username"] if current_user else None
+async def list_similar_recipes(id: str, limit: int = Query(6, ge=1, le=MAX_NEIGHBOURS), view: str = Query("full", regex="^(card|full)$"), db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user), similarity: SimilarityIndex = Depends(get_similarity)):
+    user_id = current_user["user_id"] if current_user else None
+    following = await following_ids(db, user_id) if user_id else []
 
-    if username:
-        # Retrieve the current user from the database
-        user = await db["users"].find_one({"_id": current_user["user_id"]})
+    if id not in similarity.entries and await db["recipes"].count_documents({"_id": id}, limit=1) == 0:
+        raise HTTPException(status_code=404, detail=f"Recipe {id} not found")
 
-    # Retrieve the current recipe from the database
-    recipe = await db["recipes"].find_one({"_id": id})
+    # Nearest neighbours by ingredients and attributes, restricted to the recipes the user can see
+    similar_ids = similarity.similar(id, limit, user_id, following)
+    if not similar_ids:
+        return []
 
-    if recipe is None:
-        raise HTTPException(status_code=404, detail=f"Recipe {id} not found")
+    # The index of this process may lag behind visibility changes, the database has the final say
+    query = {"$and": [{"_id": {"$in": similar_ids}}, visible_to(user_id, following)]}
+    recipes = {doc["_id"]: doc for doc in await db["recipes"].find(query, recipe_projection(view)).to_list(None)}
+    return FastJSONResponse([recipes[recipe_id] for recipe_id in similar_ids if recipe_id in recipes])
+
+@router.post("/batch", response_description="Get several recipes given their ids")
+async def show_recipes(batch: BatchModel = Body(...), view: str = Query("full", regex="^(card|full)$"), db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
+    user_id = current_user["user_id"] if current_user else None
+    recipe_ids = list(dict.fromkeys(batch.ids))
 
-    similar_recipes = []
-    query = {"$or": [{"is_public": True}]}
+    found = {doc["_id"]: doc for doc in await db["recipes"].find({"_id": {"$in": recipe_ids}}, recipe_projection(view)).to_list(None)}
 
-    if username:
-        query["$or"].append({"username": username})
-        query["$or"].append({"$and": [{"is_public": False}, {"username": {"$in": user.get("following", [])}}]})
+    # The same rules as show_recipe: private recipes are visible to their owner and the owner's followers
+    private_owners = {doc.get("user_id") for doc in found.values() if not doc.get("is_public", False) and doc.get("user_id") != user_id}
+    followed = await followed_among(db, user_id, private_owners) if user_id else set()
 
-    # Retrieve all similar recipes
-    similar_recipes = await db["recipes"].aggregate([{"$sample": {"size": 6}}]).to_list(length=6)
+    results = {}
+    for recipe_id in recipe_ids:
+        recipe = found.get(recipe_id)
+        if recipe is None:
+            results[recipe_id] = {"status": 404, "detail": f"Recipe {recipe_id} not found"}
+        elif recipe.get("is_public", False) or (user_id and (recipe.get("user_id") == user_id or recipe.get("user_id") in followed)):
+            results[recipe_id] = {"status": 200, "recipe": recipe}
+        else:
+            results[recipe_id] = {"status": 403, "detail": "The given recipe is not public"}
+
+    return FastJSONResponse(results)
 
-    return similar_recipes
 
 @router.get("/{id}", response_description="Get a single recipe given its id")
-async def show_recipe(id: str, db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
-    recipe = await db["recipes"].find_one({"_id": id})
+async def show_recipe(id: str, request: Request, response: Response, db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
+    # A conditional request only needs what the access check and the ETag use
+    conditional = "if-none-match" in request.headers
+    recipe = await db["recipes"].find_one({"_id": id}, {"is_public": 1, "user_id": 1, "version": 1} if conditional else None)
 
     user_id = current_user["user_id"] if current_user else None
 
-    if user_id:
-        # Retrieve the current user from the database
-        user = await db["users"].find_one({"_id": current_user["user_id"]})
-
-    if recipe is not None:
-        if recipe.get("is_public", False):
-            return recipe
-        elif user_id:
-            if recipe.get("user_id") == user_id:
-                return recipe
-            elif recipe.get("username") in user.get("following", []):
-                return recipe
-        raise HTTPException(status_code=403, detail=f"The given recipe is not public")
-    else:
+    if recipe is None:
         raise HTTPException(status_code=404, detail=f"Recipe {id} not found")
 
+    if not recipe.get("is_public", False):
+        if not user_id or (recipe.get("user_id") != user_id and not await is_following(db, user_id, recipe.get("user_id"))):
+            raise HTTPException(status_code=403, detail=f"The given recipe is not public")
+
+    cache_control = PUBLIC_CACHE_CONTROL if recipe.get("is_public", False) else PRIVATE_CACHE_CONTROL
+    etag = make_etag("recipe", id, recipe.get("version", 0))
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+
+    if conditional:
+        recipe = await db["recipes"].find_one({"_id": id})
+        if recipe is None:
+            raise HTTPException(status_code=404, detail=f"Recipe {id} not found")
+        etag = make_etag("recipe", id, recipe.get("version", 0))
+
+    conditional_headers(response, etag, cache_control)
+    return recipe
+
 
 @router.put("/{id}", response_description="Update a recipe")
 async def update_recipe(
@@ -242,7 +354,9 @@ async def update_recipe(
     db: AsyncIOMotorClient = Depends(get_database), 
     recipe: Optional[str] = Form(None),  # Make the recipe data optional
     files: List[UploadFile] = File(None),  # Accept multiple files
-    current_user: UserModel = Depends(get_current_user)
+    current_user: UserModel = Depends(get_current_user),
+    storage: ImageStorage = Depends(get_storage),
+    similarity: SimilarityIndex = Depends(get_similarity)
 ):
     # Retrieve the existing recipe
     existing_recipe = await db["recipes"].find_one({"_id": id})
@@ -250,7 +364,7 @@ async def update_recipe(
         raise HTTPException(status_code=404, detail=f"Recipe {id} not found")
 
     # Authorization check
-    if existing_recipe.get("username") != current_user["username"]:
+    if existing_recipe.get("user_id") != current_user["user_id"]:
         raise HTTPException(status_code=403, detail="Not authorized to update this recipe")
 
     recipe_update = {}
@@ -263,27 +377,24 @@ async def update_recipe(
 
     # Image processing and uploading
     if files:
-        image_urls = []
-        for file in files:
-            fullname = await upload_image(file, file.filename)
-            image_url = f'https://storage.googleapis.com/bucket-kasula_images/{fullname}'
-            image_urls.append(image_url)
-
-        if image_urls:
-            existing_images = existing_recipe.get('images', [])
-            recipe_update['main_image'] = image_urls
+        image_urls = await storage.upload_many(files)
+        recipe_update['main_image'] = image_urls[0]
+        recipe_update['images'] = image_urls[1:]
 
     # Update logic
     if recipe_update:
         recipe_update['updated_at'] = datetime.utcnow()
         update_result = await db["recipes"].update_one(
-            {"_id": id}, {"$set": recipe_update}
+            {"_id": id}, {"$set": recipe_update, "$inc": {"version": 1}}
         )
 
         if update_result.modified_count == 1:
             if (
                 updated_recipe := await db["recipes"].find_one({"_id": id})
             ) is not None:
+                if "name" in recipe_update or "ingredients" in recipe_update:
+                    await search_index.index_recipe(db, updated_recipe)
+                similarity.upsert(updated_recipe)
                 return updated_recipe
 
     # Return existing recipe if no updates were made
@@ -296,68 +407,53 @@ async def update_recipe(
     
     
 @router.delete("/{id}", response_description="Delete Recipe")
-async def delete_recipe(id: str, db: AsyncIOMotorClient = Depends(get_database), current_user: UserModel = Depends(get_current_user)):
+async def delete_recipe(id: str, db: AsyncIOMotorClient = Depends(get_database), current_user: UserModel = Depends(get_current_user), users: UserLoader = Depends(get_user_loader), similarity: SimilarityIndex = Depends(get_similarity), foryou: ForYouPool = Depends(get_foryou)):
     # Retrieve the existing recipe from the database.
     existing_recipe = await db["recipes"].find_one({"_id": id})
 
-    user = await db["users"].find_one({"_id": current_user["user_id"]})
+    user = await users.load(current_user["user_id"])
 
     # If no such recipe exists, return a 404 error.
     if existing_recipe is None:
         raise HTTPException(status_code=404, detail=f"Recipe {id} not found")
 
     # Check if the user trying to delete the recipe is the one who created it.
-    if existing_recipe.get("username") != user["username"]:
+    if existing_recipe.get("user_id") != user["_id"]:
         raise HTTPException(status_code=403, detail="Not authorized to delete this recipe")
 
     # Delete the recipe from the database.
     delete_result = await db["recipes"].delete_one({"_id": id})
 
     if delete_result.deleted_count == 1:
+        await db["reviews"].delete_many({"recipe_id": id})
+        await search_index.remove_recipe(db, id)
+        await timelines.remove_recipe(db, id)
+        similarity.remove(id)
+        foryou.remove(id)
         return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Recipe successfully deleted"})
     
     raise HTTPException(status_code=404, detail=f"Recipe {id} not found")
 
 @router.get("/user/{username}", response_description="List all recipes by a specific username")
-async def list_recipes_by_username(username: str, db: AsyncIOMotorClient = Depends(get_database), current_user: UserModel = Depends(get_current_user)):
-    # Find the target user by username
-    target_user = await db["users"].find_one({"username": username})
-    if not target_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+async def list_recipes_by_username(username: str, view: str = Query("full", regex="^(card|full)$"), db: AsyncIOMotorClient = Depends(get_database), current_user: UserModel = Depends(get_current_user), users: UserLoader = Depends(get_user_loader)):
     user_id = current_user["user_id"] if current_user else None
 
+    # Find the target user by username, and the current user in the same query
     if user_id:
-        user = await db["users"].find_one({"_id": user_id})
+        target_user, user = await asyncio.gather(users.load_by_username(username), users.load(user_id))
     else:
-        user = None
+        target_user, user = await users.load_by_username(username), None
+
+    if not target_user:
+        raise HTTPException(status_code=404, detail="User not found")
 
     recipes = []
-    for doc in await db["recipes"].find({"username": target_user["username"]}).to_list(length=1000):
+    # Recipes are matched by owner id, which stays valid while a rename propagates
+    for doc in await db["recipes"].find({"user_id": target_user["_id"]}, recipe_projection(view)).to_list(length=1000):
         if doc.get("is_public"):
             recipes.append(doc)
         elif user:
-            if doc.get("username") == user["username"]:
+            if doc.get("user_id") == user["_id"]:
                 recipes.append(doc)
     
-    if not recipes:
-        return []
-    
-    return recipes
-
-async def upload_image(file: UploadFile, name):
-    storage_client = storage.Client(project=project_name)
-    bucket = storage_client.get_bucket(bucket_name)
-    point = name.rindex('.')
-    fullname = 'recipes/' + name[:point].replace(" ", "_") + '-' + str(time.time_ns()) + name[point:]
-    blob = bucket.blob(fullname)
-    
-    data = await file.read()
-    UPLOAD_DIR = Path('')
-    save_to = UPLOAD_DIR / file.filename
-    with open(save_to, "wb") as f:
-        f.write(data)
-    blob.upload_from_filename(save_to)
-    os.remove(save_to)
-    
-    return fullname
\ No newline at end of file
+    return FastJSONResponse(recipes)
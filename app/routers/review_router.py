@@ -3,44 +3,46 @@ from .common import *
 
 from app.models.review_model import ReviewModel, UpdateReviewModel
 from app.models.user_model import UserModel
-from fastapi import Form, UploadFile, Query
+from fastapi import Form, UploadFile, Query, Response
 from datetime import datetime
-from pathlib import Path
-from google.cloud import storage
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.utils.pagination import find_page
+from app.utils.cache import TTLCache
+from app.utils.etag import make_etag, etag_matches, conditional_headers, not_modified, PUBLIC_CACHE_CONTROL, PRIVATE_CACHE_CONTROL
+from app.config import settings
+import asyncio
 import json
-import time
-import os
-
-project_name = 'kasula'
-bucket_name = 'bucket-kasula_images'
 
 router = APIRouter()
 
+# First pages of the review lists, keyed by the recipe's reviews_version and
+# last liked review, so every review write invalidates the pages of its recipe
+review_page_cache = TTLCache(maxsize=settings.REVIEW_PAGE_CACHE_SIZE, ttl=settings.REVIEW_PAGE_CACHE_TTL)
+
 def get_database(request: Request):
     return request.app.mongodb
 
 @router.post("/{recipe_id}", response_description="Add a review to a recipe")
-async def add_review(recipe_id: str, review: str = Form(...), file: Optional[UploadFile] = None, db: AsyncIOMotorClient = Depends(get_database), current_user: UserModel = Depends(get_current_user)):
+async def add_review(recipe_id: str, review: str = Form(...), file: Optional[UploadFile] = None, db: AsyncIOMotorClient = Depends(get_database), current_user: UserModel = Depends(get_current_user), users: UserLoader = Depends(get_user_loader), storage: ImageStorage = Depends(get_storage)):
     # Find the recipe by ID
     recipe = await db["recipes"].find_one({"_id": recipe_id})
     if not recipe:
         raise HTTPException(status_code=404, detail=f"Recipe {recipe_id} not found")
 
-    user = await db["users"].find_one({"_id": current_user["user_id"]})
+    user = await users.load(current_user["user_id"])
 
     # Check if the current user is the creator of the recipe
-    if recipe.get("username") == user["username"]:
+    if recipe.get("user_id") == user["_id"]:
         raise HTTPException(status_code=403, detail="Creators cannot review their own recipes")
 
     # Check if the recipe is public or if the current user follows the recipe owner
     if not recipe.get("is_public", True):
-        recipe_owner = await db["users"].find_one({"username": recipe["username"]})
-
-        if user["username"] not in recipe_owner.get("followers", []):
+        if not await is_following(db, user["_id"], recipe["user_id"]):
             raise HTTPException(status_code=403, detail="Cannot review a private recipe without following the creator of the recipe")
 
-    # Check if the current user has already reviewed this recipe
-    if any(review["username"] == user["username"] for review in recipe.get("reviews", [])):
+    # Check if the current user has already reviewed this recipe before uploading anything
+    if await db["reviews"].find_one({"recipe_id": recipe_id, "user_id": current_user["user_id"]}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="User has already reviewed this recipe")
 
     # Deserialize and handle the review
@@ -49,230 +51,248 @@ async def add_review(recipe_id: str, review: str = Form(...), file: Optional[Upl
 
     if file:
         # Handle file upload and set image URL
-        fullname = await upload_image(file, file.filename)
-        review_model.image = f'https://storage.googleapis.com/bucket-kasula_images/{fullname}'
+        review_model.image = await storage.upload(file)
     else:
         review_model.image = None
 
     review_model.username = user["username"]
+    review_model.recipe_id = recipe_id
 
     # Set user_id to the current user's ID
     review_model.user_id = current_user["user_id"]
 
-    review_dict = jsonable_encoder(review_model)
+    review_dict = to_document(review_model)
 
-    # Add the review to the recipe
-    update_result = await db["recipes"].update_one(
-        {"_id": recipe_id}, {"$push": {"reviews": review_dict}}
-    )
-
-    # Recalculate average rating and update it
-    updated_recipe = await db["recipes"].find_one({"_id": recipe_id})
-    new_average_rating = calculate_average_rating(updated_recipe["reviews"])
-    await db["recipes"].update_one(
-        {"_id": recipe_id}, {"$set": {"average_rating": new_average_rating}}
-    )
+    # The unique (recipe_id, user_id) index rejects concurrent duplicate reviews
+    try:
+        await db["reviews"].insert_one(review_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User has already reviewed this recipe")
 
-    if update_result.modified_count == 1:
-        return JSONResponse(status_code=status.HTTP_201_CREATED, content=review_dict)
+    # Add the rating to the recipe counters
+    await apply_rating_change(db, recipe_id, review_dict["rating"], 1)
 
-    raise HTTPException(status_code=500, detail="Failed to add review")
+    return JSONResponse(status_code=status.HTTP_201_CREATED, content=review_dict)
 
 
 @router.put("/{recipe_id}/{review_id}", response_description="Update a review")
 async def update_review(recipe_id: str, review_id: str, update_data: UpdateReviewModel, db: AsyncIOMotorClient = Depends(get_database), current_user: UserModel = Depends(get_current_user)):
-    # Retrieve the recipe and check if it exists
-    recipe = await db["recipes"].find_one({"_id": recipe_id})
-    if not recipe:
-        raise HTTPException(status_code=404, detail="Recipe not found")
-    
-    # Check if the review exists and if the current user is authorized to update it
-    review = next((r for r in recipe["reviews"] if r["_id"] == review_id), None)
-    if not review:
-        raise HTTPException(status_code=404, detail="Review not found")
-
-    user = await db["users"].find_one({"_id": current_user["user_id"]})
-
-    if review["username"] != user["username"]:
-        raise HTTPException(status_code=403, detail="Not authorized to update this review")
-    
     # Prepare update data
     if update_data.rating is not None:
         update_data.rating = round(update_data.rating, 1)  # Round to one decimal place
     update_data.updated_date = datetime.utcnow()
 
     # Create a dictionary for fields to update
-    update_fields = {f"reviews.$.{k}": v for k, v in jsonable_encoder(update_data).items() if v is not None}
-    
-    # Update the review in the database
-    update_result = await db["recipes"].update_one(
-        {"_id": recipe_id, "reviews._id": review_id},
-        {"$set": update_fields}
+    update_fields = {k: v for k, v in to_document(update_data).items() if v is not None}
+
+    # Update the review if it belongs to the current user, reading its previous rating atomically
+    previous = await db["reviews"].find_one_and_update(
+        {"_id": review_id, "recipe_id": recipe_id, "user_id": current_user["user_id"]},
+        {"$set": update_fields},
+        projection={"rating": 1},
+        return_document=ReturnDocument.BEFORE
     )
+    if previous is None:
+        await raise_review_write_error(db, recipe_id, review_id, "update")
 
-    # Fetch updated recipe to recalculate average rating
-    updated_recipe = await db["recipes"].find_one({"_id": recipe_id})
-    new_average_rating = calculate_average_rating(updated_recipe["reviews"])
-
-    # Update the average rating in the database
-    await db["recipes"].update_one(
-        {"_id": recipe_id}, {"$set": {"average_rating": new_average_rating}}
-    )
+    if "rating" in update_fields:
+        await apply_rating_change(db, recipe_id, update_fields["rating"] - previous["rating"], 0)
+    else:
+        await touch_reviews(db, recipe_id)
 
-    if update_result.modified_count == 1:
-        modified_fields = {}
-        for field in update_fields:
-            modified_fields[field.split('.')[-1]] = update_fields[field]
-        return modified_fields
-        
-    raise HTTPException(status_code=404, detail="Recipe or review not found")
+    return update_fields
 
 
 @router.delete("/{recipe_id}/{review_id}", response_description="Delete a review")
 async def delete_review(recipe_id: str, review_id: str, db: AsyncIOMotorClient = Depends(get_database), current_user: UserModel = Depends(get_current_user)):
-    # Retrieve the recipe and check if it exists
-    recipe = await db["recipes"].find_one({"_id": recipe_id})
-    if not recipe:
-        raise HTTPException(status_code=404, detail="Recipe not found")
-
-    # Check if the review exists and if the current user is authorized to delete it
-    review = next((r for r in recipe["reviews"] if r["_id"] == review_id), None)
-    if not review:
-        raise HTTPException(status_code=404, detail="Review not found")
-
-    user = await db["users"].find_one({"_id": current_user["user_id"]})
-
-    if review["username"] != user["username"]:
-        raise HTTPException(status_code=403, detail="Not authorized to delete this review")
-    
-    update_result = await db["recipes"].update_one(
-        {"_id": recipe_id},
-        {"$pull": {"reviews": {"_id": review_id}}}
+    # Delete the review if it belongs to the current user
+    deleted = await db["reviews"].find_one_and_delete(
+        {"_id": review_id, "recipe_id": recipe_id, "user_id": current_user["user_id"]},
+        projection={"rating": 1}
     )
+    if deleted is None:
+        await raise_review_write_error(db, recipe_id, review_id, "delete")
 
-    # Fetch updated recipe to recalculate average rating
-    updated_recipe = await db["recipes"].find_one({"_id": recipe_id})
-    new_average_rating = calculate_average_rating(updated_recipe["reviews"])
+    # Remove the rating from the recipe counters
+    await apply_rating_change(db, recipe_id, -deleted["rating"], -1)
 
-    # Update the average rating in the database
-    await db["recipes"].update_one(
-        {"_id": recipe_id}, {"$set": {"average_rating": new_average_rating}}
-    )
-
-    if update_result.modified_count == 1:
-        return {"message": "Review deleted successfully"}
-    raise HTTPException(status_code=404, detail="Recipe or review not found")
+    return {"message": "Review deleted successfully"}
 
 
-@router.get("/{recipe_id}", response_description="List all reviews for a recipe")
-async def get_reviews(recipe_id: str, db: AsyncIOMotorClient = Depends(get_database)):
-    recipe = await db["recipes"].find_one({"_id": recipe_id})
+@router.get("/{recipe_id}", response_description="List the reviews of a recipe, oldest first")
+async def get_reviews(
+    recipe_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,  # Pagination token, empty for the first page
+    db: AsyncIOMotorClient = Depends(get_database)
+):
+    recipe = await load_reviews_version(db, recipe_id)
     if not recipe:
         raise HTTPException(status_code=404, detail=f"Recipe {recipe_id} not found")
 
-    return recipe.get("reviews", [])
+    etag, cache_control = reviews_etag(recipe, "creation_date", limit, cursor)
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    conditional_headers(response, etag, cache_control)
+
+    reviews, next_cursor = await reviews_page(db, recipe, "creation_date", True, limit, cursor)
+
+    # Without a cursor only the first page is returned, as a plain list
+    if cursor is None:
+        return reviews
+    return {"reviews": reviews, "next_cursor": next_cursor}
 
 @router.get("/magic/{recipe_id}", response_description="Get sorted reviews for a recipe")
 async def get_sorted_reviews(
     recipe_id: str, 
+    request: Request,
+    response: Response,
     sort_by: Optional[str] = Query(None, regex="^(rating|likes|creation_date)$"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,  # Pagination token, empty for the first page
     db: AsyncIOMotorClient = Depends(get_database)
 ):
     # Find the recipe by ID
-    recipe = await db["recipes"].find_one({"_id": recipe_id})
+    recipe = await load_reviews_version(db, recipe_id)
     if not recipe:
         raise HTTPException(status_code=404, detail=f"Recipe {recipe_id} not found")
 
-    reviews = recipe.get("reviews", [])
+    etag, cache_control = reviews_etag(recipe, sort_by, limit, cursor)
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    conditional_headers(response, etag, cache_control)
 
-    # Sort the reviews based on the specified criteria
+    # Higher values first when sorting, otherwise the reviews are listed oldest first
     if sort_by:
-        reverse = True if sort_by in ["rating", "likes", "creation_date"] else False  # Assuming higher values are better for rating and likes
-        reviews.sort(key=lambda review: review.get(sort_by), reverse=reverse)
+        reviews, next_cursor = await reviews_page(db, recipe, sort_by, False, limit, cursor)
+    else:
+        reviews, next_cursor = await reviews_page(db, recipe, "creation_date", True, limit, cursor)
 
-    return reviews
+    if cursor is None:
+        return reviews
+    return {"reviews": reviews, "next_cursor": next_cursor}
 
 
 @router.patch("/like/{recipe_id}/{review_id}", response_description="Like a review")
 async def like_review(recipe_id: str, review_id: str, current_user: UserModel = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database)):
-    recipe = await db["recipes"].find_one({"_id": recipe_id})
+    user_id = current_user["user_id"]
 
-    if not recipe:
-        raise HTTPException(status_code=404, detail="Recipe or review not found")
-
-    user = await db["users"].find_one({"_id": current_user["user_id"]})
-
-    # Check if the current user has already liked the review or is trying to like their own review
-    for review in recipe["reviews"]:
-        if review["_id"] == review_id:
-            # Check if the current user is trying to like their own review
-            if review["username"] == user["username"]:
-                raise HTTPException(status_code=403, detail="You cannot like your own review")
-
-            # Check if the current user has already liked the review
-            if user["username"] in review.get("liked_by", []):
-                raise HTTPException(status_code=400, detail="You have already liked this review")
-
-            # Update the review to add the username to liked_by and increment likes
-            update_result = await db["recipes"].update_one(
-                {"_id": recipe_id, "reviews._id": review_id},
-                {"$inc": {"reviews.$.likes": 1}, "$push": {"reviews.$.liked_by": user["username"]}}
-            )
+    # Like the review unless it is the user's own or already liked by them, in one atomic update
+    update_result = await db["reviews"].update_one(
+        {"_id": review_id, "recipe_id": recipe_id, "user_id": {"$ne": user_id}, "liked_by": {"$ne": user_id}},
+        {"$inc": {"likes": 1, "version": 1}, "$push": {"liked_by": user_id}, "$currentDate": {"likes_updated_date": True}}
+    )
 
-            if update_result.modified_count == 1:
-                return {"message": "Review liked successfully"}
-            raise HTTPException(status_code=500, detail="An error occurred while liking the review")
+    if update_result.matched_count == 0:
+        await raise_like_error(db, recipe_id, review_id, user_id, liking=True)
 
-    raise HTTPException(status_code=404, detail="Review not found")
+    return {"message": "Review liked successfully"}
 
 
 @router.patch("/unlike/{recipe_id}/{review_id}", response_description="Unlike a review")
 async def unlike_review(recipe_id: str, review_id: str, current_user: UserModel = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database)):
-    recipe = await db["recipes"].find_one({"_id": recipe_id})
-
-    if not recipe:
-        raise HTTPException(status_code=404, detail="Recipe or review not found")
-
-    user = await db["users"].find_one({"_id": current_user["user_id"]})
+    user_id = current_user["user_id"]
 
-    # Check if the current user has already liked the review
-    for review in recipe["reviews"]:
-        if review["_id"] == review_id:
-            # Check if the current user has liked the review
-            if user["username"] not in review.get("liked_by", []):
-                raise HTTPException(status_code=400, detail="You have not liked this review")
+    # Remove the like only if the user has liked the review, in one atomic update
+    update_result = await db["reviews"].update_one(
+        {"_id": review_id, "recipe_id": recipe_id, "liked_by": user_id},
+        {"$inc": {"likes": -1, "version": 1}, "$pull": {"liked_by": user_id}, "$currentDate": {"likes_updated_date": True}}
+    )
 
-            # Update the review to remove the username from liked_by and decrement likes
-            update_result = await db["recipes"].update_one(
-                {"_id": recipe_id, "reviews._id": review_id},
-                {"$inc": {"reviews.$.likes": -1}, "$pull": {"reviews.$.liked_by": user["username"]}}
-            )
+    if update_result.matched_count == 0:
+        await raise_like_error(db, recipe_id, review_id, user_id, liking=False)
 
-            if update_result.modified_count == 1:
-                return {"message": "Review unliked successfully"}
-            raise HTTPException(status_code=500, detail="An error occurred while unliking the review")
+    return {"message": "Review unliked successfully"}
 
+async def raise_review_not_found(db, recipe_id: str):
+    # Only reached on the error path, to tell a missing recipe from a missing review
+    if not await db["recipes"].find_one({"_id": recipe_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Recipe not found")
     raise HTTPException(status_code=404, detail="Review not found")
 
-def calculate_average_rating(reviews: List[dict]) -> float:
-    if not reviews:
+async def raise_like_error(db, recipe_id: str, review_id: str, user_id: str, liking: bool):
+    # Only reached on the error path, to tell why a conditional like update matched nothing
+    review = await db["reviews"].find_one({"_id": review_id, "recipe_id": recipe_id}, {"user_id": 1})
+    if review is None:
+        await raise_review_not_found(db, recipe_id)
+    if not liking:
+        raise HTTPException(status_code=400, detail="You have not liked this review")
+    if review["user_id"] == user_id:
+        raise HTTPException(status_code=403, detail="You cannot like your own review")
+    raise HTTPException(status_code=400, detail="You have already liked this review")
+
+async def raise_review_write_error(db, recipe_id: str, review_id: str, action: str):
+    # Tell apart why a write filtered on the review owner matched nothing
+    if not await db["reviews"].find_one({"_id": review_id, "recipe_id": recipe_id}, {"_id": 1}):
+        await raise_review_not_found(db, recipe_id)
+    raise HTTPException(status_code=403, detail=f"Not authorized to {action} this review")
+
+# Fields of a recipe the review lists need to compute their ETag
+REVIEWS_VERSION_FIELDS = {"reviews_version": 1, "is_public": 1}
+RATING_FIELDS = {"rating_sum": 1, "rating_count": 1}
+
+async def load_reviews_version(db, recipe_id: str) -> Optional[dict]:
+    """Read the recipe fields the review lists depend on, None if it does not exist.
+
+    Adding, editing and deleting reviews increment reviews_version on the
+    recipe. Likes only write the review, stamping it with the server time, so
+    the last liked review of the recipe is read alongside.
+    """
+    recipe, last_liked = await asyncio.gather(
+        db["recipes"].find_one({"_id": recipe_id}, REVIEWS_VERSION_FIELDS),
+        db["reviews"].find_one({"recipe_id": recipe_id}, {"likes_updated_date": 1, "version": 1}, sort=[("likes_updated_date", -1)]),
+    )
+    if recipe is not None:
+        recipe["last_liked"] = last_liked and (last_liked["_id"], last_liked.get("version"), last_liked.get("likes_updated_date"))
+    return recipe
+
+def reviews_version(recipe: dict) -> tuple:
+    return recipe.get("reviews_version", 0), recipe.get("last_liked")
+
+async def reviews_page(db, recipe: dict, sort_by: str, ascending: bool, limit: int, cursor: Optional[str]):
+    """Return a page of the reviews of a recipe and the next cursor, serving first pages from the cache."""
+    if cursor:
+        return await find_page(db["reviews"], {"recipe_id": recipe["_id"]}, sort_by, ascending, limit, cursor)
+
+    # The version was read before the reviews, so the cached page is never older than its key
+    key = (recipe["_id"], reviews_version(recipe), sort_by, ascending, limit)
+    page = review_page_cache.get(key)
+    if page is None:
+        page = await find_page(db["reviews"], {"recipe_id": recipe["_id"]}, sort_by, ascending, limit, cursor)
+        review_page_cache.set(key, page)
+    return page
+
+def reviews_etag(recipe: dict, sort_by: Optional[str], limit: int, cursor: Optional[str]):
+    cache_control = PUBLIC_CACHE_CONTROL if recipe.get("is_public", False) else PRIVATE_CACHE_CONTROL
+    return make_etag("reviews", recipe["_id"], *reviews_version(recipe), sort_by, limit, cursor), cache_control
+
+async def touch_reviews(db, recipe_id: str):
+    # Any change to the reviews of a recipe changes the ETag of its review lists
+    await db["recipes"].update_one({"_id": recipe_id}, {"$inc": {"reviews_version": 1}})
+
+def average_rating(rating_sum: float, rating_count: int) -> float:
+    if rating_count <= 0:
         return 0.0
-    total_rating = sum(review['rating'] for review in reviews if 'rating' in review)
-    return total_rating / len(reviews)
-
-async def upload_image(file: UploadFile, name):
-    storage_client = storage.Client(project=project_name)
-    bucket = storage_client.get_bucket(bucket_name)
-    point = name.rindex('.')
-    fullname = 'recipes/' + name[:point].replace(" ", "_") + '-' + str(time.time_ns()) + name[point:]
-    blob = bucket.blob(fullname)
-    
-    data = await file.read()
-    UPLOAD_DIR = Path('')
-    save_to = UPLOAD_DIR / file.filename
-    with open(save_to, "wb") as f:
-        f.write(data)
-    blob.upload_from_filename(save_to)
-    os.remove(save_to)
-    
-    return fullname
\ No newline at end of file
+    return rating_sum / rating_count
+
+async def apply_rating_change(db, recipe_id: str, rating_delta: float, count_delta: int):
+    """Move the rating counters of a recipe with an atomic $inc, then set its average from them.
+
+    The average is only set while the counters are still the ones returned by
+    the $inc, so when review writes interleave, the last of them sets it.
+    """
+    recipe = await db["recipes"].find_one_and_update(
+        {"_id": recipe_id},
+        {"$inc": {"rating_sum": rating_delta, "rating_count": count_delta, "version": 1, "reviews_version": 1}},
+        projection=RATING_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
+    if recipe is None:
+        return
+
+    await db["recipes"].update_one(
+        {"_id": recipe_id, "rating_sum": recipe["rating_sum"], "rating_count": recipe["rating_count"]},
+        {"$set": {"average_rating": average_rating(recipe["rating_sum"], recipe["rating_count"])}}
+    )
@@ -1,25 +1,23 @@
 from .common import *
-from app.models.user_model import UserModel, UpdateUserModel, PasswordRecoveryModel
+from app.models.common import BatchModel
+from app.models.user_model import UserModel, UpdateUserModel, PasswordRecoveryModel, USER_SUMMARY_FIELDS
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from app.utils.token import create_access_token
+from app.utils.token import create_access_token, revoke_token
+from app.utils.jobs import enqueue_rename, run_pending_jobs
+from app.utils.follows import FOLLOWS_COLLECTION, follow, unfollow, remove_user_edges
+from app.utils.pagination import find_page
+from app.utils import timelines
+from app.utils.etag import make_etag, etag_matches, conditional_headers, not_modified, PRIVATE_CACHE_CONTROL
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from email.mime.text import MIMEText
-from fastapi import Form, UploadFile, File, HTTPException, Depends
-from google.cloud import storage
-import time
-from pathlib import Path
-from typing import List, Optional
+from fastapi import BackgroundTasks, Form, UploadFile, File, HTTPException, Depends, Query, Response
+from typing import Dict, List, Optional
+import asyncio
 import json
 import uuid
 from app.config import settings
 
-project_name = 'kasula'
-bucket_name = 'bucket-kasula_images'
-
-import smtplib
-import ssl
-import os
-
 # Suppress UserWarning from pydantic
 warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
 
@@ -38,7 +36,7 @@ def is_valid_email(email: str) -> bool:
 
 
 @router.post("/", response_description="Add new user")
-async def create_user(request: Request, user: UserModel = Body(...), db: AsyncIOMotorClient = Depends(get_database)):
+async def create_user(request: Request, user: UserModel = Body(...), db: AsyncIOMotorClient = Depends(get_database), mailer: MailQueue = Depends(get_mailer)):
     user_email = user.email
     # Check if email has a valid format
     if not is_valid_email(user.email):
@@ -52,11 +50,18 @@ async def create_user(request: Request, user: UserModel = Body(...), db: AsyncIO
                             detail="Username or email already registered")
 
     # Hash the password before storing
-    password = hash_password(user.password)
-    user = jsonable_encoder(user)
+    password = await hash_password_async(user.password)
+    user = to_document(user)
     user["password"] = password
+    # Counters are maintained by follow and unfollow only
+    user["follower_count"] = user["following_count"] = 0
 
-    new_user = await db["users"].insert_one(user)
+    # The check above is only a fast path, the unique indexes decide concurrent sign ups
+    try:
+        new_user = await db["users"].insert_one(user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Username or email already registered")
     created_user = await db["users"].find_one({"_id": new_user.inserted_id})
 
     if isinstance(created_user["_id"], ObjectId):
@@ -72,11 +77,10 @@ async def create_user(request: Request, user: UserModel = Body(...), db: AsyncIO
         "favorite": True
     }
 
-    await db["collections"].insert_one(jsonable_encoder(collection))
+    await db["collections"].insert_one(collection)
 
-    # Send welcome email after successful user creation
-    if not settings.TEST_ENV:
-        send_welcome_email(user_email)
+    # Queue the welcome email, it is sent in the background
+    send_welcome_email(mailer, user_email)
     
     return JSONResponse(status_code=status.HTTP_201_CREATED, content=created_user)
 
@@ -93,8 +97,8 @@ async def list_users(db: AsyncIOMotorClient = Depends(get_database)):
 
 
 @router.get("/me", response_description="Get current user")
-async def get_me(current_user: str = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database)):
-    user = await db["users"].find_one({"_id": current_user["user_id"]})
+async def get_me(current_user: str = Depends(get_current_user), users: UserLoader = Depends(get_user_loader)):
+    user = await users.load(current_user["user_id"])
     if user:
         user["_id"] = str(user["_id"])  # Convert ObjectId to string
         user.pop("password", None)  # Remove the password field
@@ -102,13 +106,50 @@ async def get_me(current_user: str = Depends(get_current_user), db: AsyncIOMotor
     raise HTTPException(status_code=404, detail="User not found")
 
 
+@router.post("/batch", response_description="Get several users given their ids or usernames")
+async def show_users(batch: BatchModel = Body(...), db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
+    identifiers = list(dict.fromkeys(batch.ids))
+
+    found = {}
+    async for user in db["users"].find({"$or": [{"_id": {"$in": identifiers}}, {"username": {"$in": identifiers}}]}, {"password": 0}):
+        user["_id"] = str(user["_id"])
+        found[user["_id"]] = found[user["username"]] = user
+
+    if current_user:
+        followed = await followed_among(db, current_user["user_id"], [user["_id"] for user in found.values()])
+        for user in found.values():
+            user["is_following"] = user["_id"] in followed
+
+    results = {}
+    for identifier in identifiers:
+        if identifier in found:
+            results[identifier] = {"status": 200, "user": found[identifier]}
+        else:
+            results[identifier] = {"status": 404, "detail": f"User {identifier} not found"}
+
+    return FastJSONResponse(results)
+
+
 @router.get("/{identifier}", response_description="Get a single user given its id or username")
-async def show_user(identifier: str, db: AsyncIOMotorClient = Depends(get_database)):
+async def show_user(identifier: str, request: Request, response: Response, db: AsyncIOMotorClient = Depends(get_database), current_user: Optional[Dict[str, str]] = Depends(get_current_user)):
     query = {"$or": [{"_id": identifier}, {"username": identifier}]}
+    viewer_id = current_user["user_id"] if current_user else None
+
+    # A conditional request only needs the version to compute the ETag. Following
+    # or unfollowing changes the follower counter, so is_following is covered too.
+    conditional = "if-none-match" in request.headers
+    if conditional and (user := await db["users"].find_one(query, {"version": 1})) is not None:
+        etag = make_etag("user", user["_id"], user.get("version", 0), viewer_id)
+        if etag_matches(request, etag):
+            return not_modified(etag, PRIVATE_CACHE_CONTROL)
+
     if (user := await db["users"].find_one(query)) is not None:
         # Convert ObjectId back to string for the response
         user["_id"] = str(user["_id"])
         user.pop("password", None)  # Remove the password field
+        if current_user:
+            user["is_following"] = await is_following(db, current_user["user_id"], user["_id"])
+        conditional_headers(response, make_etag("user", user["_id"], user.get("version", 0), viewer_id), PRIVATE_CACHE_CONTROL)
         return user
 
     raise HTTPException(status_code=404, detail=f"User {identifier} not found")
@@ -116,15 +157,18 @@ async def show_user(identifier: str, db: AsyncIOMotorClient = Depends(get_databa
 @router.put("/{id}", response_description="Update a user")
 async def update_user(
     id: str, 
+    background_tasks: BackgroundTasks,
     db: AsyncIOMotorClient = Depends(get_database), 
     user: Optional[str] = Form(None),  # Make the user data optional
     file: UploadFile | None = None,  # File upload
-    current_user: str = Depends(get_current_user)
+    current_user: str = Depends(get_current_user),
+    users: UserLoader = Depends(get_user_loader),
+    storage: ImageStorage = Depends(get_storage)
 ):
     user_update = {}
 
     # Retrieve the current user from the database
-    actual_user = await db["users"].find_one({"_id": current_user["user_id"]})
+    actual_user = await users.load(current_user["user_id"])
 
     # Only parse user data if it's provided
     if user:
@@ -132,7 +176,7 @@ async def update_user(
         user_model = UpdateUserModel(**user_data)
 
         if user_model.password:
-            user_model.password = hash_password(user_model.password)
+            user_model.password = await hash_password_async(user_model.password)
 
         user_update = {k: v for k, v in user_model.dict().items() if v is not None}
 
@@ -142,41 +186,23 @@ async def update_user(
 
     # Image processing and uploading
     if file:
-        fullname = await upload_image(file, file.filename)
-        image_url = f'https://storage.googleapis.com/bucket-kasula_images/{fullname}'
-
-        user_update['profile_picture'] = image_url
+        user_update['profile_picture'] = await storage.upload(file)
 
     # Ensure there's something to update
     if user_update:
-        update_result = await db["users"].update_one(
-            {"_id": id}, {"$set": user_update}
-        )
-
-        if 'username' in user_update and not settings.TEST_ENV:
-            # Update the username in all recipes created by the user
-            await db["recipes"].update_many(
-                {"user_id": id}, {"$set": {"username": user_update["username"]}}
-            )
-            # Update the username in all reviews within the recipes
-            await db["recipes"].update_many(
-                {"reviews.user_id": id},
-                {"$set": {"reviews.$[elem].username": user_update["username"]}},
-                array_filters=[{"elem.user_id": id}]
-            )
-            await db["collections"].update_many(
-                {"user_id": id}, {"$set": {"username": user_update["username"]}}
-            )
-            # Update the username in all followers of the current user
-            await db["users"].update_many(
-                {"following": actual_user["username"]},
-                {"$set": {"following.$": user_update["username"]}}
-            )
-            # Update the username in all following of the current user
-            await db["users"].update_many(
-                {"followers": actual_user["username"]},
-                {"$set": {"followers.$": user_update["username"]}}
+        try:
+            update_result = await db["users"].update_one(
+                {"_id": id}, {"$set": user_update, "$inc": {"version": 1}}
             )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Username or email already registered")
+
+        if 'username' in user_update and user_update["username"] != actual_user["username"]:
+            # Copies of the username in recipes, reviews, collections and follow
+            # lists are updated by a background job once the response is sent
+            await enqueue_rename(db, id, actual_user["username"], user_update["username"])
+            background_tasks.add_task(run_pending_jobs, db)
 
         if update_result.modified_count == 1:
             if (
@@ -204,13 +230,15 @@ async def delete_user(id: str, db: AsyncIOMotorClient = Depends(get_database), c
         raise HTTPException(status_code=404, detail=f"User {id} not found")
 
     # Compare the current_user with the username of the fetched user
-    if current_user["username"] != user_to_delete["username"]:
+    if current_user["user_id"] != user_to_delete["_id"]:
         raise HTTPException(
             status_code=403, detail="Forbidden: You don't have permission to delete this user.")
 
     delete_result = await db["users"].delete_one({"_id": id})
 
     if delete_result.deleted_count == 1:
+        await remove_user_edges(db, id)
+        await timelines.remove_user(db, id)
         return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "User successfully deleted"})
 
     raise HTTPException(status_code=404, detail=f"User {id} not found")
@@ -239,12 +267,18 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     else:
         user = await db["users"].find_one({"username": form_data.username})
 
-    if not user or not verify_password(form_data.password, user["password"]):
+    verified, new_hash = await verify_and_update(form_data.password, user["password"]) if user else (False, None)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Upgrade hashes made with an outdated work factor, unless the password changed meanwhile
+    if new_hash:
+        await db["users"].update_one({"_id": user["_id"], "password": user["password"]}, {"$set": {"password": new_hash}})
+
     # Convert the user ID (if it's an ObjectId from MongoDB) to string
     user_id = str(user["_id"])
     username = user["username"]
@@ -253,22 +287,29 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@router.post("/logout", response_description="Revoke the current token")
+async def logout(token: str = Depends(oauth2_scheme), db: AsyncIOMotorClient = Depends(get_database), current_user: str = Depends(get_current_user)):
+    await revoke_token(db, token)
+    return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Successfully logged out"})
+
+
 @router.post("/password_recovery", response_description="Password recovery")
-async def password_recovery(request: Request, document: PasswordRecoveryModel, db: AsyncIOMotorClient = Depends(get_database)):
+async def password_recovery(request: Request, document: PasswordRecoveryModel, db: AsyncIOMotorClient = Depends(get_database), mailer: MailQueue = Depends(get_mailer)):
     # Remove any existing password recovery documents for this email
     deleted_documents = await db["password_recovery"].delete_many({"email": document.email})
     if not deleted_documents:
         raise HTTPException(
             status_code=500, detail="Something went wrong")
-    document = jsonable_encoder(document)
+    document = to_document(document)
     nonhashed_verification_code = document["verification_code"]
-    document["verification_code"] = hash_password(
+    document["verification_code"] = await hash_password_async(
         str(document["verification_code"]))
     # Create a new password recovery document
     created_document = await db["password_recovery"].insert_one(document)
     if created_document:
-        # Send email with verification code
-        send_email(document["email"], nonhashed_verification_code)
+        # Queue the email with the verification code
+        if not send_email(mailer, document["email"], nonhashed_verification_code):
+            raise HTTPException(status_code=503, detail="Could not send the verification email, try again later")
         return JSONResponse(status_code=status.HTTP_201_CREATED, content={"message": "Password recovery document created"})
     raise HTTPException(status_code=500, detail="Something went wrong")
 
@@ -277,7 +318,7 @@ async def password_recovery(request: Request, document: PasswordRecoveryModel, d
 async def update_password(email: str, verification_code: int, user: UpdateUserModel = Body(...), db: AsyncIOMotorClient = Depends(get_database)):
     document = await db["password_recovery"].find_one({"email": email})
     if document:
-        if verify_password(str(verification_code), document["verification_code"]):
+        if await verify_password_async(str(verification_code), document["verification_code"]):
             # Delete the password recovery document
             deleted_document = await db["password_recovery"].delete_one({"email": email})
             if not deleted_document:
@@ -285,13 +326,13 @@ async def update_password(email: str, verification_code: int, user: UpdateUserMo
                     status_code=500, detail="Something went wrong")
             # Rehash the password if it's being updated
             if user.password:
-                user.password = hash_password(user.password)
+                user.password = await hash_password_async(user.password)
             user = {k: v for k, v in user.model_dump().items()
                     if v is not None}
 
             if len(user) >= 1:
                 update_result = await db["users"].update_one(
-                    {"email": email}, {"$set": user}
+                    {"email": email}, {"$set": user, "$inc": {"version": 1}}
                 )
 
                 if update_result.modified_count == 1:
@@ -314,138 +355,98 @@ async def update_password(email: str, verification_code: int, user: UpdateUserMo
     raise HTTPException(status_code=404, detail=f"Email {email} not found")
 
 @router.post("/follow/{username}", response_description="Follow a user by username")
-async def follow_user(username: str, current_user: str = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database)):
-    # Retrieve the current user from the database
-    actual_user = await db["users"].find_one({"_id": current_user["user_id"]})
-
-    # Find the target user by username
-    target_user = await db["users"].find_one({"username": username})
+async def follow_user(username: str, background_tasks: BackgroundTasks, current_user: str = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database), users: UserLoader = Depends(get_user_loader)):
+    target_user = await users.load_by_username(username)
 
     if not target_user:
         raise HTTPException(status_code=404, detail=f"User {username} not found")
 
-    target_username = target_user["username"]
-
     # Prevent self-follow
-    if target_username == actual_user["username"]:
+    if target_user["_id"] == current_user["user_id"]:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
 
-    # Check if the target user is already in the current user's following list
-    if target_username in actual_user["following"]:
+    # The edge is unique, so following twice is detected by the insert itself
+    if not await follow(db, current_user["user_id"], target_user["_id"]):
         raise HTTPException(status_code=400, detail=f"You are already following user {username}")
 
-    # Update the current user's following list
-    await db["users"].update_one(
-        {"username": actual_user["username"]},
-        {"$addToSet": {"following": target_username}}
-    )
-
-    # Update the target user's followers list
-    await db["users"].update_one(
-        {"username": target_username},
-        {"$addToSet": {"followers": actual_user["username"]}}
-    )
+    # Add the user's latest recipes to the follower's timeline once the response is sent
+    background_tasks.add_task(timelines.add_author, db, current_user["user_id"], target_user["_id"])
 
     return {"message": f"Now following user {username}"}
 
 @router.post("/unfollow/{username}", response_description="Unfollow a user by username")
-async def unfollow_user(username: str, current_user: str = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database)):
-    # Retrieve the current user from the database
-    actual_user = await db["users"].find_one({"_id": current_user["user_id"]})
-
-    # Find the target user by username
-    target_user = await db["users"].find_one({"username": username})
+async def unfollow_user(username: str, background_tasks: BackgroundTasks, current_user: str = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database), users: UserLoader = Depends(get_user_loader)):
+    target_user = await users.load_by_username(username)
     if not target_user:
         raise HTTPException(status_code=404, detail=f"User {username} not found")
 
-    target_username = target_user["username"]
-
-    # Check if the target user is in the current user's following list
-    if target_username not in actual_user["following"]:
-        raise HTTPException(status_code=400, detail=f"You are not following user {username}")
-
     # Check if the target user is the same as the current user
-    if target_username == actual_user["username"]:
+    if target_user["_id"] == current_user["user_id"]:
         raise HTTPException(status_code=400, detail="Cannot unfollow yourself")
 
-    # Update the current user's following list
-    await db["users"].update_one(
-        {"username": actual_user["username"]},
-        {"$pull": {"following": target_username}}
-    )
+    if not await unfollow(db, current_user["user_id"], target_user["_id"]):
+        raise HTTPException(status_code=400, detail=f"You are not following user {username}")
 
-    # Update the target user's followers list
-    await db["users"].update_one(
-        {"username": target_username},
-        {"$pull": {"followers": actual_user["username"]}}
-    )
+    background_tasks.add_task(timelines.remove_author, db, current_user["user_id"], target_user["_id"])
 
     return {"message": f"Unfollowed user {username}"}
 
+async def list_follow_edges(db, users: UserLoader, query: dict, user_field: str, size: int, cursor: str):
+    """Return a page of follow edges, newest first, as the public profiles of the users on one side."""
+    edges, next_cursor = await find_page(db[FOLLOWS_COLLECTION], query, "created_at", False, size, cursor)
+    profiles = await users.load_many([edge[user_field] for edge in edges])
+    return {
+        "users": [{field: profile.get(field) for field in USER_SUMMARY_FIELDS} for profile in profiles if profile],
+        "next_cursor": next_cursor,
+    }
+
+@router.get("/{username}/followers", response_description="List the followers of a user, newest first")
+async def list_followers(username: str, size: int = Query(20, ge=1, le=100), cursor: str = "", db: AsyncIOMotorClient = Depends(get_database), users: UserLoader = Depends(get_user_loader)):
+    target_user = await users.load_by_username(username)
+    if not target_user:
+        raise HTTPException(status_code=404, detail=f"User {username} not found")
+
+    return await list_follow_edges(db, users, {"followee_id": target_user["_id"]}, "follower_id", size, cursor)
+
+@router.get("/{username}/following", response_description="List the users a user follows, newest first")
+async def list_following(username: str, size: int = Query(20, ge=1, le=100), cursor: str = "", db: AsyncIOMotorClient = Depends(get_database), users: UserLoader = Depends(get_user_loader)):
+    target_user = await users.load_by_username(username)
+    if not target_user:
+        raise HTTPException(status_code=404, detail=f"User {username} not found")
 
-def send_email(email: str, verification_code: int):
-    port = 465  # For SSL
-    smtp_server = "smtp.gmail.com"
-    sender_email = os.environ.get('EMAIL_USER')  # Fetching from environment variable
-    receiver_email = email
-    password = os.environ.get('EMAIL_PASS')      # Fetching from environment variable
-    message = f"""\
-    From: Kasulà <{sender_email}>
-    To: {receiver_email}
-    Subject: Password Recovery
-
-    Your verification code is: {verification_code}"""
-
-    message = message.encode("utf-8")
-    context = ssl.create_default_context()
-    with smtplib.SMTP_SSL(smtp_server, port, context=context) as server:
-        server.login(sender_email, password)
-        server.sendmail(
-            sender_email, receiver_email, message)
-
-def send_welcome_email(email: str):
-    port = 465  # For SSL
-    smtp_server = "smtp.gmail.com"
-    sender_email = os.environ.get('EMAIL_USER')  # Fetching from environment variable
-    receiver_email = email
-    password = os.environ.get('EMAIL_PASS')      # Fetching from environment variable
+    return await list_follow_edges(db, users, {"follower_id": target_user["_id"]}, "followee_id", size, cursor)
+
+
+def send_email(mailer: MailQueue, email: str, verification_code: int) -> bool:
+    sender_email = settings.EMAIL_USER
+
+    # Create the email message
+    message = MIMEText(f"Your verification code is: {verification_code}", 'plain', 'utf-8')
+    message['From'] = f"Kasulà <{sender_email}>"
+    message['To'] = email
+    message['Subject'] = "Password Recovery"
+
+    return mailer.enqueue(message)
+
+def send_welcome_email(mailer: MailQueue, email: str) -> bool:
+    sender_email = settings.EMAIL_USER
 
     # Create the email message
     subject = "Welcome to Kasulà!"
     body = "Thank you for registering with us! We are excited to have you on board."
     message = MIMEText(body, 'plain')
     message['From'] = f"Kasulà <{sender_email}>"
-    message['To'] = receiver_email
+    message['To'] = email
     message['Subject'] = subject
 
-    context = ssl.create_default_context()
-    with smtplib.SMTP_SSL(smtp_server, port, context=context) as server:
-        server.login(sender_email, password)
-        server.send_message(message)
-
-async def upload_image(file: UploadFile, name):
-    storage_client = storage.Client(project=project_name)
-    bucket = storage_client.get_bucket(bucket_name)
-    point = name.rindex('.')
-    fullname = 'recipes/' + name[:point].replace(" ", "_") + '-' + str(time.time_ns()) + name[point:]
-    blob = bucket.blob(fullname)
-    
-    data = await file.read()
-    UPLOAD_DIR = Path('')
-    save_to = UPLOAD_DIR / file.filename
-    with open(save_to, "wb") as f:
-        f.write(data)
-    blob.upload_from_filename(save_to)
-    os.remove(save_to)
-    
-    return fullname
+    return mailer.enqueue(message)
 
 @router.get("/new/discover", response_description="List all users randomly")
-async def list_users_randomly(current_user: str = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database)):
+async def list_users_randomly(current_user: str = Depends(get_current_user), db: AsyncIOMotorClient = Depends(get_database), users: UserLoader = Depends(get_user_loader)):
     # Retrieve the current user from the database
-    actual_user = await db["users"].find_one({"_id": current_user["user_id"]})
+    actual_user = await users.load(current_user["user_id"])
 
-    if not actual_user["following"]:
+    if not actual_user.get("following_count", 0):
         users = []
         for doc in await db["users"].aggregate([{"$match": {"_id": {"$ne": actual_user["_id"]}}}, {"$sample": {"size": 10}}]).to_list(length=10):
             if isinstance(doc["_id"], ObjectId):
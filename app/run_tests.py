@@ -11,7 +11,8 @@ from app.config import settings
 
 # Import the test functions
 from tests import test_user_endpoints, test_recipe_endpoints, test_review_endpoints
-from tests import test_collection_endpoints, test_security_hashing, test_token
+from tests import test_collection_endpoints, test_security_hashing, test_token, test_indexes, test_migrations
+from tests import test_loaders, test_storage, test_similarity, test_mail, test_jobs, test_timelines, test_foryou, test_responses, test_counts, test_search
 from tests.test_user_endpoints import TestAssertionError
 
 def run_single_test(test_func, client, extra=False):
@@ -48,10 +49,17 @@ def run_tests():
             test_user_endpoints.test_get_me,
             test_user_endpoints.test_show_user,
             test_user_endpoints.test_update_user,
+            test_user_endpoints.test_update_user_taken_username,
+            test_user_endpoints.test_create_user_concurrent,
             test_user_endpoints.test_delete_user,
             test_user_endpoints.test_login_for_access_token,
             test_user_endpoints.test_follow_user,
             test_user_endpoints.test_unfollow_user,
+            test_user_endpoints.test_logout,
+            test_user_endpoints.test_update_username_propagation,
+            test_user_endpoints.test_list_followers,
+            test_user_endpoints.test_show_user_conditional,
+            test_user_endpoints.test_show_users_batch,
     ]
 
     recipe_test_functions = [
@@ -60,6 +68,17 @@ def run_tests():
         test_recipe_endpoints.test_show_recipe,
         test_recipe_endpoints.test_update_recipe,
         test_recipe_endpoints.test_delete_recipe,
+        test_recipe_endpoints.test_get_magic_recipes_cursor,
+        test_recipe_endpoints.test_get_magic_recipes_cursor_updated_at,
+        test_recipe_endpoints.test_get_magic_recipes_search,
+        test_recipe_endpoints.test_list_recipes_card_view,
+        test_recipe_endpoints.test_list_similar_recipes,
+        test_recipe_endpoints.test_list_similar_recipes_private,
+        test_recipe_endpoints.test_get_following_feed,
+        test_recipe_endpoints.test_get_foryou_feed,
+        test_recipe_endpoints.test_show_recipe_conditional,
+        test_recipe_endpoints.test_get_magic_recipes_total,
+        test_recipe_endpoints.test_show_recipes_batch,
     ]
 
     review_test_functions = [
@@ -67,6 +86,10 @@ def run_tests():
         test_review_endpoints.test_update_review,
         test_review_endpoints.test_delete_review,
         test_review_endpoints.test_get_reviews,
+        test_review_endpoints.test_review_rating_counters,
+        test_review_endpoints.test_rating_change_conflict,
+        test_review_endpoints.test_like_review,
+        test_review_endpoints.test_review_page_cache,
     ]
 
     collections_test_functions = [
@@ -78,7 +101,9 @@ def run_tests():
         test_collection_endpoints.test_remove_recipe_from_collection,
         test_collection_endpoints.test_list_collections_by_user,
         test_collection_endpoints.test_list_recipes_in_collection,
+        test_collection_endpoints.test_list_recipes_in_collection_pages,
         test_collection_endpoints.test_get_favorites_collection,
+        test_collection_endpoints.test_collections_after_rename,
         test_collection_endpoints.test_add_recipe_favorite_collection,
         test_collection_endpoints.test_remove_recipe_favorite_collection,
     ]
@@ -86,12 +111,85 @@ def run_tests():
     security_hashing_test_functions = [
         test_security_hashing.test_hash_password,
         test_security_hashing.test_verify_password,
+        test_security_hashing.test_needs_rehash,
+        test_security_hashing.test_verify_and_update,
     ]
 
     token_test_functions = [
         test_token.test_create_access_token_default_expires,
         test_token.test_create_access_token_custom_expires,
         test_token.test_create_access_token_with_additional_data,
+        test_token.test_get_current_user_cache,
+        test_token.test_revoke_token,
+        test_token.test_reload_revoked_tokens,
+    ]
+
+    index_test_functions = [
+        test_indexes.test_ensure_indexes_idempotent,
+        test_indexes.test_ensure_indexes_conflict,
+    ]
+
+    loader_test_functions = [
+        test_loaders.test_user_loader_batches_lookups,
+        test_loaders.test_user_loader_failure,
+    ]
+
+    storage_test_functions = [
+        test_storage.test_local_storage_streams_upload,
+        test_storage.test_local_storage_rejects_large_upload,
+        test_storage.test_local_storage_upload_many,
+        test_storage.test_incomplete_storage_backend,
+    ]
+
+    similarity_test_functions = [
+        test_similarity.test_normalize_ingredient,
+        test_similarity.test_similarity_index,
+        test_similarity.test_similarity_visibility,
+    ]
+
+    mail_test_functions = [
+        test_mail.test_mail_queue_sends_in_background,
+        test_mail.test_mail_queue_retries,
+        test_mail.test_mail_queue_is_bounded,
+    ]
+
+    job_test_functions = [
+        test_jobs.test_rename_job,
+        test_jobs.test_rename_job_batches,
+        test_jobs.test_job_claims,
+    ]
+
+    timeline_test_functions = [
+        test_timelines.test_timeline_fan_out,
+        test_timelines.test_timeline_fan_out_on_read,
+    ]
+
+    foryou_test_functions = [
+        test_foryou.test_score_recipe,
+        test_foryou.test_foryou_pool,
+        test_foryou.test_foryou_pool_refresh,
+    ]
+
+    response_test_functions = [
+        test_responses.test_fast_json_response,
+        test_responses.test_to_document,
+    ]
+
+    count_test_functions = [
+        test_counts.test_count_key,
+        test_counts.test_cached_count,
+    ]
+
+    search_test_functions = [
+        test_search.test_search_recipe_ids,
+    ]
+
+    migration_test_functions = [
+        test_migrations.test_migrate_embedded_reviews,
+        test_migrations.test_migrate_liked_by_ids,
+        test_migrations.test_backfill_rating_counters,
+        test_migrations.test_migrate_follow_lists,
+        test_migrations.test_migrate_follow_lists_recounts,
     ]
     
     # Unit tests
@@ -188,6 +286,78 @@ def run_tests():
     print("=" * 40 + "\n")
     [run_single_test(test_func, client, True) for test_func in token_test_functions]
 
+    # Index tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "INDEX TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in index_test_functions]
+
+    # Migration tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "MIGRATION TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in migration_test_functions]
+
+    # Loader tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "LOADER TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in loader_test_functions]
+
+    # Storage tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "STORAGE TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in storage_test_functions]
+
+    # Similarity tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "SIMILARITY TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in similarity_test_functions]
+
+    # Mail tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "MAIL TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in mail_test_functions]
+
+    # Job tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "JOB TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in job_test_functions]
+
+    # Timeline tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "TIMELINE TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in timeline_test_functions]
+
+    # Foryou tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "FORYOU TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in foryou_test_functions]
+
+    # Response tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "RESPONSE TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in response_test_functions]
+
+    # Count tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "COUNT TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in count_test_functions]
+
+    # Search tests
+    print("\n" + "=" * 40)
+    print(" " * 12 + "SEARCH TESTS" + " " * 12)
+    print("=" * 40 + "\n")
+    [run_single_test(test_func, client, True) for test_func in search_test_functions]
+
     cov.stop()
     cov.save()
 
@@ -1,3 +1,4 @@
+import tempfile
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
@@ -5,6 +6,14 @@ from mongomock_motor import AsyncMongoMockClient
 
 from app.config import settings
 from app.routers import user_router, recipe_router, review_router, collection_router
+from app.utils.indexes import ensure_indexes
+from app.utils.loaders import user_loader_metrics
+from app.utils.storage import LocalImageStorage
+from app.utils.similarity import build_similarity_index
+from app.utils.foryou import build_foryou_pool
+from app.utils.token import load_revoked_tokens
+from app.utils.mail import MailQueue, SinkTransport
+from app.utils.responses import FastJSONResponse
 
 # Define the startup and shutdown logic using async context manager
 @asynccontextmanager
@@ -13,15 +22,23 @@ async def app_lifespan(app: FastAPI):
     # Startup logic
     app.mongodb_client = AsyncMongoMockClient()
     app.mongodb = app.mongodb_client[settings.DB_TEST]
-    
+    await ensure_indexes(app.mongodb)
+    app.storage = LocalImageStorage(tempfile.mkdtemp(), settings.STORAGE_LOCAL_URL, settings.MAX_UPLOAD_BYTES, settings.UPLOAD_CONCURRENCY)
+    app.similarity = await build_similarity_index(app.mongodb)
+    app.foryou = await build_foryou_pool(app.mongodb)
+    await load_revoked_tokens(app.mongodb)
+    app.mailer = MailQueue(SinkTransport, workers=1)
+    await app.mailer.start()
+
     yield  # The application runs while this yield is active
 
     # Shutdown logic
     settings.TEST_ENV = False
+    await app.mailer.stop()
     app.mongodb_client.close()
 
 # Initialize FastAPI with the new lifespan parameter
-unit_tests = FastAPI(lifespan=app_lifespan)
+unit_tests = FastAPI(lifespan=app_lifespan, default_response_class=FastJSONResponse)
 
 # CORS and other configurations
 origins = ["*"]
@@ -31,8 +48,12 @@ unit_tests.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-User-DB-Calls", "X-Total-Count"],
 )
 
+# Report the number of user queries each request needed
+unit_tests.middleware("http")(user_loader_metrics)
+
 # Include your routers
 unit_tests.include_router(user_router.router, tags=["users"], prefix="/user")
 unit_tests.include_router(recipe_router.router, tags=["recipes"], prefix="/recipe")
@@ -748,4 +748,116 @@ def test_remove_recipe_favorite_collection(client):
     
     # Cleanup
     delete_created_recipe(created_recipe_id, access_token, client)
-    delete_created_user(user_id, access_token, client)
\ No newline at end of file
+    delete_created_user(user_id, access_token, client)
+
+def test_list_recipes_in_collection_pages(client):
+    user = {
+        "username": "pages_user",
+        "email": "pages_user@example.com",
+        "password": "testpassword"
+    }
+    user_id = client.post("/user/", json=user).json()["_id"]
+    response_token = client.post("/user/token", data={"username": "pages_user", "password": "testpassword"})
+    access_token = response_token.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    collection = {"name": "Pages Collection", "description": "Paginated", "recipe_ids": []}
+    collection_id = client.post("/collection/", json=collection, headers=headers).json()["_id"]
+
+    recipe_ids = []
+    for name in ("Pages 1", "Pages 2", "Pages 3"):
+        recipe = {
+            "name": name,
+            "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+            "instructions": [{"body": "Pour Water", "step_number": 0}],
+            "cooking_time": 1,
+            "difficulty": 0
+        }
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=headers)
+        recipe_ids.append(response.json()["_id"])
+
+    def cleanup():
+        for recipe_id in recipe_ids:
+            delete_created_recipe(recipe_id, access_token, client)
+        delete_created_collection(collection_id, access_token, client)
+        delete_created_user(user_id, access_token, client)
+
+    # The collection keeps the order recipes were added in
+    for recipe_id in (recipe_ids[2], recipe_ids[0], recipe_ids[1]):
+        client.put(f"/collection/{collection_id}/add_recipe/{recipe_id}", headers=headers)
+
+    # A deleted recipe is skipped and pruned from the collection
+    delete_created_recipe(recipe_ids.pop(0), access_token, client)
+
+    params = {"size": 1, "cursor": "", "view": "card"}
+    response = client.get(f"/collection/{collection_id}/recipes", params=params, headers=headers)
+
+    if (response.status_code != 200
+        or [r["name"] for r in response.json()["recipes"]] != ["Pages 3"]
+        or response.json()["next_cursor"] is None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    params["cursor"] = response.json()["next_cursor"]
+    response = client.get(f"/collection/{collection_id}/recipes", params=params, headers=headers)
+
+    if (response.status_code != 200
+        or [r["name"] for r in response.json()["recipes"]] != ["Pages 2"]
+        or response.json()["next_cursor"] is not None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    response = client.get("/collection/user/pages_user", headers=headers)
+    collection = next(c for c in response.json() if c["_id"] == collection_id)
+
+    if collection["recipe_ids"] != [recipe_ids[1], recipe_ids[0]]:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Without a cursor the first page is returned as a list
+    response = client.get(f"/collection/{collection_id}/recipes", headers=headers)
+
+    if response.status_code != 200 or [r["name"] for r in response.json()] != ["Pages 3", "Pages 2"]:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
+
+def test_collections_after_rename(client):
+    user = {
+        "username": "beforerename_test",
+        "email": "beforerename_test@example.com",
+        "password": "renamepassword"
+    }
+
+    response_user = client.post("/user/", json=user)
+    response_token = client.post("/user/token", data={"username": "beforerename_test", "password": "renamepassword"})
+    access_token = response_token.json()["access_token"]
+    user_id = response_user.json()["_id"]
+
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    # Rename the user and make it private, the token still carries the old username
+    update_data = {"username": "afterrename_test", "is_private": True}
+    response = client.put(f"/user/{user_id}", files={"user": (None, json.dumps(update_data), "application/json")}, headers=headers)
+
+    if response.status_code != 200:
+        delete_created_user(user_id, access_token, client)
+        raise TestAssertionError(response=response)
+
+    response = client.get("/collection/favorites/afterrename_test", headers=headers)
+
+    if response.status_code != 200 or response.json()["user_id"] != user_id:
+        delete_created_user(user_id, access_token, client)
+        raise TestAssertionError(response=response)
+
+    # The owner can still list its own collections while private
+    response = client.get("/collection/user/afterrename_test", headers=headers)
+
+    if response.status_code != 200 or len(response.json()) != 1:
+        delete_created_user(user_id, access_token, client)
+        raise TestAssertionError(response=response)
+
+    delete_created_user(user_id, access_token, client)
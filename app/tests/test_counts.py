@@ -0,0 +1,27 @@
+import asyncio
+from mongomock_motor import AsyncMongoMockClient
+
+from app.utils.counts import cached_count, count_cache, count_key
+
+def test_count_key():
+    assert count_key("recipes", {"a": 1, "b": {"$gte": 2}}) == count_key("recipes", {"b": {"$gte": 2}, "a": 1}), "Key order should not matter"
+    assert count_key("recipes", {"a": 1}) != count_key("recipes", {"a": 2})
+    assert count_key("recipes", {"a": 1}) != count_key("reviews", {"a": 1})
+
+def test_cached_count():
+    db = AsyncMongoMockClient()["counts_test"]
+    count_cache.clear()
+
+    async def run():
+        await db["recipes"].insert_many([{"_id": str(i), "cooking_time": i} for i in range(5)])
+
+        query = {"cooking_time": {"$gte": 2}}
+        assert await cached_count(db["recipes"], query) == 3
+        await db["recipes"].insert_one({"_id": "new", "cooking_time": 10})
+        assert await cached_count(db["recipes"], query) == 3, "Totals should be served from the cache"
+
+        count_cache.clear()
+        assert await cached_count(db["recipes"], query) == 4
+        assert await cached_count(db["recipes"], {}) == 6, "An empty filter should use the estimated count"
+
+    asyncio.run(run())
@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime, timedelta
+from mongomock_motor import AsyncMongoMockClient
+
+from app.utils.foryou import ForYouPool, score_recipe
+
+NOW = datetime(2024, 1, 31)
+
+def recipe(recipe_id, user_id, days_old, average_rating=0.0, rating_count=0):
+    return {
+        "_id": recipe_id,
+        "user_id": user_id,
+        "average_rating": average_rating,
+        "rating_count": rating_count,
+        "creation_date": (NOW - timedelta(days=days_old)).isoformat(),
+    }
+
+def test_score_recipe():
+    assert score_recipe(recipe("a", "u", 0), NOW) > score_recipe(recipe("b", "u", 30), NOW), "Newer recipes should score higher"
+    assert score_recipe(recipe("a", "u", 5, 4.8, 40), NOW) > score_recipe(recipe("b", "u", 5, 5.0, 1), NOW), "Many good ratings should beat a single perfect one"
+    assert score_recipe(recipe("a", "u", 5, 4.0, 10), NOW) > score_recipe(recipe("b", "u", 5, 2.0, 10), NOW)
+    assert score_recipe({"_id": "c", "creation_date": None}, NOW) >= 0, "Incomplete recipes should still be ranked"
+
+def test_foryou_pool():
+    pool = ForYouPool(size=4)
+    pool.rank([recipe(f"recipe{i}", f"user{i % 2}", i) for i in range(6)], NOW)
+
+    assert [entry.recipe_id for entry in pool.entries] == ["recipe0", "recipe1", "recipe2", "recipe3"], "Only the best recipes should be kept"
+
+    entries, has_more = pool.page({"user1"}, 1)
+    assert [entry.recipe_id for entry in entries] == ["recipe0"] and has_more, "Followed users should be left out"
+
+    entries, has_more = pool.page({"user1"}, 1, after=(entries[-1].score, entries[-1].recipe_id))
+    assert [entry.recipe_id for entry in entries] == ["recipe2"] and not has_more
+
+    entries, has_more = pool.page(set(), 2, start=1)
+    assert [entry.recipe_id for entry in entries] == ["recipe1", "recipe2"] and has_more
+
+    pool.remove("recipe0")
+    assert [entry.recipe_id for entry in pool.page(set(), 10)[0]] == ["recipe1", "recipe2", "recipe3"]
+
+def test_foryou_pool_refresh():
+    db = AsyncMongoMockClient()["foryou_test"]
+    asyncio.run(db["recipes"].insert_many([
+        {**recipe("new", "u", 0, 4.0, 1), "is_public": True},
+        {**recipe("rated", "u", 60, 4.8, 40), "is_public": True},
+        {**recipe("old", "u", 90), "is_public": True},
+        {**recipe("private", "u", 0), "is_public": False},
+    ]))
+
+    pool = ForYouPool(size=2)
+    asyncio.run(pool.refresh(db))
+    assert sorted(entry.recipe_id for entry in pool.entries) == ["new", "rated"], "Only the newest and most rated public recipes should be ranked"
@@ -0,0 +1,32 @@
+import asyncio
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import IndexModel, ASCENDING
+
+from app.utils.indexes import INDEXES, IndexBootstrapError, ensure_indexes
+
+def test_ensure_indexes_idempotent():
+    db = AsyncMongoMockClient()["indexes_test"]
+
+    asyncio.run(ensure_indexes(db))
+    asyncio.run(ensure_indexes(db))  # Running it twice must not fail
+
+    info = asyncio.run(db["users"].index_information())
+    assert info["username_1"].get("unique"), "users.username should be unique"
+    assert info["email_1"].get("unique"), "users.email should be unique"
+
+    for collection_name, indexes in INDEXES.items():
+        info = asyncio.run(db[collection_name].index_information())
+        for index in indexes:
+            assert index.document["name"] in info, f"Missing index {index.document['name']} on {collection_name}"
+
+def test_ensure_indexes_conflict():
+    db = AsyncMongoMockClient()["indexes_test"]
+    asyncio.run(db["users"].create_index([("username", ASCENDING)], name="username_1"))
+
+    registry = {"users": [IndexModel([("username", ASCENDING)], name="username_1", unique=True)]}
+
+    try:
+        asyncio.run(ensure_indexes(db, registry))
+    except IndexBootstrapError:
+        return
+    assert False, "A conflicting index definition should abort the bootstrap"
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timedelta
+from mongomock_motor import AsyncMongoMockClient
+
+from app.utils import jobs
+from app.utils.jobs import enqueue_rename, run_pending_jobs, JOB_HANDLERS
+
+def test_rename_job():
+    db = AsyncMongoMockClient()["jobs_test"]
+
+    async def run():
+        await db["recipes"].insert_many([{"_id": f"recipe{i}", "user_id": "id1", "username": "old", "name": "Pasta"} for i in range(5)])
+        await db["reviews"].insert_one({"_id": "review", "user_id": "id1", "username": "old"})
+        await db["collections"].insert_one({"_id": "collection", "user_id": "id1", "username": "old"})
+
+        job_id = await enqueue_rename(db, "id1", "old", "new")
+        await run_pending_jobs(db)
+
+        assert await db["recipes"].count_documents({"username": "new"}) == 5, "Recipes should carry the new username"
+        assert (await db["reviews"].find_one({"_id": "review"}))["username"] == "new"
+        assert (await db["collections"].find_one({"_id": "collection"}))["username"] == "new"
+
+        search = await db["recipe_search"].find_one({"_id": "recipe0"})
+        assert search["username"] == ["new"], "The search index should be refreshed"
+
+        job = await db["jobs"].find_one({"_id": job_id})
+        assert job["status"] == "done" and job["progress"] == {"recipes": 5, "reviews": 1, "collections": 1}
+
+        # Running an interrupted job again is harmless
+        stale = datetime.utcnow() - timedelta(seconds=jobs.STALE_AFTER + 1)
+        await db["jobs"].update_one({"_id": job_id}, {"$set": {"status": "running", "attempts": 1, "updated_at": stale}})
+        await run_pending_jobs(db)
+        job = await db["jobs"].find_one({"_id": job_id})
+        assert job["status"] == "done" and job["progress"]["recipes"] == 5, "A retried job should not update documents twice"
+
+    asyncio.run(run())
+
+def test_rename_job_batches():
+    db = AsyncMongoMockClient()["jobs_test"]
+    batch_size = jobs.BATCH_SIZE
+    jobs.BATCH_SIZE = 2
+
+    async def run():
+        await db["recipes"].insert_many([{"_id": f"recipe{i}", "user_id": "id1", "username": "old"} for i in range(5)])
+        await enqueue_rename(db, "id1", "old", "new")
+        await run_pending_jobs(db)
+        assert await db["recipes"].count_documents({"username": "new"}) == 5, "Every chunk should be processed"
+
+    try:
+        asyncio.run(run())
+    finally:
+        jobs.BATCH_SIZE = batch_size
+
+def test_job_claims():
+    db = AsyncMongoMockClient()["jobs_test"]
+    retry_backoff = jobs.RETRY_BACKOFF
+    jobs.RETRY_BACKOFF = 0
+    calls = []
+
+    async def failing_job(db, job):
+        calls.append(job["_id"])
+        raise RuntimeError("Storage is down")
+
+    async def run():
+        JOB_HANDLERS["failing"] = failing_job
+        now = datetime.utcnow()
+        await db["jobs"].insert_many([
+            {"_id": "failing", "type": "failing", "status": "pending", "attempts": 0, "created_at": now, "updated_at": now},
+            # Claimed by a live worker elsewhere
+            {"_id": "claimed", "type": "failing", "status": "running", "attempts": 1, "created_at": now, "updated_at": now},
+        ])
+
+        await run_pending_jobs(db)
+        job = await db["jobs"].find_one({"_id": "failing"})
+        assert calls == ["failing"] * jobs.MAX_ATTEMPTS, "Jobs should run once per attempt and never while claimed elsewhere"
+        assert job["status"] == "failed" and job["attempts"] == jobs.MAX_ATTEMPTS and job["error"] == "Storage is down"
+
+        await run_pending_jobs(db)
+        assert len(calls) == jobs.MAX_ATTEMPTS, "Jobs out of attempts should not be retried"
+
+        # A job whose worker stopped updating it is claimed again
+        stale = now - timedelta(seconds=jobs.STALE_AFTER + 1)
+        await db["jobs"].update_one({"_id": "claimed"}, {"$set": {"updated_at": stale}})
+        await run_pending_jobs(db)
+        assert calls.count("claimed") == jobs.MAX_ATTEMPTS - 1, "A stale job should run with the attempts it has left"
+
+    try:
+        asyncio.run(run())
+    finally:
+        jobs.RETRY_BACKOFF = retry_backoff
+        JOB_HANDLERS.pop("failing", None)
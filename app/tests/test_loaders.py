@@ -0,0 +1,44 @@
+import asyncio
+from mongomock_motor import AsyncMongoMockClient
+
+from app.utils.loaders import UserLoader
+
+def test_user_loader_batches_lookups():
+    db = AsyncMongoMockClient()["loaders_test"]
+    asyncio.run(db["users"].insert_many([
+        {"_id": "id1", "username": "user1"},
+        {"_id": "id2", "username": "user2"},
+    ]))
+
+    async def run():
+        loader = UserLoader(db)
+        user1, user2, missing = await asyncio.gather(
+            loader.load("id1"), loader.load_by_username("user2"), loader.load("unknown")
+        )
+        assert user1["username"] == "user1" and user2["_id"] == "id2", "Users should be resolved by id and username"
+        assert missing is None, "Unknown users should resolve to None"
+        assert loader.db_calls == 1, "Lookups in the same iteration should share one query"
+        assert not loader._tasks, "Finished dispatches should be released"
+
+        # Cached users are served without querying again, by either key
+        assert (await loader.load_by_username("user1"))["_id"] == "id1"
+        assert await loader.load("unknown") is None
+        assert loader.db_calls == 1, "Cached lookups should not query the database"
+
+        # Returned documents are copies of the cached ones
+        user1.pop("username")
+        assert (await loader.load("id1"))["username"] == "user1", "Callers should not modify the cache"
+
+    asyncio.run(run())
+
+def test_user_loader_failure():
+    class FailingDatabase:
+        def __getitem__(self, name):
+            raise RuntimeError("database unavailable")
+
+    async def run():
+        loader = UserLoader(FailingDatabase())
+        results = await asyncio.gather(loader.load("id1"), loader.load_by_username("user2"), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results), "Query errors should reach every caller"
+
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+import asyncio
+from email.mime.text import MIMEText
+
+from app.utils.mail import MailQueue, SinkTransport
+
+def message(to):
+    mail = MIMEText("body", "plain")
+    mail["To"] = to
+    mail["Subject"] = "Test"
+    return mail
+
+class FlakyTransport(SinkTransport):
+    """Sink failing the first sends, to exercise the retries."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def send(self, message):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("SMTP server unavailable")
+        super().send(message)
+
+def test_mail_queue_sends_in_background():
+    async def run():
+        mailer = MailQueue(SinkTransport, workers=2)
+        await mailer.start()
+
+        assert all(mailer.enqueue(message(f"user{i}@example.com")) for i in range(5))
+        await mailer.join()
+
+        sent = sorted(mail["To"] for transport in mailer.transports for mail in transport.sent)
+        assert sent == [f"user{i}@example.com" for i in range(5)], "Every queued message should be sent once"
+        await mailer.stop()
+
+    asyncio.run(run())
+
+def test_mail_queue_retries():
+    async def run():
+        transport = FlakyTransport(failures=2)
+        mailer = MailQueue(lambda: transport, workers=1, max_retries=2, backoff=0.001)
+        await mailer.start()
+
+        mailer.enqueue(message("user@example.com"))
+        await mailer.join()
+        assert len(transport.sent) == 1 and transport.attempts == 3, "Failed sends should be retried"
+
+        # Messages are dropped once the retries are exhausted
+        transport.failures, transport.attempts = 10, 0
+        mailer.enqueue(message("user@example.com"))
+        await mailer.join()
+        assert len(transport.sent) == 1 and transport.attempts == 3 and mailer.failed == 1
+        await mailer.stop()
+
+    asyncio.run(run())
+
+def test_mail_queue_is_bounded():
+    async def run():
+        # Without workers nothing is consumed, so the queue fills up
+        mailer = MailQueue(SinkTransport, workers=0, maxsize=2)
+        assert mailer.enqueue(message("first@example.com"))
+        assert mailer.enqueue(message("second@example.com"))
+        assert not mailer.enqueue(message("third@example.com")), "A full queue should reject messages"
+
+    asyncio.run(run())
@@ -0,0 +1,113 @@
+import asyncio
+from mongomock_motor import AsyncMongoMockClient
+
+from app.utils.follows import follow
+from app.utils.indexes import ensure_indexes
+from app.utils.migrations import migrate_embedded_reviews, migrate_liked_by_ids, backfill_rating_counters, migrate_follow_lists
+
+def test_migrate_embedded_reviews():
+    db = AsyncMongoMockClient()["migrations_test"]
+    asyncio.run(ensure_indexes(db))
+
+    reviews = [
+        {"_id": "review1", "username": "user1", "user_id": "user1", "rating": 5, "likes": 0, "liked_by": []},
+        {"_id": "review2", "username": "user2", "user_id": "user2", "rating": 3, "likes": 1, "liked_by": ["user1"]},
+    ]
+    asyncio.run(db["recipes"].insert_many([
+        {"_id": "recipe1", "name": "Recipe 1", "reviews": reviews},
+        {"_id": "recipe2", "name": "Recipe 2", "reviews": []},
+    ]))
+
+    assert asyncio.run(migrate_embedded_reviews(db, batch_size=1)) == 2, "Both reviews should be migrated"
+    # Running the migration again must be a no-op
+    assert asyncio.run(migrate_embedded_reviews(db)) == 0, "A second run should not migrate anything"
+
+    migrated = asyncio.run(db["reviews"].find({"recipe_id": "recipe1"}).to_list(None))
+    assert sorted(review["_id"] for review in migrated) == ["review1", "review2"], "Reviews should keep their ids"
+
+    remaining = asyncio.run(db["recipes"].count_documents({"reviews": {"$exists": True}}))
+    assert remaining == 0, "Embedded reviews should be removed from the recipes"
+
+def test_backfill_rating_counters():
+    db = AsyncMongoMockClient()["migrations_test"]
+
+    asyncio.run(db["recipes"].insert_many([
+        {"_id": "recipe1", "name": "Recipe 1", "average_rating": 0.0},
+        {"_id": "recipe2", "name": "Recipe 2"},
+    ]))
+    asyncio.run(db["reviews"].insert_many([
+        {"_id": "review1", "recipe_id": "recipe1", "user_id": "user1", "rating": 5},
+        {"_id": "review2", "recipe_id": "recipe1", "user_id": "user2", "rating": 3.5},
+    ]))
+
+    assert asyncio.run(backfill_rating_counters(db)) == 2, "Every recipe should be backfilled"
+
+    recipe1 = asyncio.run(db["recipes"].find_one({"_id": "recipe1"}))
+    assert recipe1["rating_sum"] == 8.5 and recipe1["rating_count"] == 2, "Counters should match the reviews"
+    assert recipe1["average_rating"] == 4.25, "The average should be derived from the counters"
+
+    recipe2 = asyncio.run(db["recipes"].find_one({"_id": "recipe2"}))
+    assert recipe2["rating_count"] == 0 and recipe2["average_rating"] == 0.0, "Recipes without reviews should start at zero"
+
+def test_migrate_follow_lists():
+    db = AsyncMongoMockClient()["migrations_test"]
+
+    asyncio.run(db["users"].insert_many([
+        {"_id": "id1", "username": "user1", "followers": [], "following": ["user2", "user3", "deleted"]},
+        {"_id": "id2", "username": "user2", "followers": ["user1"], "following": []},
+        # Lists that disagree with the other side are merged
+        {"_id": "id3", "username": "user3", "followers": ["user2"], "following": []},
+    ]))
+
+    assert asyncio.run(migrate_follow_lists(db, batch_size=2)) == 4, "Each user should migrate its own edges"
+    asyncio.run(migrate_follow_lists(db))
+
+    edges = asyncio.run(db["follows"].find().to_list(None))
+    assert sorted(edge["_id"] for edge in edges) == ["id1:id2", "id1:id3", "id2:id3"], "Every follow should become one edge"
+
+    users = {user["_id"]: user for user in asyncio.run(db["users"].find().to_list(None))}
+    assert [(users[i]["follower_count"], users[i]["following_count"]) for i in ("id1", "id2", "id3")] == [(0, 2), (1, 1), (2, 0)]
+    assert all("followers" not in user and "following" not in user for user in users.values()), "The lists should be removed"
+
+def test_migrate_follow_lists_recounts():
+    db = AsyncMongoMockClient()["migrations_test"]
+
+    # Already migrated users whose counters drifted from the edges
+    asyncio.run(db["users"].insert_many([
+        {"_id": "id1", "username": "user1", "follower_count": 3, "following_count": 0},
+        {"_id": "id2", "username": "user2", "follower_count": 0, "following_count": 0},
+    ]))
+    asyncio.run(follow(db, "id1", "id2"))
+    asyncio.run(db["follows"].insert_one({"_id": "id2:id1", "follower_id": "id2", "followee_id": "id1"}))
+
+    assert asyncio.run(migrate_follow_lists(db)) == 0, "There are no lists left to migrate"
+
+    users = {user["_id"]: user for user in asyncio.run(db["users"].find().to_list(None))}
+    assert [(users[i]["follower_count"], users[i]["following_count"]) for i in ("id1", "id2")] == [(1, 1), (1, 1)]
+
+def test_migrate_liked_by_ids():
+    db = AsyncMongoMockClient()["migrations_test"]
+
+    asyncio.run(db["users"].insert_many([
+        {"_id": "id1", "username": "user1"},
+        {"_id": "id2", "username": "user2"},
+    ]))
+    asyncio.run(db["recipes"].insert_one({"_id": "recipe1", "reviews_version": 0}))
+    asyncio.run(db["reviews"].insert_many([
+        {"_id": "review1", "recipe_id": "recipe1", "likes": 2, "liked_by": ["user1", "user2"]},
+        # Liked again under the new id after a rename, and by a deleted user
+        {"_id": "review2", "recipe_id": "recipe1", "likes": 3, "liked_by": ["user1", "id1", "deleted"]},
+        {"_id": "review3", "recipe_id": "recipe1", "likes": 1, "liked_by": ["id2"]},
+        {"_id": "review4", "recipe_id": "recipe1", "likes": 0, "liked_by": []},
+    ]))
+
+    assert asyncio.run(migrate_liked_by_ids(db, batch_size=2)) == 2, "Only reviews liked by usernames should change"
+    assert asyncio.run(migrate_liked_by_ids(db)) == 0, "A second run should not change anything"
+
+    reviews = {review["_id"]: review for review in asyncio.run(db["reviews"].find().to_list(None))}
+    assert reviews["review1"]["liked_by"] == ["id1", "id2"] and reviews["review1"]["likes"] == 2
+    assert reviews["review2"]["liked_by"] == ["id1", "deleted"] and reviews["review2"]["likes"] == 2, "A user should count once"
+    assert reviews["review3"]["liked_by"] == ["id2"]
+
+    recipe = asyncio.run(db["recipes"].find_one({"_id": "recipe1"}))
+    assert recipe["reviews_version"] == 1, "The review lists of changed recipes should be invalidated"
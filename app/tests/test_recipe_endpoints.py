@@ -311,4 +311,669 @@ def test_delete_recipe(client):
         raise TestAssertionError(response=response_delete)
 
     # Cleanup
-    delete_created_user(user_id, access_token, client)
\ No newline at end of file
+    delete_created_user(user_id, access_token, client)
+
+def test_get_magic_recipes_cursor(client):
+    user = {
+        "username": "testuser",
+        "email": "testuser@example.com",
+        "password": "testpassword"
+    }
+    response_user = client.post("/user/", json=user)
+    response_token = client.post("/user/token", data={"username": "testuser", "password": "testpassword"})
+    access_token = response_token.json()["access_token"]
+
+    user_id = response_user.json()["_id"]
+
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    created_recipe_ids = []
+    for cooking_time in [30, 10, 20]:
+        recipe = {
+            "name": f"Recipe {cooking_time}",
+            "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+            "instructions": [{"body": "Pour Water", "step_number": 0}],
+            "cooking_time": cooking_time,
+            "difficulty": 0
+        }
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=headers)
+        created_recipe_ids.append(response.json()["_id"])
+
+    def cleanup():
+        for recipe_id in created_recipe_ids:
+            delete_created_recipe(recipe_id, access_token, client)
+        delete_created_user(user_id, access_token, client)
+
+    # First page: an empty cursor starts a keyset scan
+    params = {"size": 2, "sort_by": "cooking_time", "min_cooking_time": 10, "cursor": ""}
+    response = client.get("/recipe/magic", params=params, headers=headers)
+
+    if (response.status_code != 200
+        or [r["cooking_time"] for r in response.json()["recipes"]] != [10, 20]
+        or response.json()["next_cursor"] is None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Second page resumes after the last recipe of the first one
+    params["cursor"] = response.json()["next_cursor"]
+    response = client.get("/recipe/magic", params=params, headers=headers)
+
+    if (response.status_code != 200
+        or [r["cooking_time"] for r in response.json()["recipes"]] != [30]
+        or response.json()["next_cursor"] is not None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # A cursor created for another sort order is rejected
+    params["sort_by"] = "difficulty"
+    response = client.get("/recipe/magic", params=params, headers=headers)
+
+    if response.status_code != 400:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
+
+def test_get_magic_recipes_cursor_updated_at(client):
+    user = {
+        "username": "testuser",
+        "email": "testuser@example.com",
+        "password": "testpassword"
+    }
+    response_user = client.post("/user/", json=user)
+    response_token = client.post("/user/token", data={"username": "testuser", "password": "testpassword"})
+    access_token = response_token.json()["access_token"]
+
+    user_id = response_user.json()["_id"]
+
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    created_recipe_ids = []
+    for cooking_time in [771, 772, 773]:
+        recipe = {
+            "name": f"Recipe {cooking_time}",
+            "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+            "instructions": [{"body": "Pour Water", "step_number": 0}],
+            "cooking_time": cooking_time,
+            "difficulty": 0
+        }
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=headers)
+        created_recipe_ids.append(response.json()["_id"])
+
+    def cleanup():
+        for recipe_id in created_recipe_ids:
+            delete_created_recipe(recipe_id, access_token, client)
+        delete_created_user(user_id, access_token, client)
+
+    # Updates store updated_at as a date, which the cursor has to carry
+    updated_order = [created_recipe_ids[2], created_recipe_ids[0], created_recipe_ids[1]]
+    for recipe_id in updated_order:
+        response = client.put(f"/recipe/{recipe_id}", files={"recipe": (None, json.dumps({"history": "Updated"}), "application/json")}, headers=headers)
+        if response.status_code != 200:
+            cleanup()
+            raise TestAssertionError(response=response)
+
+    params = {"size": 2, "sort_by": "updated_at", "min_cooking_time": 771, "cursor": ""}
+    response = client.get("/recipe/magic", params=params, headers=headers)
+
+    if (response.status_code != 200
+        or [r["_id"] for r in response.json()["recipes"]] != updated_order[:2]
+        or response.json()["next_cursor"] is None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    params["cursor"] = response.json()["next_cursor"]
+    response = client.get("/recipe/magic", params=params, headers=headers)
+
+    if (response.status_code != 200
+        or [r["_id"] for r in response.json()["recipes"]] != updated_order[2:]
+        or response.json()["next_cursor"] is not None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
+
+def test_get_magic_recipes_search(client):
+    user = {
+        "username": "testuser",
+        "email": "testuser@example.com",
+        "password": "testpassword"
+    }
+    response_user = client.post("/user/", json=user)
+    response_token = client.post("/user/token", data={"username": "testuser", "password": "testpassword"})
+    access_token = response_token.json()["access_token"]
+
+    user_id = response_user.json()["_id"]
+
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    created_recipe_ids = []
+    for name, ingredient in [("Pasta Bolognese", "Spaghetti"), ("Glass of Water", "Water"), ("Watermelon Juice", "Watermelon")]:
+        recipe = {
+            "name": name,
+            "ingredients": [{"name": ingredient, "quantity": 1, "unit": "cup"}],
+            "instructions": [{"body": "Mix", "step_number": 0}],
+            "cooking_time": 1,
+            "difficulty": 0
+        }
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=headers)
+        created_recipe_ids.append(response.json()["_id"])
+
+    def cleanup():
+        for recipe_id in created_recipe_ids:
+            delete_created_recipe(recipe_id, access_token, client)
+        delete_created_user(user_id, access_token, client)
+
+    # Characters in order still match, case insensitively
+    response = client.get("/recipe/magic", params={"search": "PSTA"}, headers=headers)
+
+    if response.status_code != 200 or [r["_id"] for r in response.json()] != [created_recipe_ids[0]]:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Prefix matches in the name rank above matches elsewhere
+    response = client.get("/recipe/magic", params={"search": "water"}, headers=headers)
+
+    if response.status_code != 200 or [r["_id"] for r in response.json()] != [created_recipe_ids[2], created_recipe_ids[1]]:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
+
+def test_list_recipes_card_view(client):
+    user = {
+        "username": "testuser",
+        "email": "testuser@example.com",
+        "password": "testpassword"
+    }
+    response_user = client.post("/user/", json=user)
+    response_token = client.post("/user/token", data={"username": "testuser", "password": "testpassword"})
+    access_token = response_token.json()["access_token"]
+
+    user_id = response_user.json()["_id"]
+
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    recipe = {
+        "name": "Glass of Water",
+        "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+        "instructions": [{"body": "Pour Water", "step_number": 0}],
+        "cooking_time": 1,
+        "difficulty": 0
+    }
+    response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=headers)
+    created_recipe_id = response.json()["_id"]
+
+    # Cards only carry what a feed renders
+    response = client.get("/recipe/", params={"view": "card"}, headers=headers)
+
+    card = next((r for r in response.json() if r["_id"] == created_recipe_id), None) if response.status_code == 200 else None
+    if (card is None
+        or card["name"] != "Glass of Water"
+        or "instructions" in card
+        or "ingredients" in card):
+        delete_created_recipe(created_recipe_id, access_token, client)
+        delete_created_user(user_id, access_token, client)
+        raise TestAssertionError(response=response)
+
+    # Unknown views are rejected
+    response = client.get("/recipe/", params={"view": "tiny"}, headers=headers)
+
+    if response.status_code != 422:
+        delete_created_recipe(created_recipe_id, access_token, client)
+        delete_created_user(user_id, access_token, client)
+        raise TestAssertionError(response=response)
+
+    # Cleanup
+    delete_created_recipe(created_recipe_id, access_token, client)
+    delete_created_user(user_id, access_token, client)
+
+def test_list_similar_recipes(client):
+    user = {
+        "username": "testuser",
+        "email": "testuser@example.com",
+        "password": "testpassword"
+    }
+    response_user = client.post("/user/", json=user)
+    response_token = client.post("/user/token", data={"username": "testuser", "password": "testpassword"})
+    access_token = response_token.json()["access_token"]
+
+    user_id = response_user.json()["_id"]
+
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    def ingredients(*names):
+        return [{"name": name, "quantity": 1, "unit": "cup"} for name in names]
+
+    recipes = [
+        {"name": "Pasta", "ingredients": ingredients("Pasta", "Tomato", "Garlic", "Olive oil")},
+        {"name": "Pasta with basil", "ingredients": ingredients("pasta", "Tomatoes", "garlic", "Basil")},
+        {"name": "Glass of Water", "ingredients": ingredients("Water")},
+    ]
+    created_recipe_ids = []
+    for recipe in recipes:
+        recipe.update({"instructions": [{"body": "Cook", "step_number": 0}], "cooking_time": 10, "difficulty": 1})
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=headers)
+        created_recipe_ids.append(response.json()["_id"])
+
+    def cleanup():
+        for recipe_id in created_recipe_ids:
+            delete_created_recipe(recipe_id, access_token, client)
+        delete_created_user(user_id, access_token, client)
+
+    # Recipes sharing ingredients are similar, unrelated ones are not
+    response = client.get(f"/recipe/similar/{created_recipe_ids[0]}", params={"view": "card"}, headers=headers)
+
+    if (response.status_code != 200
+        or [recipe["_id"] for recipe in response.json()] != [created_recipe_ids[1]]):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Deleted recipes are no longer suggested
+    delete_created_recipe(created_recipe_ids.pop(1), access_token, client)
+    response = client.get(f"/recipe/similar/{created_recipe_ids[0]}", headers=headers)
+
+    if response.status_code != 200 or response.json() != []:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    response = client.get("/recipe/similar/unknown", headers=headers)
+
+    if response.status_code != 404:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Cleanup
+    cleanup()
+
+def test_list_similar_recipes_private(client):
+    tokens, user_ids = [], []
+    for name in ("similar_author", "similar_reader"):
+        user = {
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "testpassword"
+        }
+        user_ids.append(client.post("/user/", json=user).json()["_id"])
+        response_token = client.post("/user/token", data={"username": name, "password": "testpassword"})
+        tokens.append(response_token.json()["access_token"])
+
+    author_headers = {"Authorization": f"Bearer {tokens[0]}"}
+    reader_headers = {"Authorization": f"Bearer {tokens[1]}"}
+
+    created_recipe_ids = []
+    for name in ("Pasta", "Pasta with basil"):
+        recipe = {
+            "name": name,
+            "ingredients": [{"name": ingredient, "quantity": 1, "unit": "cup"} for ingredient in ("Pasta", "Tomato", "Garlic")],
+            "instructions": [{"body": "Cook", "step_number": 0}],
+            "cooking_time": 10,
+            "difficulty": 1
+        }
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=author_headers)
+        created_recipe_ids.append(response.json()["_id"])
+
+    def cleanup():
+        for recipe_id in created_recipe_ids:
+            delete_created_recipe(recipe_id, tokens[0], client)
+        for user_id, token in zip(user_ids, tokens):
+            delete_created_user(user_id, token, client)
+
+    # Made private by another process, so the similarity index of this one still sees it as public
+    client.portal.call(client.app.mongodb["recipes"].update_one, {"_id": created_recipe_ids[1]}, {"$set": {"is_public": False}})
+
+    response = client.get(f"/recipe/similar/{created_recipe_ids[0]}", headers=reader_headers)
+
+    if response.status_code != 200 or response.json() != []:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # The author still sees its own private recipe
+    response = client.get(f"/recipe/similar/{created_recipe_ids[0]}", headers=author_headers)
+
+    if response.status_code != 200 or [recipe["_id"] for recipe in response.json()] != [created_recipe_ids[1]]:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Cleanup
+    cleanup()
+
+def test_get_following_feed(client):
+    tokens, user_ids = [], []
+    for name in ("feed_author", "feed_reader"):
+        user = {
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "testpassword"
+        }
+        user_ids.append(client.post("/user/", json=user).json()["_id"])
+        response_token = client.post("/user/token", data={"username": name, "password": "testpassword"})
+        tokens.append(response_token.json()["access_token"])
+
+    author_headers = {"Authorization": f"Bearer {tokens[0]}"}
+    reader_headers = {"Authorization": f"Bearer {tokens[1]}"}
+
+    created_recipe_ids = []
+    def create_recipe(name):
+        recipe = {
+            "name": name,
+            "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+            "instructions": [{"body": "Pour Water", "step_number": 0}],
+            "cooking_time": 10,
+            "difficulty": 0
+        }
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=author_headers)
+        created_recipe_ids.append(response.json()["_id"])
+
+    def cleanup():
+        for recipe_id in created_recipe_ids:
+            delete_created_recipe(recipe_id, tokens[0], client)
+        for user_id, token in zip(user_ids, tokens):
+            delete_created_user(user_id, token, client)
+
+    # Recipes posted before following are added to the timeline when following
+    create_recipe("Feed 1")
+    client.post("/user/follow/feed_author", headers=reader_headers)
+    create_recipe("Feed 2")
+    create_recipe("Feed 3")
+
+    params = {"feedType": "following"}
+    response = client.get("/recipe/magic", params=params, headers=reader_headers)
+
+    if response.status_code != 200 or [r["name"] for r in response.json()] != ["Feed 3", "Feed 2", "Feed 1"]:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Cursor pagination over the timeline
+    params = {"feedType": "following", "size": 2, "cursor": ""}
+    response = client.get("/recipe/magic", params=params, headers=reader_headers)
+    params["cursor"] = response.json()["next_cursor"]
+    response = client.get("/recipe/magic", params=params, headers=reader_headers)
+
+    if (response.status_code != 200
+        or [r["name"] for r in response.json()["recipes"]] != ["Feed 1"]
+        or response.json()["next_cursor"] is not None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Deleted recipes leave the feed
+    delete_created_recipe(created_recipe_ids.pop(), tokens[0], client)
+    response = client.get("/recipe/magic", params={"feedType": "following"}, headers=reader_headers)
+
+    if response.status_code != 200 or [r["name"] for r in response.json()] != ["Feed 2", "Feed 1"]:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Unfollowing empties the feed
+    client.post("/user/unfollow/feed_author", headers=reader_headers)
+    response = client.get("/recipe/magic", params={"feedType": "following"}, headers=reader_headers)
+
+    if response.status_code != 200 or response.json() != []:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
+
+def test_get_foryou_feed(client):
+    tokens, user_ids = [], []
+    for name in ("foryou_author", "foryou_followed", "foryou_reader"):
+        user = {
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "testpassword"
+        }
+        user_ids.append(client.post("/user/", json=user).json()["_id"])
+        response_token = client.post("/user/token", data={"username": name, "password": "testpassword"})
+        tokens.append(response_token.json()["access_token"])
+
+    reader_headers = {"Authorization": f"Bearer {tokens[2]}"}
+
+    created_recipes = []
+    for name, token in (("Foryou 1", tokens[0]), ("Foryou 2", tokens[1]), ("Foryou 3", tokens[0])):
+        recipe = {
+            "name": name,
+            "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+            "instructions": [{"body": "Pour Water", "step_number": 0}],
+            "cooking_time": 10,
+            "difficulty": 0
+        }
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers={"Authorization": f"Bearer {token}"})
+        created_recipes.append((response.json()["_id"], token))
+
+    def cleanup():
+        for recipe_id, token in created_recipes:
+            delete_created_recipe(recipe_id, token, client)
+        for user_id, token in zip(user_ids, tokens):
+            delete_created_user(user_id, token, client)
+
+    client.post("/user/follow/foryou_followed", headers=reader_headers)
+
+    # The pool is re-ranked periodically, refresh it now
+    client.portal.call(client.app.foryou.refresh, client.app.mongodb)
+
+    # Recipes of followed users are left out, newer recipes come first
+    params = {"feedType": "foryou", "size": 1, "cursor": ""}
+    response = client.get("/recipe/magic", params=params, headers=reader_headers)
+
+    if (response.status_code != 200
+        or [r["name"] for r in response.json()["recipes"]] != ["Foryou 3"]
+        or response.json()["next_cursor"] is None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    params["cursor"] = response.json()["next_cursor"]
+    response = client.get("/recipe/magic", params=params, headers=reader_headers)
+
+    if (response.status_code != 200
+        or [r["name"] for r in response.json()["recipes"]] != ["Foryou 1"]
+        or response.json()["next_cursor"] is not None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Deleted recipes leave the pool right away
+    recipe_id, token = created_recipes.pop()
+    delete_created_recipe(recipe_id, token, client)
+    response = client.get("/recipe/magic", params={"feedType": "foryou"}, headers=reader_headers)
+
+    if response.status_code != 200 or [r["name"] for r in response.json()] != ["Foryou 1"]:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
+
+def test_show_recipe_conditional(client):
+    tokens, user_ids = [], []
+    for name in ("etag_author", "etag_reviewer"):
+        user = {
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "testpassword"
+        }
+        user_ids.append(client.post("/user/", json=user).json()["_id"])
+        response_token = client.post("/user/token", data={"username": name, "password": "testpassword"})
+        tokens.append(response_token.json()["access_token"])
+
+    headers = {"Authorization": f"Bearer {tokens[0]}"}
+    recipe = {
+        "name": "Etag Recipe",
+        "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+        "instructions": [{"body": "Pour Water", "step_number": 0}],
+        "cooking_time": 10,
+        "difficulty": 0
+    }
+    response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=headers)
+    recipe_id = response.json()["_id"]
+
+    def cleanup():
+        delete_created_recipe(recipe_id, tokens[0], client)
+        for user_id, token in zip(user_ids, tokens):
+            delete_created_user(user_id, token, client)
+
+    response = client.get(f"/recipe/{recipe_id}")
+    etag = response.headers.get("ETag")
+
+    if response.status_code != 200 or not etag or not response.headers.get("Cache-Control", "").startswith("public"):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # The client already has the current version
+    response = client.get(f"/recipe/{recipe_id}", headers={"If-None-Match": etag})
+
+    if response.status_code != 304 or response.content or response.headers.get("ETag") != etag:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Updating the recipe changes its ETag
+    client.put(f"/recipe/{recipe_id}", files={"recipe": (None, json.dumps({"name": "Etag Recipe 2"}), "application/json")}, headers=headers)
+    response = client.get(f"/recipe/{recipe_id}", headers={"If-None-Match": etag})
+
+    if response.status_code != 200 or response.json()["name"] != "Etag Recipe 2" or response.headers.get("ETag") == etag:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Review lists change their ETag when a review is added
+    response = client.get(f"/review/{recipe_id}")
+    etag = response.headers.get("ETag")
+    response = client.get(f"/review/{recipe_id}", headers={"If-None-Match": etag})
+
+    if response.status_code != 304:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    review = {"rating": 4, "comment": "Good"}
+    client.post(f"/review/{recipe_id}", data={"review": json.dumps(review)}, headers={"Authorization": f"Bearer {tokens[1]}"})
+    response = client.get(f"/review/{recipe_id}", headers={"If-None-Match": etag})
+
+    if response.status_code != 200 or len(response.json()) != 1:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
+
+def test_get_magic_recipes_total(client):
+    user = {
+        "username": "total_user",
+        "email": "total_user@example.com",
+        "password": "testpassword"
+    }
+    user_id = client.post("/user/", json=user).json()["_id"]
+    response_token = client.post("/user/token", data={"username": "total_user", "password": "testpassword"})
+    access_token = response_token.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    created_recipe_ids = []
+    for cooking_time in [1001, 1002, 1003]:
+        recipe = {
+            "name": f"Total {cooking_time}",
+            "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+            "instructions": [{"body": "Pour Water", "step_number": 0}],
+            "cooking_time": cooking_time,
+            "difficulty": 0
+        }
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=headers)
+        created_recipe_ids.append(response.json()["_id"])
+
+    def cleanup():
+        for recipe_id in created_recipe_ids:
+            delete_created_recipe(recipe_id, access_token, client)
+        delete_created_user(user_id, access_token, client)
+
+    # The total is only counted on request
+    params = {"min_cooking_time": 1001, "sort_by": "cooking_time", "size": 2}
+    response = client.get("/recipe/magic", params=params, headers=headers)
+
+    if response.status_code != 200 or len(response.json()) != 2 or "X-Total-Count" in response.headers:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    response = client.get("/recipe/magic", params={**params, "with_total": True}, headers=headers)
+
+    if response.status_code != 200 or response.headers.get("X-Total-Count") != "3":
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Pages past the end are empty
+    response = client.get("/recipe/magic", params={**params, "start": 4}, headers=headers)
+
+    if response.status_code != 200 or response.json() != []:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
+
+def test_show_recipes_batch(client):
+    tokens, user_ids = [], []
+    for name in ("batch_author", "batch_reader"):
+        user = {
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "testpassword"
+        }
+        user_ids.append(client.post("/user/", json=user).json()["_id"])
+        response_token = client.post("/user/token", data={"username": name, "password": "testpassword"})
+        tokens.append(response_token.json()["access_token"])
+
+    author_headers = {"Authorization": f"Bearer {tokens[0]}"}
+    reader_headers = {"Authorization": f"Bearer {tokens[1]}"}
+
+    recipe_ids = []
+    def create_recipe(name):
+        recipe = {
+            "name": name,
+            "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+            "instructions": [{"body": "Pour Water", "step_number": 0}],
+            "cooking_time": 1,
+            "difficulty": 0
+        }
+        response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=author_headers)
+        recipe_ids.append(response.json()["_id"])
+
+    def cleanup():
+        for recipe_id in recipe_ids:
+            delete_created_recipe(recipe_id, tokens[0], client)
+        for user_id, token in zip(user_ids, tokens):
+            delete_created_user(user_id, token, client)
+
+    # Recipes of private users are private
+    create_recipe("Batch Public")
+    client.put(f"/user/{user_ids[0]}", data={"user": json.dumps({"is_private": True})}, headers=author_headers)
+    create_recipe("Batch Private")
+
+    body = {"ids": recipe_ids + ["missing"]}
+    response = client.post("/recipe/batch", json=body, params={"view": "card"}, headers=reader_headers)
+    results = response.json()
+
+    if (response.status_code != 200
+        or results[recipe_ids[0]]["status"] != 200
+        or results[recipe_ids[0]]["recipe"]["name"] != "Batch Public"
+        or results[recipe_ids[1]]["status"] != 403
+        or results["missing"]["status"] != 404):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Followers can see private recipes
+    client.post("/user/follow/batch_author", headers=reader_headers)
+    response = client.post("/recipe/batch", json=body, headers=reader_headers)
+
+    if response.status_code != 200 or response.json()[recipe_ids[1]]["status"] != 200:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # The number of ids is bounded
+    response = client.post("/recipe/batch", json={"ids": [str(i) for i in range(101)]}, headers=reader_headers)
+
+    if response.status_code != 422:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
@@ -0,0 +1,40 @@
+import json
+import uuid
+from datetime import datetime
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models.recipe_model import RecipeModel
+from app.utils import responses
+from app.utils.responses import FastJSONResponse, to_document
+
+def sample_recipe():
+    return {
+        "_id": str(uuid.uuid4()),
+        "name": "Pasta",
+        "ingredients": [{"name": "Tomatoes", "quantity": 2.5, "unit": "count"}],
+        "creation_date": "2024-01-01T10:00:00.123456",
+        "updated_at": datetime(2024, 1, 2, 11, 30, 0, 654321),
+        "is_public": True,
+        "average_rating": 4.5,
+        "description": "Tomàquet i alfàbrega",
+    }
+
+def test_fast_json_response():
+    recipe = sample_recipe()
+    expected = json.loads(JSONResponse(jsonable_encoder([recipe])).body)
+
+    assert json.loads(FastJSONResponse([recipe]).body) == expected, "It should render what the default path renders"
+
+    orjson = responses.orjson
+    responses.orjson = None
+    try:
+        assert json.loads(FastJSONResponse([recipe]).body) == expected, "The standard json fallback should match too"
+    finally:
+        responses.orjson = orjson
+
+    assert json.loads(FastJSONResponse({"id": uuid.UUID(int=1)}).body) == {"id": str(uuid.UUID(int=1))}
+
+def test_to_document():
+    recipe = RecipeModel(name="Pasta", ingredients=[], instructions=[])
+    assert to_document(recipe) == jsonable_encoder(recipe), "Models should be stored as before"
@@ -1,6 +1,9 @@
+import asyncio
 import json
 import uuid
 
+from app.routers.review_router import review_page_cache, apply_rating_change
+
 # To test these endpoints, we will focus on the following testing parameters:
 
 # 1. Happy Path: Testing when everything goes as expected.
@@ -228,4 +231,126 @@ def test_get_reviews(client):
         raise TestAssertionError(response=response)
 
     # Cleanup
-    cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
\ No newline at end of file
+    cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+
+def test_review_rating_counters(client):
+    user_id, access_token, created_recipe_id, user_id2, access_token2, created_review_id = create_users_recipes_reviews(client)
+
+    headers = {
+        "Authorization": f"Bearer {access_token2}"
+    }
+
+    # The review created by the helper has a rating of 5
+    response = client.get(f"/recipe/{created_recipe_id}")
+
+    if (response.status_code != 200
+        or response.json()["average_rating"] != 5.0
+        or response.json()["rating_count"] != 1):
+        cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+        raise TestAssertionError(response=response)
+
+    # Changing the rating updates the counters without adding a review
+    client.put(f"/review/{created_recipe_id}/{created_review_id}", json={"rating": 3.5}, headers=headers)
+    response = client.get(f"/recipe/{created_recipe_id}")
+
+    if (response.json()["average_rating"] != 3.5
+        or response.json()["rating_count"] != 1):
+        cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+        raise TestAssertionError(response=response)
+
+    # Deleting the review resets the average
+    delete_created_review(created_recipe_id, created_review_id, access_token2, client)
+    response = client.get(f"/recipe/{created_recipe_id}")
+
+    if (response.json()["average_rating"] != 0.0
+        or response.json()["rating_count"] != 0):
+        delete_created_recipe(created_recipe_id, access_token, client)
+        delete_created_user(user_id, access_token, client)
+        delete_created_user(user_id2, access_token2, client)
+        raise TestAssertionError(response=response)
+
+    # Cleanup
+    delete_created_recipe(created_recipe_id, access_token, client)
+    delete_created_user(user_id, access_token, client)
+    delete_created_user(user_id2, access_token2, client)
+
+def test_rating_change_conflict(client):
+    user_id, access_token, created_recipe_id, user_id2, access_token2, created_review_id = create_users_recipes_reviews(client)
+
+    # Interleaved rating changes all count, and the average follows the last of them
+    async def concurrent_changes():
+        await asyncio.gather(*[apply_rating_change(client.app.mongodb, created_recipe_id, rating, 1) for rating in (2.0, 4.0)])
+
+    client.portal.call(concurrent_changes)
+    response = client.get(f"/recipe/{created_recipe_id}")
+
+    if (response.status_code != 200
+        or response.json()["rating_count"] != 3
+        or abs(response.json()["average_rating"] - 11 / 3) > 1e-9):
+        cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+        raise TestAssertionError(response=response)
+
+    # Cleanup
+    cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+
+def test_like_review(client):
+    user_id, access_token, created_recipe_id, user_id2, access_token2, created_review_id = create_users_recipes_reviews(client)
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    headers2 = {"Authorization": f"Bearer {access_token2}"}
+
+    def check(response, status_code):
+        if response.status_code != status_code:
+            cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+            raise TestAssertionError(response=response)
+
+    # Reviewers cannot like their own review
+    check(client.patch(f"/review/like/{created_recipe_id}/{created_review_id}", headers=headers2), 403)
+
+    check(client.patch(f"/review/like/{created_recipe_id}/{created_review_id}", headers=headers), 200)
+    check(client.patch(f"/review/like/{created_recipe_id}/{created_review_id}", headers=headers), 400)
+
+    response = client.get(f"/review/{created_recipe_id}")
+    if response.json()[0]["likes"] != 1 or response.json()[0]["liked_by"] != [user_id]:
+        cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+        raise TestAssertionError(response=response)
+
+    check(client.patch(f"/review/unlike/{created_recipe_id}/{created_review_id}", headers=headers), 200)
+    check(client.patch(f"/review/unlike/{created_recipe_id}/{created_review_id}", headers=headers), 400)
+
+    response = client.get(f"/review/{created_recipe_id}")
+    if response.json()[0]["likes"] != 0 or response.json()[0]["liked_by"]:
+        cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+        raise TestAssertionError(response=response)
+
+    # Missing reviews and recipes
+    check(client.patch(f"/review/like/{created_recipe_id}/missing", headers=headers), 404)
+    check(client.patch(f"/review/unlike/missing/{created_review_id}", headers=headers), 404)
+
+    # Cleanup
+    cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+
+def test_review_page_cache(client):
+    user_id, access_token, created_recipe_id, user_id2, access_token2, created_review_id = create_users_recipes_reviews(client)
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    # The second request for a first page is served from the cache
+    client.get(f"/review/magic/{created_recipe_id}", params={"sort_by": "likes"})
+    hits = review_page_cache.hits
+    response = client.get(f"/review/magic/{created_recipe_id}", params={"sort_by": "likes"})
+
+    if response.status_code != 200 or review_page_cache.hits != hits + 1:
+        cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+        raise TestAssertionError(response=response)
+
+    # Review writes invalidate the cached pages of the recipe
+    client.patch(f"/review/like/{created_recipe_id}/{created_review_id}", headers=headers)
+    response = client.get(f"/review/magic/{created_recipe_id}", params={"sort_by": "likes"})
+
+    if response.status_code != 200 or response.json()[0]["likes"] != 1:
+        cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
+        raise TestAssertionError(response=response)
+
+    # Cleanup
+    cleanup(created_recipe_id, created_review_id, user_id, access_token, user_id2, access_token2, client)
@@ -0,0 +1,22 @@
+import asyncio
+from mongomock_motor import AsyncMongoMockClient
+
+from app.utils.search import index_recipe, search_recipe_ids
+
+def test_search_recipe_ids():
+    db = AsyncMongoMockClient()["search_test"]
+
+    async def run():
+        for recipe_id, name in [("r0", "Plum cake"), ("r1", "Pasta"), ("r2", "Pesto pasta"), ("r3", "Potato salad"), ("r4", "Rice")]:
+            await index_recipe(db, {"_id": recipe_id, "name": name, "ingredients": [{"name": "water"}], "username": "cook"})
+
+        assert await search_recipe_ids(db, "pasta") == ["r1", "r2"], "Prefixes should rank above other substrings"
+        assert await search_recipe_ids(db, "PSTA") == ["r1", "r2"], "Characters in order should match, case insensitively"
+
+        # Broad terms match every recipe, but only the best candidates are verified
+        assert len(await search_recipe_ids(db, "a")) == 5
+        assert await search_recipe_ids(db, "pa", limit=1) == ["r1"], "Name prefixes should come first"
+        assert await search_recipe_ids(db, "pa", limit=2) == ["r1", "r2"], "Substrings should come before scattered matches"
+        assert len(await search_recipe_ids(db, "a", limit=2)) == 2, "The candidate set should be capped"
+
+    asyncio.run(run())
@@ -1,5 +1,7 @@
+import asyncio
 import bcrypt
 from app.utils.security import hash_password, verify_password  # Replace with your actual import
+from app.utils.security import hash_rounds, needs_rehash, verify_and_update
 
 def test_hash_password():
     password = "securepassword123"
@@ -17,3 +19,22 @@ def test_verify_password():
     assert not verify_password(wrong_password, hashed), "Verification should fail for the wrong password"
     assert not verify_password("", hashed), "Verification should fail for an empty password"
 
+def test_needs_rehash():
+    hashed = hash_password("securepassword123", rounds=4)
+
+    assert hash_rounds(hashed) == 4, "The hash should use the requested work factor"
+    assert needs_rehash(hashed, rounds=5), "Hashes with a lower work factor should be rehashed"
+    assert not needs_rehash(hashed, rounds=4), "Up to date hashes should be kept"
+    assert not needs_rehash(hash_password("securepassword123", rounds=5), rounds=4), "Stronger hashes should not be downgraded"
+
+def test_verify_and_update():
+    password = "securepassword123"
+    outdated = hash_password(password, rounds=4)
+
+    verified, new_hash = asyncio.run(verify_and_update(password, outdated, rounds=5))
+    assert verified and new_hash is not None, "Outdated hashes should be replaced on login"
+    assert hash_rounds(new_hash) == 5 and verify_password(password, new_hash)
+
+    assert asyncio.run(verify_and_update(password, new_hash, rounds=5)) == (True, None), "Current hashes should be kept"
+    assert asyncio.run(verify_and_update(password, new_hash, rounds=4)) == (True, None), "Stronger hashes should be kept"
+    assert asyncio.run(verify_and_update("wrongpassword", outdated, rounds=5)) == (False, None), "Wrong passwords should not be rehashed"
@@ -0,0 +1,37 @@
+from app.utils.similarity import SimilarityIndex, normalize_ingredient
+
+def recipe(recipe_id, ingredients, **fields):
+    return {"_id": recipe_id, "ingredients": [{"name": name} for name in ingredients], **fields}
+
+def test_normalize_ingredient():
+    assert normalize_ingredient("  Tomatoes ") == "tomato"
+    assert normalize_ingredient("Eggs") == "egg"
+    assert normalize_ingredient("Olive   Oil") == "olive oil"
+    assert normalize_ingredient("Swiss") == "swiss", "Double s endings are not plurals"
+
+def test_similarity_index():
+    index = SimilarityIndex()
+    index.upsert(recipe("pasta", ["pasta", "tomato", "garlic", "olive oil"], cooking_time=20))
+    index.upsert(recipe("pasta2", ["pasta", "tomato", "garlic", "basil"], cooking_time=20))
+    index.upsert(recipe("pasta3", ["pasta", "garlic", "onion"], cooking_time=60))
+    index.upsert(recipe("water", ["water"]))
+
+    assert index.neighbours("pasta") == ["pasta2", "pasta3"], "Neighbours should be ranked by similarity"
+    assert index.neighbours("water") == []
+
+    # Updating a recipe refreshes the cached neighbours of the recipes it shares buckets with
+    index.upsert(recipe("pasta3", ["pasta", "tomato", "garlic", "olive oil"], cooking_time=20))
+    assert index.neighbours("pasta") == ["pasta3", "pasta2"]
+
+    index.remove("pasta3")
+    assert index.neighbours("pasta") == ["pasta2"]
+
+def test_similarity_visibility():
+    index = SimilarityIndex()
+    index.upsert(recipe("pasta", ["pasta", "tomato"], is_public=True, user_id="owner"))
+    index.upsert(recipe("private", ["pasta", "tomato"], is_public=False, user_id="friend"))
+
+    assert index.similar("pasta", 5) == [], "Private recipes are hidden from anonymous users"
+    assert index.similar("pasta", 5, "stranger", []) == []
+    assert index.similar("pasta", 5, "follower", ["friend"]) == ["private"]
+    assert index.similar("pasta", 5, "friend") == ["private"], "Owners see their private recipes"
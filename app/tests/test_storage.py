@@ -0,0 +1,83 @@
+import asyncio
+import io
+import os
+import tempfile
+from fastapi import HTTPException, UploadFile
+
+from app.utils.storage import ImageStorage, LocalImageStorage
+
+def test_local_storage_streams_upload():
+    root = tempfile.mkdtemp()
+    storage = LocalImageStorage(root, "/uploads", max_upload_bytes=3 * 1024 * 1024)
+    content = os.urandom(2 * 1024 * 1024 + 17)
+
+    async def run():
+        url = await storage.upload(UploadFile(io.BytesIO(content), filename="my image.png"))
+        assert url.startswith("/uploads/recipes/my_image-") and url.endswith(".png"), "The URL should point to the stored object"
+
+        with open(os.path.join(root, *url[len("/uploads/"):].split("/")), "rb") as stored:
+            assert stored.read() == content, "The whole file should be stored"
+
+        await storage.delete(url)
+        assert os.listdir(os.path.join(root, "recipes")) == [], "Deleted images should be removed"
+
+    asyncio.run(run())
+
+def test_local_storage_rejects_large_upload():
+    root = tempfile.mkdtemp()
+    storage = LocalImageStorage(root, "/uploads", max_upload_bytes=1024 * 1024)
+
+    async def run():
+        try:
+            await storage.upload(UploadFile(io.BytesIO(os.urandom(1024 * 1024 + 1)), filename="large.png"))
+        except HTTPException as e:
+            assert e.status_code == 413, "Oversized uploads should be rejected with a 413"
+        else:
+            assert False, "Oversized uploads should be rejected"
+
+        assert os.listdir(os.path.join(root, "recipes")) == [], "A rejected upload should leave no partial file"
+
+    asyncio.run(run())
+
+def test_local_storage_upload_many():
+    root = tempfile.mkdtemp()
+    storage = LocalImageStorage(root, "/uploads", max_upload_bytes=1024 * 1024, upload_concurrency=2)
+
+    def image(name, size=1024):
+        return UploadFile(io.BytesIO(os.urandom(size)), filename=name)
+
+    async def run():
+        urls = await storage.upload_many([image(f"image{i}.png") for i in range(5)])
+        assert [url.split("/")[-1].split("-")[0] for url in urls] == [f"image{i}" for i in range(5)], "URLs should keep the order of the files"
+        assert len(os.listdir(os.path.join(root, "recipes"))) == 5
+
+        for url in urls:
+            await storage.delete(url)
+
+        urls = await storage.upload_many([image("image.jpg") for _ in range(5)])
+        assert len(set(urls)) == 5, "Files with the same name should not overwrite each other"
+        for url in urls:
+            await storage.delete(url)
+
+        try:
+            await storage.upload_many([image("first.png"), image("large.png", 1024 * 1024 + 1), image("last.png")])
+        except HTTPException as e:
+            assert e.status_code == 413
+        else:
+            assert False, "A failed upload should fail the whole batch"
+
+        assert os.listdir(os.path.join(root, "recipes")) == [], "Uploaded images should be deleted when the batch fails"
+
+    asyncio.run(run())
+
+def test_incomplete_storage_backend():
+    class PartialStorage(ImageStorage):
+        def public_url(self, name):
+            return f"/partial/{name}"
+
+    try:
+        PartialStorage(max_upload_bytes=1024)
+    except TypeError:
+        pass
+    else:
+        assert False, "A backend missing methods should fail when it is created"
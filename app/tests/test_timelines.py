@@ -0,0 +1,73 @@
+import asyncio
+from mongomock_motor import AsyncMongoMockClient
+
+from app.utils import timelines
+from app.utils.follows import follow
+from app.utils.timelines import fan_out_recipe, timeline_page
+
+def recipe(recipe_id, user_id, day):
+    return {"_id": recipe_id, "user_id": user_id, "creation_date": f"2024-01-{day:02d}T00:00:00"}
+
+def test_timeline_fan_out():
+    db = AsyncMongoMockClient()["timelines_test"]
+    timeline_size = timelines.TIMELINE_SIZE
+    timelines.TIMELINE_SIZE = 2
+
+    async def run():
+        await db["users"].insert_many([{"_id": user_id} for user_id in ("author", "reader")])
+        await follow(db, "reader", "author")
+
+        for day in range(1, 4):
+            await db["recipes"].insert_one(recipe(f"recipe{day}", "author", day))
+            await fan_out_recipe(db, await db["recipes"].find_one({"_id": f"recipe{day}"}))
+
+        # Posting only inserts, the timeline is trimmed when its first page is read
+        assert await db["timelines"].count_documents({"owner_id": "reader"}) == 3
+        page, next_cursor = await timeline_page(db, "reader", 1, cursor="")
+        assert page == ["recipe3"] and next_cursor is not None
+        assert await db["timelines"].count_documents({"owner_id": "reader"}) == 2, "Timelines should be capped"
+        page, next_cursor = await timeline_page(db, "reader", 1, cursor=next_cursor)
+        assert page == ["recipe2"] and next_cursor is None, "Entries beyond the cap should be dropped"
+
+        assert await db["timelines"].count_documents({"owner_id": "author"}) == 0, "Authors do not see their own recipes"
+
+    try:
+        asyncio.run(run())
+    finally:
+        timelines.TIMELINE_SIZE = timeline_size
+
+def test_timeline_fan_out_on_read():
+    db = AsyncMongoMockClient()["timelines_test"]
+    fanout_threshold = timelines.FANOUT_THRESHOLD
+    timelines.FANOUT_THRESHOLD = 2
+
+    async def run():
+        await db["users"].insert_many([{"_id": user_id} for user_id in ("celebrity", "author", "reader", "other")])
+        await follow(db, "reader", "celebrity")
+        await follow(db, "other", "celebrity")
+        await follow(db, "reader", "author")
+
+        recipes = [recipe("celebrity1", "celebrity", 1), recipe("author2", "author", 2), recipe("celebrity3", "celebrity", 3)]
+        await db["recipes"].insert_many(recipes)
+        for doc in recipes:
+            await fan_out_recipe(db, doc)
+
+        assert await db["timelines"].count_documents({"author_id": "celebrity"}) == 0, "Accounts above the threshold are not fanned out"
+
+        page, _ = await timeline_page(db, "reader", 10)
+        assert page == ["celebrity3", "author2", "celebrity1"], "Their recipes should be merged at read time"
+
+        page, next_cursor = await timeline_page(db, "reader", 2, cursor="")
+        page_2, _ = await timeline_page(db, "reader", 2, cursor=next_cursor)
+        assert page + page_2 == ["celebrity3", "author2", "celebrity1"]
+
+        page, _ = await timeline_page(db, "reader", 10, start=1)
+        assert page == ["author2", "celebrity1"]
+
+        page, _ = await timeline_page(db, "other", 10)
+        assert page == ["celebrity3", "celebrity1"]
+
+    try:
+        asyncio.run(run())
+    finally:
+        timelines.FANOUT_THRESHOLD = fanout_threshold
@@ -1,9 +1,13 @@
+import asyncio
 import unittest
 from unittest.mock import patch
 from datetime import timedelta
 import os
+import time
 
 from app.utils.token import create_access_token, get_current_user
+from app.utils.token import load_revoked_tokens, revoke_token, revoked_tokens, token_cache, token_digest
+from mongomock_motor import AsyncMongoMockClient
 from fastapi.exceptions import HTTPException
 from jwt.exceptions import InvalidTokenError, ExpiredSignatureError
 
@@ -21,4 +25,77 @@ def test_create_access_token_custom_expires():
 @patch.dict(os.environ, {"SECRET_KEY": "your-secret-key"})
 def test_create_access_token_with_additional_data():
     token = create_access_token(data={"extra": "data"}, user_id="123", username="testuser")
-    assert token is not None
\ No newline at end of file
+    assert token is not None
+
+@patch.dict(os.environ, {"SECRET_KEY": "your-secret-key"})
+def test_get_current_user_cache():
+    token_cache.clear()
+    token = create_access_token(data={}, user_id="123", username="testuser")
+
+    hits = token_cache.hits
+    assert asyncio.run(get_current_user(token)) == {"user_id": "123", "username": "testuser"}
+    assert asyncio.run(get_current_user(token)) == {"user_id": "123", "username": "testuser"}
+    assert token_cache.hits == hits + 1, "The second lookup should be served by the cache"
+
+    # Expired tokens are never served, whatever the cache TTL
+    expired = create_access_token(data={}, user_id="123", username="testuser", expires_delta=timedelta(seconds=-1))
+    try:
+        asyncio.run(get_current_user(expired))
+    except HTTPException as e:
+        assert e.status_code == 401
+    else:
+        assert False, "Expired tokens should be rejected"
+    assert len(token_cache) == 1
+
+    # Every rejection raises its own exception, concurrent requests never share one
+    errors = []
+    for _ in range(2):
+        try:
+            asyncio.run(get_current_user(expired))
+        except HTTPException as e:
+            errors.append(e)
+    assert len(errors) == 2 and errors[0] is not errors[1]
+
+@patch.dict(os.environ, {"SECRET_KEY": "your-secret-key"})
+def test_revoke_token():
+    db = AsyncMongoMockClient()["token_test"]
+    token = create_access_token(data={}, user_id="123", username="testuser")
+    other = create_access_token(data={}, user_id="123", username="testuser")
+    assert token != other, "Every token should be unique"
+
+    asyncio.run(get_current_user(token))
+    asyncio.run(revoke_token(db, token))
+
+    try:
+        asyncio.run(get_current_user(token))
+    except HTTPException as e:
+        assert e.status_code == 401
+    else:
+        assert False, "Revoked tokens should be rejected even if cached"
+    assert asyncio.run(get_current_user(other))["user_id"] == "123"
+
+    # Revocations are restored from the database
+    revoked_tokens.clear()
+    asyncio.run(load_revoked_tokens(db))
+    assert token_digest(token) in revoked_tokens
+
+@patch.dict(os.environ, {"SECRET_KEY": "your-secret-key"})
+def test_reload_revoked_tokens():
+    db = AsyncMongoMockClient()["token_reload_test"]
+    token = create_access_token(data={}, user_id="123", username="testuser")
+    local = create_access_token(data={}, user_id="123", username="testuser")
+    asyncio.run(get_current_user(token))
+
+    # Another instance revokes the token, this one only finds it in the database
+    asyncio.run(revoke_token(db, token))
+    revoked_tokens.pop(token_digest(token))
+    revoked_tokens[token_digest(local)] = time.time() + 60
+
+    asyncio.run(load_revoked_tokens(db))
+    try:
+        asyncio.run(get_current_user(token))
+    except HTTPException as e:
+        assert e.status_code == 401
+    else:
+        assert False, "Tokens revoked elsewhere should be rejected after a reload"
+    assert token_digest(local) in revoked_tokens, "Local revocations should survive a reload"
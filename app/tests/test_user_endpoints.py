@@ -1,5 +1,6 @@
 import uuid
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 # To test these endpoints, we will focus on the following testing parameters:
 
@@ -177,6 +178,50 @@ def test_update_user(client):
     access_token = response_token.json()["access_token"]
     delete_created_user(user_id, access_token, client)
 
+def test_update_user_taken_username(client):
+    users = []
+    for name in ("takenuser_test", "renameuser_test"):
+        response = client.post("/user/", json={"username": name, "email": f"{name}@example.com", "password": "renamepassword"})
+        access_token = client.post("/user/token", data={"username": name, "password": "renamepassword"}).json()["access_token"]
+        users.append((response.json()["_id"], access_token))
+
+    (taken_id, taken_token), (user_id, access_token) = users
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    # Renaming to a taken username or email is rejected by the unique indexes
+    for update_data in ({"username": "takenuser_test"}, {"email": "takenuser_test@example.com"}):
+        response = client.put(f"/user/{user_id}", files={"user": (None, json.dumps(update_data), "application/json")}, headers=headers)
+
+        if response.status_code != 400 or response.json()["detail"] != "Username or email already registered":
+            delete_created_user(user_id, access_token, client)
+            delete_created_user(taken_id, taken_token, client)
+            raise TestAssertionError(response=response)
+
+    delete_created_user(user_id, access_token, client)
+    delete_created_user(taken_id, taken_token, client)
+
+def test_create_user_concurrent(client):
+    user = {
+        "username": "concurrentuser_test",
+        "email": "concurrentuser_test@example.com",
+        "password": "concurrentpassword"
+    }
+
+    # Both requests may pass the existence check, only one insert can succeed
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        responses = list(executor.map(lambda _: client.post("/user/", json=user), range(2)))
+
+    created = [response for response in responses if response.status_code == 201]
+    rejected = [response for response in responses if response.status_code == 400]
+    if created:
+        access_token = client.post("/user/token", data={"username": user["username"], "password": user["password"]}).json()["access_token"]
+        delete_created_user(created[0].json()["_id"], access_token, client)
+
+    if len(created) != 1 or len(rejected) != 1 or rejected[0].json()["detail"] != "Username or email already registered":
+        raise TestAssertionError(response=rejected[0] if rejected else responses[0])
+
 def test_delete_user(client):
     # Create user for this test
     user = {
@@ -356,5 +401,255 @@ def test_unfollow_user(client):
     delete_created_user(response_create.json()["_id"], access_token, client)
     delete_created_user(response_create2.json()["_id"], access_token2, client)
 
+def test_logout(client):
+    # Create user for this test
+    user = {
+        "username": "logout_test",
+        "email": "logout_test@example.com",
+        "password": "logout_testpassword"
+    }
+    response_create = client.post("/user/", json=user)
+
+    # Two sessions of the same user
+    tokens = [
+        client.post("/user/token", data={"username": "logout_test", "password": "logout_testpassword"}).json()["access_token"]
+        for _ in range(2)
+    ]
 
+    # The token is accepted, and cached, before logging out
+    response = client.get("/user/me", headers={"Authorization": f"Bearer {tokens[0]}"})
+
+    if response.status_code != 200:
+        delete_created_user(response_create.json()["_id"], tokens[1], client)
+        raise TestAssertionError(response=response)
+
+    response = client.post("/user/logout", headers={"Authorization": f"Bearer {tokens[0]}"})
+
+    if response.status_code != 200:
+        delete_created_user(response_create.json()["_id"], tokens[1], client)
+        raise TestAssertionError(response=response)
+
+    # The revoked token is rejected, the other session is not affected
+    response = client.get("/user/me", headers={"Authorization": f"Bearer {tokens[0]}"})
+
+    if response.status_code != 401:
+        delete_created_user(response_create.json()["_id"], tokens[1], client)
+        raise TestAssertionError(response=response)
+
+    response = client.get("/user/me", headers={"Authorization": f"Bearer {tokens[1]}"})
+
+    if response.status_code != 200:
+        delete_created_user(response_create.json()["_id"], tokens[1], client)
+        raise TestAssertionError(response=response)
+
+    # Delete the created user
+    delete_created_user(response_create.json()["_id"], tokens[1], client)
+
+def test_update_username_propagation(client):
+    # Create user for this test
+    user = {
+        "username": "rename_test",
+        "email": "rename_test@example.com",
+        "password": "rename_testpassword"
+    }
+    response_creation = client.post("/user/", json=user)
+
+    response_token = client.post("/user/token", data={"username": "rename_test", "password": "rename_testpassword"})
+    access_token = response_token.json()["access_token"]
+
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    user_id = response_creation.json()["_id"]
+
+    recipe = {
+        "name": "Glass of Water",
+        "ingredients": [{"name": "Water", "quantity": 1, "unit": "cup"}],
+        "instructions": [{"body": "Pour Water", "step_number": 0}],
+        "cooking_time": 1,
+        "difficulty": 0
+    }
+    response = client.post("/recipe/", files={"recipe": (None, json.dumps(recipe), "application/json")}, headers=headers)
+    recipe_id = response.json()["_id"]
+
+    # The rename is propagated in the background, after the response
+    response = client.put(f"/user/{user_id}", files={"user": (None, json.dumps({"username": "renamed_test"}), "application/json")}, headers=headers)
+
+    if response.status_code != 200:
+        client.delete(f"/recipe/{recipe_id}", headers=headers)
+        delete_created_user(user_id, access_token, client)
+        raise TestAssertionError(response=response)
+
+    response = client.get(f"/recipe/{recipe_id}", headers=headers)
+
+    if response.status_code != 200 or response.json()["username"] != "renamed_test":
+        client.delete(f"/recipe/{recipe_id}", headers=headers)
+        delete_created_user(user_id, access_token, client)
+        raise TestAssertionError(response=response)
+
+    # The recipes of the renamed user are still listed and owned by them
+    response = client.get("/recipe/user/renamed_test", headers=headers)
+
+    if response.status_code != 200 or [r["_id"] for r in response.json()] != [recipe_id]:
+        client.delete(f"/recipe/{recipe_id}", headers=headers)
+        delete_created_user(user_id, access_token, client)
+        raise TestAssertionError(response=response)
+
+    response = client.delete(f"/recipe/{recipe_id}", headers=headers)
+
+    if response.status_code != 200:
+        delete_created_user(user_id, access_token, client)
+        raise TestAssertionError(response=response)
+
+    # Delete the created user
+    delete_created_user(user_id, access_token, client)
+
+def test_list_followers(client):
+    # Create three users, the first two follow the third
+    tokens, user_ids = [], []
+    for i in range(1, 4):
+        user = {
+            "username": f"follow_test{i}",
+            "email": f"follow_test{i}@example.com",
+            "password": "follow_testpassword"
+        }
+        user_ids.append(client.post("/user/", json=user).json()["_id"])
+        response_token = client.post("/user/token", data={"username": f"follow_test{i}", "password": "follow_testpassword"})
+        tokens.append(response_token.json()["access_token"])
+
+    def cleanup():
+        for user_id, token in zip(user_ids, tokens):
+            delete_created_user(user_id, token, client)
+
+    for token in tokens[:2]:
+        client.post("/user/follow/follow_test3", headers={"Authorization": f"Bearer {token}"})
+
+    # Followers are paginated with a cursor
+    response = client.get("/user/follow_test3/followers", params={"size": 1})
+
+    if (response.status_code != 200
+        or len(response.json()["users"]) != 1
+        or "password" in response.json()["users"][0]
+        or response.json()["next_cursor"] is None):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    first_page = response.json()["users"]
+    response = client.get("/user/follow_test3/followers", params={"size": 1, "cursor": response.json()["next_cursor"]})
+
+    if (response.status_code != 200
+        or response.json()["next_cursor"] is not None
+        or sorted(user["username"] for user in first_page + response.json()["users"]) != ["follow_test1", "follow_test2"]):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    response = client.get("/user/follow_test1/following")
+
+    if response.status_code != 200 or [user["username"] for user in response.json()["users"]] != ["follow_test3"]:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Counters and the follow check are part of the profile
+    response = client.get("/user/follow_test3", headers={"Authorization": f"Bearer {tokens[0]}"})
+
+    if (response.status_code != 200
+        or response.json()["follower_count"] != 2
+        or response.json()["is_following"] is not True):
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Deleting a follower removes its edge and updates the counter
+    delete_created_user(user_ids[0], tokens[0], client)
+    response = client.get("/user/follow_test3")
+
+    if response.status_code != 200 or response.json()["follower_count"] != 1:
+        delete_created_user(user_ids[1], tokens[1], client)
+        delete_created_user(user_ids[2], tokens[2], client)
+        raise TestAssertionError(response=response)
+
+    # Delete the created users
+    delete_created_user(user_ids[1], tokens[1], client)
+    delete_created_user(user_ids[2], tokens[2], client)
+
+def test_show_user_conditional(client):
+    tokens, user_ids = [], []
+    for i in range(1, 3):
+        user = {
+            "username": f"etag_test{i}",
+            "email": f"etag_test{i}@example.com",
+            "password": "etag_testpassword"
+        }
+        user_ids.append(client.post("/user/", json=user).json()["_id"])
+        response_token = client.post("/user/token", data={"username": f"etag_test{i}", "password": "etag_testpassword"})
+        tokens.append(response_token.json()["access_token"])
+
+    def cleanup():
+        for user_id, token in zip(user_ids, tokens):
+            delete_created_user(user_id, token, client)
+
+    headers = {"Authorization": f"Bearer {tokens[0]}"}
+    response = client.get("/user/etag_test2", headers=headers)
+    etag = response.headers.get("ETag")
+
+    if response.status_code != 200 or not etag:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    response = client.get("/user/etag_test2", headers={**headers, "If-None-Match": etag})
+
+    if response.status_code != 304:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # The ETag depends on the viewer, as is_following does
+    response = client.get("/user/etag_test2", headers={"If-None-Match": etag})
+
+    if response.status_code != 200:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    # Following changes the profile
+    client.post("/user/follow/etag_test2", headers=headers)
+    response = client.get("/user/etag_test2", headers={**headers, "If-None-Match": etag})
+
+    if response.status_code != 200 or response.json()["is_following"] is not True:
+        cleanup()
+        raise TestAssertionError(response=response)
+
+    cleanup()
+
+def test_show_users_batch(client):
+    tokens, user_ids = [], []
+    for i in range(1, 3):
+        user = {
+            "username": f"batch_test{i}",
+            "email": f"batch_test{i}@example.com",
+            "password": "batch_testpassword"
+        }
+        user_ids.append(client.post("/user/", json=user).json()["_id"])
+        response_token = client.post("/user/token", data={"username": f"batch_test{i}", "password": "batch_testpassword"})
+        tokens.append(response_token.json()["access_token"])
+
+    def cleanup():
+        for user_id, token in zip(user_ids, tokens):
+            delete_created_user(user_id, token, client)
+
+    headers = {"Authorization": f"Bearer {tokens[0]}"}
+    client.post("/user/follow/batch_test2", headers=headers)
+
+    # Users can be requested by id or username
+    response = client.post("/user/batch", json={"ids": ["batch_test2", user_ids[0], "missing"]}, headers=headers)
+    results = response.json()
+
+    if (response.status_code != 200
+        or results["batch_test2"]["status"] != 200
+        or results["batch_test2"]["user"]["is_following"] is not True
+        or "password" in results["batch_test2"]["user"]
+        or results[user_ids[0]]["user"]["username"] != "batch_test1"
+        or results[user_ids[0]]["user"]["is_following"] is not False
+        or results["missing"]["status"] != 404):
+        cleanup()
+        raise TestAssertionError(response=response)
 
+    cleanup()
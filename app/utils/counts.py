@@ -0,0 +1,34 @@
+"""
+Totals of paginated queries.
+
+Counting the documents matching a filter scans every one of them, so totals
+are only computed when a client asks for them, and are then cached for a few
+seconds keyed by the normalized filter. An empty filter is answered from the
+collection metadata with estimated_document_count instead.
+"""
+import hashlib
+import json
+
+from app.config import settings
+from app.utils.cache import TTLCache
+
+count_cache = TTLCache(maxsize=settings.COUNT_CACHE_SIZE, ttl=settings.COUNT_CACHE_TTL)
+
+
+def count_key(collection_name: str, query: dict) -> str:
+    # Key order does not change what a filter matches, and large $in lists are hashed down
+    normalized = json.dumps(query, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{collection_name}:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+
+async def cached_count(collection, query: dict) -> int:
+    """Number of documents matching a filter, possibly up to settings.COUNT_CACHE_TTL seconds old."""
+    if not query:
+        return await collection.estimated_document_count()
+
+    key = count_key(collection.name, query)
+    total = count_cache.get(key)
+    if total is None:
+        total = await collection.count_documents(query)
+        count_cache.set(key, total)
+    return total
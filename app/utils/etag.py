@@ -0,0 +1,44 @@
+"""
+Conditional GET support.
+
+Recipes, users and the review lists of recipes carry a version counter that
+every write increments ($inc version, or reviews_version on the recipe for its
+reviews, where likes stamp the liked review instead). Their ETags are derived from that counter and whatever else the
+response depends on, so they can be computed from a small projection before
+the document itself is loaded. When the client already holds the current
+version, the endpoint answers 304 Not Modified without loading or serializing
+the document.
+"""
+import hashlib
+from fastapi import Request, Response
+
+# Public recipes can be cached by any cache, but have to be revalidated
+PUBLIC_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+# Responses that depend on the caller are only cached by the client
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag from the parts a response depends on."""
+    digest = hashlib.sha256(":".join("" if part is None else str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the If-None-Match header of the request lists the given ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so a W/ prefix is ignored
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def conditional_headers(response: Response, etag: str, cache_control: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
@@ -0,0 +1,119 @@
+"""
+Follower graph.
+
+Every follow is an edge document in the follows collection, keyed by
+"<follower_id>:<followee_id>", so "does A follow B" is a single _id lookup.
+Compound indexes on each direction serve the paginated follower and following
+lists, and users keep follower_count and following_count counters that are
+updated together with the edges.
+"""
+import logging
+from datetime import datetime
+from typing import Iterable, List, Optional, Set
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+FOLLOWS_COLLECTION = "follows"
+
+logger = logging.getLogger(__name__)
+
+
+def edge_id(follower_id: str, followee_id: str) -> str:
+    return f"{follower_id}:{followee_id}"
+
+
+async def follow(db, follower_id: str, followee_id: str) -> bool:
+    """Create a follow edge, returning False if it already existed."""
+    try:
+        await db[FOLLOWS_COLLECTION].insert_one({
+            "_id": edge_id(follower_id, followee_id),
+            "follower_id": follower_id,
+            "followee_id": followee_id,
+            "created_at": datetime.utcnow().isoformat(),
+        })
+    except DuplicateKeyError:
+        return False
+
+    await count_edge(db, follower_id, followee_id, 1)
+    return True
+
+
+async def unfollow(db, follower_id: str, followee_id: str) -> bool:
+    """Remove a follow edge, returning False if there was none."""
+    result = await db[FOLLOWS_COLLECTION].delete_one({"_id": edge_id(follower_id, followee_id)})
+    if result.deleted_count == 0:
+        return False
+
+    await count_edge(db, follower_id, followee_id, -1)
+    return True
+
+
+async def count_edge(db, follower_id: str, followee_id: str, delta: int):
+    """Move the counters of both ends of an edge that was just created or removed.
+
+    If the counter write fails the two users are recounted from the edges
+    instead, and recount_follows can repair every user after a crash.
+    """
+    try:
+        await db["users"].bulk_write([
+            UpdateOne({"_id": follower_id}, {"$inc": {"following_count": delta, "version": 1}}),
+            UpdateOne({"_id": followee_id}, {"$inc": {"follower_count": delta, "version": 1}}),
+        ], ordered=False)
+    except PyMongoError:
+        logger.exception("Could not update the follow counters, recounting them")
+        await recount_follows(db, [follower_id, followee_id])
+
+
+async def recount_follows(db, user_ids: Optional[List[str]] = None) -> int:
+    """Set follower_count and following_count from the edges, for the given users or all of them."""
+    counts = {}
+    for field, counter in (("followee_id", "follower_count"), ("follower_id", "following_count")):
+        pipeline = [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+        if user_ids is not None:
+            pipeline.insert(0, {"$match": {field: {"$in": user_ids}}})
+        async for group in db[FOLLOWS_COLLECTION].aggregate(pipeline):
+            counts.setdefault(group["_id"], {})[counter] = group["count"]
+
+    query = {"_id": {"$in": user_ids}} if user_ids is not None else {}
+    operations = []
+    async for user in db["users"].find(query, {"_id": 1}):
+        user_counts = counts.get(user["_id"], {})
+        operations.append(UpdateOne({"_id": user["_id"]}, {
+            "$set": {
+                "follower_count": user_counts.get("follower_count", 0),
+                "following_count": user_counts.get("following_count", 0),
+            },
+            "$inc": {"version": 1},
+        }))
+    if operations:
+        await db["users"].bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+async def is_following(db, follower_id: str, followee_id: str) -> bool:
+    if not follower_id or not followee_id:
+        return False
+    return await db[FOLLOWS_COLLECTION].find_one({"_id": edge_id(follower_id, followee_id)}, {"_id": 1}) is not None
+
+
+async def followed_among(db, follower_id: str, user_ids: Iterable[str]) -> Set[str]:
+    """Which of the given users a user follows, with a single lookup by edge id."""
+    edge_ids = [edge_id(follower_id, user_id) for user_id in set(user_ids) if user_id]
+    if not follower_id or not edge_ids:
+        return set()
+    edges = await db[FOLLOWS_COLLECTION].find({"_id": {"$in": edge_ids}}, {"followee_id": 1}).to_list(None)
+    return {edge["followee_id"] for edge in edges}
+
+
+async def following_ids(db, follower_id: str) -> List[str]:
+    """Ids of every user a user follows, for feed and visibility queries."""
+    edges = await db[FOLLOWS_COLLECTION].find({"follower_id": follower_id}, {"followee_id": 1}).to_list(None)
+    return [edge["followee_id"] for edge in edges]
+
+
+async def remove_user_edges(db, user_id: str):
+    """Delete every edge of a deleted user and fix the counters of the users on the other side."""
+    for edge in await db[FOLLOWS_COLLECTION].find({"follower_id": user_id}, {"followee_id": 1}).to_list(None):
+        await unfollow(db, user_id, edge["followee_id"])
+    for edge in await db[FOLLOWS_COLLECTION].find({"followee_id": user_id}, {"follower_id": 1}).to_list(None):
+        await unfollow(db, edge["follower_id"], user_id)
@@ -0,0 +1,136 @@
+"""
+Candidate pool of the "foryou" feed.
+
+The feed shows public recipes from users the caller does not follow. Querying
+that directly needs a $nin over the follow set, which no index can serve
+selectively, so every request would scan nearly all public recipes. Instead,
+the best POOL_SIZE public recipes are ranked periodically, mixing their
+rating, recency and engagement, and kept in memory. Only the newest and the
+most rated POOL_SIZE public recipes are read to rank them, through indexes,
+as an older recipe with few ratings cannot outrank either. Requests drop the
+caller's follow set from the pool in memory and paginate over what is left.
+
+Recipes posted since the last refresh join the pool on the next one. Deleted
+recipes are removed right away, and the page is checked against the database
+when it is resolved, so recipes made private meanwhile are not shown.
+"""
+import asyncio
+import heapq
+import logging
+import math
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+from fastapi import Request
+from pymongo import DESCENDING
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 2000
+REFRESH_INTERVAL = 300  # Seconds
+
+RATING_WEIGHT = 0.4
+RECENCY_WEIGHT = 0.4
+ENGAGEMENT_WEIGHT = 0.2
+
+# Ratings are averaged with PRIOR_COUNT ratings of PRIOR_RATING, so a single
+# five star review does not outrank a recipe with many good ones
+PRIOR_RATING = 3.0
+PRIOR_COUNT = 5
+RECENCY_HALF_LIFE = 7.0  # Days
+ENGAGEMENT_SATURATION = 50  # Number of ratings that counts as full engagement
+
+# Fields of a recipe document the pool needs
+RECIPE_FIELDS = {"user_id": 1, "average_rating": 1, "rating_count": 1, "creation_date": 1}
+
+# Public recipes are read for ranking sorted by each of these fields, highest first
+CANDIDATE_SORT_FIELDS = ["creation_date", "rating_count"]
+
+
+class PoolEntry(NamedTuple):
+    score: float
+    recipe_id: str
+    user_id: Optional[str]
+
+
+def score_recipe(recipe: dict, now: datetime) -> float:
+    count = recipe.get("rating_count") or 0
+    average = recipe.get("average_rating") or 0.0
+    rating = (average * count + PRIOR_RATING * PRIOR_COUNT) / (count + PRIOR_COUNT)
+
+    try:
+        age = (now - datetime.fromisoformat(str(recipe.get("creation_date")))).total_seconds() / 86400
+    except ValueError:
+        age = math.inf
+    recency = 0.5 ** (max(age, 0.0) / RECENCY_HALF_LIFE)
+
+    engagement = min(1.0, math.log1p(count) / math.log1p(ENGAGEMENT_SATURATION))
+
+    return RATING_WEIGHT * (rating - 1) / 4 + RECENCY_WEIGHT * recency + ENGAGEMENT_WEIGHT * engagement
+
+
+class ForYouPool:
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = size
+        self.entries: List[PoolEntry] = []
+        self.refreshed_at: Optional[datetime] = None
+
+    def rank(self, recipes: Iterable[dict], now: Optional[datetime] = None):
+        """Replace the pool with the best ranked of the given public recipes."""
+        now = now or datetime.utcnow()
+        scored = (PoolEntry(score_recipe(recipe, now), recipe["_id"], recipe.get("user_id")) for recipe in recipes)
+        # Ties are broken by id, so the order is total and cursors are stable
+        self.entries = heapq.nlargest(self.size, scored, key=lambda entry: (entry.score, entry.recipe_id))
+        self.refreshed_at = now
+
+    async def refresh(self, db):
+        candidates = {}
+        for field in CANDIDATE_SORT_FIELDS:
+            async for recipe in db["recipes"].find({"is_public": True}, RECIPE_FIELDS) \
+                    .sort([(field, DESCENDING), ("_id", DESCENDING)]).limit(self.size):
+                candidates[recipe["_id"]] = recipe
+        self.rank(candidates.values())
+
+    def remove(self, recipe_id: str):
+        self.entries = [entry for entry in self.entries if entry.recipe_id != recipe_id]
+
+    def page(self, excluded_users: set, size: int, start: int = 0, after: Optional[Tuple[float, str]] = None) -> Tuple[List[PoolEntry], bool]:
+        """Return a page of the pool without the recipes of the excluded users, and whether more follow.
+
+        Pages start either at an offset or after the (score, recipe_id) of the
+        last entry of the previous page.
+        """
+        page = []
+        skipped = 0
+        for entry in self.entries:
+            if entry.user_id in excluded_users:
+                continue
+            if after is not None and (entry.score, entry.recipe_id) >= after:
+                continue
+            if skipped < start:
+                skipped += 1
+                continue
+            if len(page) == size:
+                return page, True
+            page.append(entry)
+        return page, False
+
+
+async def build_foryou_pool(db) -> ForYouPool:
+    pool = ForYouPool()
+    await pool.refresh(db)
+    logger.info("Ranked %d recipes for the foryou feed", len(pool.entries))
+    return pool
+
+
+async def refresh_periodically(pool: ForYouPool, db, interval: float = REFRESH_INTERVAL):
+    """Re-rank the pool every interval seconds, until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await pool.refresh(db)
+        except Exception:
+            logger.exception("Could not refresh the foryou pool")
+
+
+def get_foryou(request: Request) -> ForYouPool:
+    return request.app.foryou
@@ -0,0 +1,134 @@
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.utils.foryou import CANDIDATE_SORT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Fields that GET /recipe/magic can range-filter and sort on. Each one gets a
+# compound (field, _id) index so both the filter and the stable secondary sort
+# on _id are served by the same index.
+MAGIC_SORT_FIELDS = ["cooking_time", "difficulty", "energy", "average_rating", "creation_date"]
+
+# Fields that GET /review/magic/{recipe_id} sorts on, highest first.
+REVIEW_SORT_FIELDS = ["rating", "likes", "creation_date"]
+
+# Declarative registry of every index the routers rely on, keyed by collection.
+# New queries should add their index here instead of creating it ad hoc.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_1", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_1", unique=True),
+        # Accounts above the fan-out threshold, merged into following feeds at read time
+        IndexModel([("follower_count", DESCENDING)], name="follower_count_-1"),
+    ],
+    "collections": [
+        IndexModel([("user_id", ASCENDING), ("name", ASCENDING)], name="user_id_1_name_1"),
+        IndexModel([("user_id", ASCENDING), ("favorite", ASCENDING)], name="user_id_1_favorite_1"),
+        IndexModel([("user_id", ASCENDING)], name="user_id_1"),
+    ],
+    "recipes": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_1"),
+        IndexModel([("username", ASCENDING)], name="username_1"),
+        IndexModel([("is_public", ASCENDING), ("_id", ASCENDING)], name="is_public_1__id_1"),
+        # Candidates of the foryou pool, the newest and the most rated public recipes
+        *[
+            IndexModel([("is_public", ASCENDING), (field, DESCENDING), ("_id", DESCENDING)], name=f"is_public_1_{field}_-1__id_-1")
+            for field in CANDIDATE_SORT_FIELDS
+        ],
+        *[
+            IndexModel([(field, ASCENDING), ("_id", ASCENDING)], name=f"{field}_1__id_1")
+            for field in MAGIC_SORT_FIELDS
+        ],
+    ],
+    "reviews": [
+        IndexModel([("recipe_id", ASCENDING), ("user_id", ASCENDING)], name="recipe_id_1_user_id_1", unique=True),
+        IndexModel([("recipe_id", ASCENDING), ("creation_date", ASCENDING), ("_id", ASCENDING)], name="recipe_id_1_creation_date_1__id_1"),
+        *[
+            IndexModel([("recipe_id", ASCENDING), (field, DESCENDING), ("_id", ASCENDING)], name=f"recipe_id_1_{field}_-1__id_1")
+            for field in REVIEW_SORT_FIELDS
+        ],
+        # Last liked review of a recipe, part of the version of its review lists
+        IndexModel([("recipe_id", ASCENDING), ("likes_updated_date", DESCENDING)], name="recipe_id_1_likes_updated_date_-1"),
+        IndexModel([("user_id", ASCENDING)], name="user_id_1"),
+    ],
+    "follows": [
+        # Followers and following lists, newest first. "Does A follow B" is an _id lookup.
+        IndexModel([("followee_id", ASCENDING), ("created_at", DESCENDING), ("_id", ASCENDING)], name="followee_id_1_created_at_-1__id_1"),
+        IndexModel([("follower_id", ASCENDING), ("created_at", DESCENDING), ("_id", ASCENDING)], name="follower_id_1_created_at_-1__id_1"),
+    ],
+    "timelines": [
+        # A following feed is one range read, newest first
+        IndexModel([("owner_id", ASCENDING), ("creation_date", DESCENDING), ("recipe_id", DESCENDING)], name="owner_id_1_creation_date_-1_recipe_id_-1"),
+        IndexModel([("owner_id", ASCENDING), ("author_id", ASCENDING)], name="owner_id_1_author_id_1"),
+        IndexModel([("author_id", ASCENDING)], name="author_id_1"),
+        IndexModel([("recipe_id", ASCENDING)], name="recipe_id_1"),
+    ],
+    "recipe_search": [
+        IndexModel([("grams", ASCENDING)], name="grams_1"),
+        # Name prefixes, the first candidates of a search
+        IndexModel([("name", ASCENDING)], name="name_1"),
+    ],
+    "password_recovery": [
+        IndexModel([("email", ASCENDING)], name="email_1"),
+    ],
+    "jobs": [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_1_created_at_1"),
+    ],
+    "revoked_tokens": [
+        # TTL index: MongoDB drops each revocation once its token has expired
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_1", expireAfterSeconds=0),
+    ],
+}
+
+
+class IndexBootstrapError(RuntimeError):
+    """Raised when a registered index cannot be built or conflicts with an existing one."""
+
+
+def _normalize_key(key) -> List[tuple]:
+    return [(field, int(direction)) if direction in (ASCENDING, DESCENDING) else (field, direction) for field, direction in key]
+
+
+async def ensure_indexes(db, registry: Dict[str, List[IndexModel]] = None):
+    """Create every registered index and verify the result against the registry.
+
+    Creating an index that already exists with the same spec is a no-op in
+    MongoDB, so this is safe to run on every startup. Indexes present in the
+    database but missing from the registry are logged as drift. A conflicting
+    definition (same name, different keys or options) or a failed build, such
+    as a unique index over duplicated data, aborts startup.
+    """
+    registry = INDEXES if registry is None else registry
+
+    for collection_name, indexes in registry.items():
+        collection = db[collection_name]
+
+        for index in indexes:
+            spec = index.document
+            options = {k: v for k, v in spec.items() if k not in ("key", "name")}
+            try:
+                await collection.create_index(list(spec["key"].items()), name=spec["name"], **options)
+            except OperationFailure as e:
+                raise IndexBootstrapError(
+                    f"Could not build index {spec['name']} on {collection_name}: {e}"
+                ) from e
+
+        existing = await collection.index_information()
+        expected = {index.document["name"]: index.document for index in indexes}
+
+        for name, spec in expected.items():
+            info = existing.get(name)
+            if info is None:
+                raise IndexBootstrapError(f"Index {name} on {collection_name} is missing after creation")
+            if _normalize_key(info["key"]) != _normalize_key(spec["key"].items()) or bool(info.get("unique")) != bool(spec.get("unique")):
+                raise IndexBootstrapError(
+                    f"Index {name} on {collection_name} does not match the registry: {info}"
+                )
+
+        for name in existing:
+            if name != "_id_" and name not in expected:
+                logger.warning("Unregistered index %s found on collection %s", name, collection_name)
@@ -0,0 +1,151 @@
+"""
+Resumable background jobs.
+
+A job is a document in the jobs collection, processed in creation order by
+run_pending_jobs after the request that queued it has answered, and again at
+startup for the jobs an interrupted process left unfinished. Workers claim a
+job atomically before running it, so instances never run the same job at
+once. Every step of a job is idempotent, so a job can be retried from the
+start at any point.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import ReturnDocument, UpdateOne
+
+from app.utils.search import reindex_user_recipes
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = "jobs"
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 1.0  # Seconds, doubled after every failed attempt
+STALE_AFTER = 600  # Seconds without progress after which a running job is claimed again
+
+
+async def enqueue_rename(db, user_id: str, old_username: str, new_username: str) -> str:
+    """Queue the propagation of a username change to every document that copies it."""
+    now = datetime.utcnow()
+    job = {
+        "_id": str(uuid.uuid4()),
+        "type": "rename_user",
+        "status": "pending",
+        "user_id": user_id,
+        "old_username": old_username,
+        "new_username": new_username,
+        "step": None,
+        "progress": {},
+        "attempts": 0,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await db[JOBS_COLLECTION].insert_one(job)
+    return job["_id"]
+
+
+async def _record_progress(db, job: dict, step: str, updated: int):
+    await db[JOBS_COLLECTION].update_one(
+        {"_id": job["_id"]},
+        {"$set": {"step": step, "updated_at": datetime.utcnow()}, "$inc": {f"progress.{step}": updated}},
+    )
+
+
+async def _rename_owned(db, job: dict, collection: str):
+    """Set the new username on the user's documents of a collection, in chunks."""
+    pending = {"user_id": job["user_id"], "username": {"$ne": job["new_username"]}}
+    while True:
+        docs = await db[collection].find(pending, {"_id": 1, "recipe_id": 1}).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        if not docs:
+            return
+        await db[collection].bulk_write([
+            UpdateOne({"_id": doc["_id"], "user_id": job["user_id"]}, {"$set": {"username": job["new_username"]}, "$inc": {"version": 1}})
+            for doc in docs
+        ], ordered=False)
+        if collection == "reviews":
+            # The review lists of the recipes change, and with them their ETags
+            recipe_ids = list({doc["recipe_id"] for doc in docs if doc.get("recipe_id")})
+            await db["recipes"].update_many({"_id": {"$in": recipe_ids}}, {"$inc": {"reviews_version": 1}})
+        await _record_progress(db, job, collection, len(docs))
+
+
+async def run_rename_job(db, job: dict):
+    # Renames converge to the user's current username, so successive renames
+    # of a user end right whatever order their jobs run in
+    user = await db["users"].find_one({"_id": job["user_id"]}, {"username": 1})
+    if user is not None:
+        job = {**job, "new_username": user["username"]}
+
+    # Follow edges reference users by id, so only these copies of the username need updating
+    for collection in ("recipes", "reviews", "collections"):
+        await _rename_owned(db, job, collection)
+        if collection == "recipes":
+            await reindex_user_recipes(db, job["user_id"])
+
+
+JOB_HANDLERS = {
+    "rename_user": run_rename_job,
+}
+
+
+async def claim_next_job(db) -> Optional[dict]:
+    """Atomically claim the oldest runnable job, counting the attempt, or return None.
+
+    Runnable jobs are pending ones, failed ones with attempts left, and running
+    ones whose worker has not updated them for STALE_AFTER seconds, as it
+    probably stopped. A job is only ever claimed by one worker at a time, on
+    any instance.
+    """
+    now = datetime.utcnow()
+    return await db[JOBS_COLLECTION].find_one_and_update(
+        {"attempts": {"$lt": MAX_ATTEMPTS}, "$or": [
+            {"status": {"$in": ["pending", "failed"]}},
+            {"status": "running", "updated_at": {"$lt": now - timedelta(seconds=STALE_AFTER)}},
+        ]},
+        {"$set": {"status": "running", "updated_at": now}, "$inc": {"attempts": 1}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def run_job(db, job: dict) -> bool:
+    """Run a claimed job, retrying it with backoff while it has attempts left, and record its outcome."""
+    while True:
+        try:
+            await JOB_HANDLERS[job["type"]](db, job)
+        except Exception as e:
+            logger.exception("Job %s failed on attempt %d", job["_id"], job["attempts"])
+            if job["attempts"] >= MAX_ATTEMPTS:
+                await db[JOBS_COLLECTION].update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {"status": "failed", "error": str(e), "updated_at": datetime.utcnow()}},
+                )
+                return False
+
+            # The job stays claimed while it waits for its next attempt
+            await db[JOBS_COLLECTION].update_one(
+                {"_id": job["_id"]},
+                {"$set": {"error": str(e), "updated_at": datetime.utcnow()}},
+            )
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** (job["attempts"] - 1))
+            job = await db[JOBS_COLLECTION].find_one_and_update(
+                {"_id": job["_id"]},
+                {"$set": {"updated_at": datetime.utcnow()}, "$inc": {"attempts": 1}},
+                return_document=ReturnDocument.AFTER,
+            )
+            continue
+
+        await db[JOBS_COLLECTION].update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "done", "step": None, "error": None, "updated_at": datetime.utcnow()}},
+        )
+        return True
+
+
+async def run_pending_jobs(db):
+    """Claim and run unfinished jobs in creation order until none is left."""
+    while (job := await claim_next_job(db)) is not None:
+        await run_job(db, job)
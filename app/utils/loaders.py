@@ -0,0 +1,113 @@
+import asyncio
+from typing import Dict, List, Optional, Set
+from fastapi import Request
+
+USER_FIELDS = ("_id", "username")
+
+
+class UserLoader:
+    """Batches and memoizes the user lookups made while handling one request.
+
+    Lookups by id or username requested in the same event loop iteration, for
+    example through asyncio.gather, are resolved with a single `$in` query, and
+    a user is never fetched twice in the same request. Callers get a copy of
+    the cached document, so they can modify it freely.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.db_calls = 0
+        self._cache: Dict[str, Dict[str, Optional[dict]]] = {field: {} for field in USER_FIELDS}
+        self._pending: Dict[str, Dict[str, asyncio.Future]] = {field: {} for field in USER_FIELDS}
+        self._scheduled = False
+        # The event loop only keeps weak references to tasks, so running dispatches are kept here
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, user_id: str) -> Optional[dict]:
+        return await self._load("_id", user_id)
+
+    async def load_by_username(self, username: str) -> Optional[dict]:
+        return await self._load("username", username)
+
+    async def load_many(self, user_ids: List[str]) -> List[Optional[dict]]:
+        return list(await asyncio.gather(*(self.load(user_id) for user_id in user_ids)))
+
+    async def load_many_by_username(self, usernames: List[str]) -> List[Optional[dict]]:
+        return list(await asyncio.gather(*(self.load_by_username(username) for username in usernames)))
+
+    def prime(self, user: dict):
+        for field in USER_FIELDS:
+            if field in user:
+                self._cache[field][user[field]] = user
+
+    def clear(self, user: Optional[dict] = None):
+        """Forget a user after it has been modified, or every user if none is given."""
+        if user is None:
+            for cache in self._cache.values():
+                cache.clear()
+            return
+        for field in USER_FIELDS:
+            self._cache[field].pop(user.get(field), None)
+
+    async def _load(self, field: str, key: str) -> Optional[dict]:
+        cache = self._cache[field]
+        if key not in cache:
+            pending = self._pending[field]
+            if key not in pending:
+                loop = asyncio.get_running_loop()
+                pending[key] = loop.create_future()
+                if not self._scheduled:
+                    # Let every coroutine that is ready queue its keys before querying
+                    self._scheduled = True
+                    loop.call_soon(self._start_dispatch)
+            await pending[key]
+
+        user = cache.get(key)
+        return dict(user) if user is not None else None
+
+    def _start_dispatch(self):
+        task = asyncio.get_running_loop().create_task(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        self._scheduled = False
+        batches = {field: pending for field, pending in self._pending.items() if pending}
+        self._pending = {field: {} for field in USER_FIELDS}
+
+        conditions = [{field: {"$in": list(pending)}} for field, pending in batches.items()]
+        query = conditions[0] if len(conditions) == 1 else {"$or": conditions}
+
+        self.db_calls += 1
+        try:
+            users = await self.db["users"].find(query).to_list(None)
+            for user in users:
+                self.prime(user)
+        except Exception as e:
+            # Every failure reaches the callers waiting on the batch
+            for pending in batches.values():
+                for future in pending.values():
+                    future.set_exception(e)
+            return
+
+        for field, pending in batches.items():
+            for key, future in pending.items():
+                self._cache[field].setdefault(key, None)
+                future.set_result(None)
+
+
+def get_user_loader(request: Request) -> UserLoader:
+    """Dependency returning the user loader of the current request."""
+    loader = getattr(request.state, "user_loader", None)
+    if loader is None:
+        loader = request.state.user_loader = UserLoader(request.app.mongodb)
+    return loader
+
+
+async def user_loader_metrics(request: Request, call_next):
+    """Middleware exposing how many user queries the request needed."""
+    response = await call_next(request)
+    loader = getattr(request.state, "user_loader", None)
+    if loader is not None:
+        response.headers["X-User-DB-Calls"] = str(loader.db_calls)
+    return response
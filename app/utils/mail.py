@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import smtplib
+import ssl
+from email.message import Message
+from typing import Callable, List, Optional
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPTransport:
+    """Sends messages over a single SMTP over SSL connection, opened lazily and reused.
+
+    smtplib connections are not thread safe, so every queue worker owns its
+    own transport. A connection dropped by the server is reopened once before
+    the send is reported as failed.
+    """
+
+    def __init__(self, host: str, port: int, user: Optional[str], password: Optional[str]):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self._server: Optional[smtplib.SMTP_SSL] = None
+
+    def _connect(self) -> smtplib.SMTP_SSL:
+        server = smtplib.SMTP_SSL(self.host, self.port, context=ssl.create_default_context(), timeout=30)
+        if self.user:
+            server.login(self.user, self.password)
+        return server
+
+    def send(self, message: Message):
+        if self._server is None:
+            self._server = self._connect()
+        try:
+            self._server.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self._server = self._connect()
+            self._server.send_message(message)
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except smtplib.SMTPException:
+                pass
+            self._server = None
+
+
+class SinkTransport:
+    """Keeps the messages in memory instead of sending them, for tests and local development."""
+
+    def __init__(self):
+        self.sent: List[Message] = []
+
+    def send(self, message: Message):
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+class MailQueue:
+    """Bounded in-process queue of outgoing mail, sent in the background by worker tasks.
+
+    Requests only enqueue messages, so their latency never includes an SMTP
+    session. Each worker reuses its own transport connection across messages.
+    A failed send is retried up to max_retries times, waiting backoff, 2 *
+    backoff, 4 * backoff... seconds in between, and then dropped with an error
+    log.
+    """
+
+    def __init__(self, transport_factory: Callable[[], object], workers: int = 2, maxsize: int = 1000,
+                 max_retries: int = 3, backoff: float = 1.0):
+        self.transport_factory = transport_factory
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.transports: list = []
+        self.failed = 0
+        self._tasks: List[asyncio.Task] = []
+
+    def enqueue(self, message: Message) -> bool:
+        """Queue a message for delivery, returning False if the queue is full."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logger.error("Mail queue is full, dropping message to %s", message["To"])
+            return False
+        return True
+
+    async def start(self):
+        self.transports = [self.transport_factory() for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(transport)) for transport in self.transports]
+
+    async def stop(self, timeout: float = 10.0):
+        """Try to deliver the queued messages, then stop the workers and close their connections."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping the mail queue with %d undelivered messages", self.queue.qsize())
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for transport in self.transports:
+            await run_in_threadpool(transport.close)
+        self._tasks = []
+
+    async def join(self):
+        """Wait until every queued message has been sent or dropped."""
+        await self.queue.join()
+
+    async def _worker(self, transport):
+        while True:
+            message = await self.queue.get()
+            try:
+                await self._deliver(transport, message)
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, transport, message: Message):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await run_in_threadpool(transport.send, message)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    logger.error("Could not send mail to %s after %d attempts: %s", message["To"], attempt + 1, e)
+                    return
+                logger.warning("Sending mail to %s failed, retrying: %s", message["To"], e)
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+
+def create_mailer(settings) -> MailQueue:
+    if settings.MAIL_BACKEND == "sink" or settings.TEST_ENV:
+        transport_factory = SinkTransport
+    else:
+        def transport_factory():
+            return SMTPTransport(settings.SMTP_HOST, settings.SMTP_PORT, settings.EMAIL_USER, settings.EMAIL_PASS)
+
+    return MailQueue(transport_factory, workers=settings.MAIL_WORKERS, maxsize=settings.MAIL_QUEUE_SIZE,
+                     max_retries=settings.MAIL_MAX_RETRIES, backoff=settings.MAIL_RETRY_BACKOFF)
+
+
+def get_mailer(request: Request) -> MailQueue:
+    return request.app.mailer
@@ -0,0 +1,199 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import asyncio
+import logging
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config import settings
+from app.utils.follows import FOLLOWS_COLLECTION, edge_id, recount_follows
+from app.utils.timelines import rebuild_timeline
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+async def migrate_embedded_reviews(db, batch_size: int = 100) -> int:
+    """Move the reviews embedded in recipe documents into the reviews collection.
+
+    Each recipe is handled on its own: its reviews are upserted by _id and only
+    then is the embedded array removed, so the migration can be interrupted and
+    run again at any point without losing or duplicating reviews. A legacy
+    duplicate review of the same recipe by the same user is dropped in favour
+    of the one already migrated.
+    """
+    migrated = 0
+
+    while True:
+        recipes = await db["recipes"].find({"reviews": {"$exists": True}}, {"reviews": 1}).limit(batch_size).to_list(length=batch_size)
+        if not recipes:
+            return migrated
+
+        for recipe in recipes:
+            operations = [
+                ReplaceOne({"_id": review["_id"]}, {**review, "recipe_id": recipe["_id"]}, upsert=True)
+                for review in recipe.get("reviews") or []
+            ]
+
+            if operations:
+                try:
+                    await db["reviews"].bulk_write(operations, ordered=False)
+                except BulkWriteError as e:
+                    errors = e.details.get("writeErrors", [])
+                    if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                        raise
+                    logger.warning("Skipped %d duplicate reviews of recipe %s", len(errors), recipe["_id"])
+
+            await db["recipes"].update_one({"_id": recipe["_id"]}, {"$unset": {"reviews": ""}, "$inc": {"version": 1, "reviews_version": 1}})
+            migrated += len(operations)
+
+
+async def migrate_liked_by_ids(db, batch_size: int = 500) -> int:
+    """Replace the usernames in the liked_by lists of reviews with user ids.
+
+    Entries that already are a user id are kept, and so are usernames that no
+    longer resolve, so running it again only converts what is left. A user
+    listed under both an old username and its id counts once.
+    """
+    migrated = 0
+    last_id = None
+
+    while True:
+        query = {"liked_by.0": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        reviews = await db["reviews"].find(query, {"liked_by": 1, "recipe_id": 1}).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not reviews:
+            return migrated
+        last_id = reviews[-1]["_id"]
+
+        names = {name for review in reviews for name in review["liked_by"]}
+        user_ids = {doc["_id"] async for doc in db["users"].find({"_id": {"$in": list(names)}}, {"_id": 1})}
+        ids = {doc["username"]: doc["_id"] async for doc in db["users"].find({"username": {"$in": list(names - user_ids)}}, {"username": 1})}
+
+        operations, recipe_ids = [], set()
+        for review in reviews:
+            liked_by = list(dict.fromkeys(name if name in user_ids else ids.get(name, name) for name in review["liked_by"]))
+            if liked_by != review["liked_by"]:
+                operations.append(UpdateOne({"_id": review["_id"]}, {"$set": {"liked_by": liked_by, "likes": len(liked_by)}, "$inc": {"version": 1}}))
+                recipe_ids.add(review["recipe_id"])
+
+        if operations:
+            await db["reviews"].bulk_write(operations, ordered=False)
+            await db["recipes"].update_many({"_id": {"$in": list(recipe_ids)}}, {"$inc": {"reviews_version": 1}})
+            migrated += len(operations)
+
+
+async def backfill_rating_counters(db, batch_size: int = 500) -> int:
+    """Set rating_sum, rating_count and average_rating of every recipe from its reviews.
+
+    The counters are recomputed from scratch, so the backfill is idempotent
+    and can be run again to repair drifted counters.
+    """
+    totals = {}
+    async for group in db["reviews"].aggregate([
+        {"$group": {"_id": "$recipe_id", "rating_sum": {"$sum": "$rating"}, "rating_count": {"$sum": 1}}}
+    ]):
+        totals[group["_id"]] = (group["rating_sum"], group["rating_count"])
+
+    updated = 0
+    operations = []
+    async for recipe in db["recipes"].find({}, {"_id": 1}):
+        rating_sum, rating_count = totals.get(recipe["_id"], (0.0, 0))
+        operations.append(UpdateOne({"_id": recipe["_id"]}, {"$set": {
+            "rating_sum": rating_sum,
+            "rating_count": rating_count,
+            "average_rating": rating_sum / rating_count if rating_count else 0.0,
+        }, "$inc": {"version": 1}}))
+
+        if len(operations) >= batch_size:
+            await db["recipes"].bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+
+    if operations:
+        await db["recipes"].bulk_write(operations, ordered=False)
+        updated += len(operations)
+
+    return updated
+
+
+async def migrate_follow_lists(db, batch_size: int = 100) -> int:
+    """Turn the followers and following username lists of users into follows edges.
+
+    Both lists of a user are converted to edges, skipping usernames that no
+    longer exist, before they are removed, so the migration can be interrupted
+    and run again. follower_count and following_count are then recomputed from
+    the edges, which makes it safe to run on already migrated data too and
+    repairs counters left out of step by a failed follow or unfollow.
+    """
+    migrated = 0
+    pending = {"$or": [{"followers": {"$exists": True}}, {"following": {"$exists": True}}]}
+
+    while True:
+        users = await db["users"].find(pending, {"followers": 1, "following": 1}).limit(batch_size).to_list(length=batch_size)
+        if not users:
+            break
+
+        usernames = {name for user in users for name in (user.get("followers") or []) + (user.get("following") or [])}
+        ids = {doc["username"]: doc["_id"] async for doc in db["users"].find({"username": {"$in": list(usernames)}}, {"username": 1})}
+
+        for user in users:
+            pairs = [(ids[name], user["_id"]) for name in user.get("followers") or [] if name in ids]
+            pairs += [(user["_id"], ids[name]) for name in user.get("following") or [] if name in ids]
+            operations = [
+                UpdateOne(
+                    {"_id": edge_id(follower_id, followee_id)},
+                    {"$setOnInsert": {"follower_id": follower_id, "followee_id": followee_id, "created_at": datetime.utcnow().isoformat()}},
+                    upsert=True,
+                )
+                for follower_id, followee_id in set(pairs) if follower_id != followee_id
+            ]
+            if operations:
+                await db[FOLLOWS_COLLECTION].bulk_write(operations, ordered=False)
+
+            await db["users"].update_one({"_id": user["_id"]}, {"$unset": {"followers": "", "following": ""}, "$inc": {"version": 1}})
+            migrated += len(operations)
+
+    await recount_follows(db)
+    return migrated
+
+
+async def backfill_timelines(db) -> int:
+    """Fill the following timeline of every user that follows someone.
+
+    Entries are upserted, so running it again only adds what is missing.
+    """
+    rebuilt = 0
+    async for user in db["users"].find({"following_count": {"$gt": 0}}, {"_id": 1}):
+        await rebuild_timeline(db, user["_id"])
+        rebuilt += 1
+    return rebuilt
+
+
+MIGRATIONS = [
+    migrate_embedded_reviews,
+    migrate_liked_by_ids,
+    backfill_rating_counters,
+    migrate_follow_lists,
+    backfill_timelines,
+]
+
+
+async def run_migrations(db):
+    for migration in MIGRATIONS:
+        result = await migration(db)
+        print(f"{migration.__name__}: {result}")
+
+
+if __name__ == "__main__":
+    client = AsyncIOMotorClient(settings.DB_URL)
+    try:
+        asyncio.run(run_migrations(client[settings.DB_NAME]))
+    finally:
+        client.close()
@@ -0,0 +1,103 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from fastapi import HTTPException
+from pymongo import ASCENDING, DESCENDING
+
+
+# Datetimes, e.g. updated_at, are stored as BSON dates and compared as such, so
+# cursors keep them as tagged ISO strings and restore them when decoded
+DATETIME_TAG = "$date"
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_value(obj: dict):
+    if len(obj) == 1 and DATETIME_TAG in obj:
+        return datetime.fromisoformat(obj[DATETIME_TAG])
+    return obj
+
+
+def encode_cursor(payload: dict) -> str:
+    """Encode a cursor payload as an opaque, URL-safe token."""
+    raw = json.dumps(payload, separators=(",", ":"), sort_keys=True, default=_encode_value).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    """Decode a token created by encode_cursor, raising a 400 if it is malformed."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")), object_hook=_decode_value)
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return payload
+
+
+def keyset_predicate(sort_by: str | None, ascending: bool, last_value, last_id) -> dict:
+    """Build the filter that resumes a (sort_by, _id ASC) ordered scan after the given document.
+
+    Documents without the sort field sort as null, which is the lowest value in
+    MongoDB, so they come first in ascending scans and last in descending ones.
+    """
+    if not sort_by:
+        return {"_id": {"$gt": last_id}}
+
+    same_value = {sort_by: last_value, "_id": {"$gt": last_id}}
+
+    if last_value is None:
+        if ascending:
+            return {"$or": [{sort_by: {"$ne": None}}, same_value]}
+        return same_value
+
+    operator = "$gt" if ascending else "$lt"
+    following = [{sort_by: {operator: last_value}}, same_value]
+    if not ascending:
+        following.append({sort_by: None})
+    return {"$or": following}
+
+
+async def find_page(collection, query: dict, sort_by: str | None, ascending: bool, size: int, cursor: str, projection: dict = None):
+    """Return one page of a (sort_by, _id ASC) ordered query and the cursor of the next page.
+
+    An empty cursor requests the first page. The next cursor is None on the last page.
+    """
+    if size < 1:
+        raise HTTPException(status_code=400, detail="Size must be positive.")
+
+    if cursor:
+        state = decode_cursor(cursor)
+        if state.get("sort_by") != sort_by or state.get("order") != ascending or "id" not in state:
+            raise HTTPException(status_code=400, detail="Cursor does not match the requested sorting")
+
+        predicate = keyset_predicate(sort_by, ascending, state.get("value"), state["id"])
+        query = {"$and": [query, predicate]} if query else predicate
+
+    if sort_by:
+        sort_params = [(sort_by, ASCENDING if ascending else DESCENDING), ("_id", ASCENDING)]
+    else:
+        sort_params = [("_id", ASCENDING)]
+
+    # Fetch one extra document to know whether there is a next page without counting
+    documents = await collection.find(query, projection).sort(sort_params).limit(size + 1).to_list(length=size + 1)
+
+    next_cursor = None
+    if len(documents) > size:
+        documents = documents[:size]
+        last = documents[-1]
+        next_cursor = encode_cursor({
+            "sort_by": sort_by,
+            "order": ascending,
+            "value": last.get(sort_by) if sort_by else None,
+            "id": last["_id"],
+        })
+
+    return documents, next_cursor
@@ -0,0 +1,168 @@
+"""
+Fuzzy recipe search.
+
+A search term matches a recipe when its characters appear in order, case
+insensitively, in the recipe name, one of its ingredient names or its owner's
+username (the old `p.*a.*s.*t.*a` regex semantics). Contiguous n-grams would
+drop most of those matches, so every indexed text is instead decomposed into
+its single characters plus every ordered character pair (not only adjacent
+ones). Any text containing the search term as a subsequence contains each of
+the term's adjacent pairs as an ordered pair, so an `$all` lookup on the
+multikey `grams` index yields a superset of the matches, which is then
+verified and ranked in Python.
+
+Short or common terms match nearly every recipe, so at most MAX_CANDIDATES
+postings are verified and ranked per search, keeping a broad search as cheap
+as a selective one. Candidates are fetched best tier first (name prefixes,
+then substrings of any field, then scattered matches, which always score
+lower), so the cap only ever drops the least relevant matches.
+"""
+import logging
+import re
+from typing import Dict, List, Optional, Set
+from pymongo import ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+SEARCH_COLLECTION = "recipe_search"
+
+# Postings verified and ranked per search
+MAX_CANDIDATES = 1000
+
+# Weight of a match depending on the recipe field it was found in
+FIELD_WEIGHTS = {"name": 1.0, "ingredients": 0.8, "username": 0.6}
+
+
+def _normalize(text: Optional[str]) -> str:
+    return (text or "").lower()
+
+
+def text_grams(text: str) -> Set[str]:
+    """Return the single characters and ordered character pairs of a text."""
+    grams = set(text)
+    for i, first in enumerate(text):
+        for second in text[i + 1:]:
+            grams.add(first + second)
+    return grams
+
+
+def query_grams(term: str) -> List[str]:
+    """Return the grams every text matching the term must contain."""
+    if len(term) == 1:
+        return [term]
+    return sorted({term[i:i + 2] for i in range(len(term) - 1)})
+
+
+def search_document(recipe: dict) -> dict:
+    """Build the side collection document indexing a recipe."""
+    fields = {
+        "name": [_normalize(recipe.get("name"))],
+        "ingredients": [_normalize(ingredient.get("name")) for ingredient in recipe.get("ingredients", [])],
+        "username": [_normalize(recipe.get("username"))],
+    }
+
+    grams = set()
+    for texts in fields.values():
+        for text in texts:
+            grams |= text_grams(text)
+
+    return {"_id": recipe["_id"], "grams": sorted(grams), **fields}
+
+
+def match_score(term: str, text: str) -> Optional[float]:
+    """Score how well a term matches a text, or None if its characters are not in order.
+
+    Substrings score above scattered matches, prefixes above other substrings,
+    and scattered matches score higher the more compact they are.
+    """
+    if term in text:
+        return 2.5 if text.startswith(term) else 2.0
+
+    position = 0
+    first = None
+    for char in term:
+        position = text.find(char, position)
+        if position == -1:
+            return None
+        if first is None:
+            first = position
+        position += 1
+
+    return len(term) / (position - first)
+
+
+def relevance(term: str, document: dict) -> Optional[float]:
+    best = None
+    for field, weight in FIELD_WEIGHTS.items():
+        for text in document.get(field, []):
+            score = match_score(term, text)
+            if score is not None and (best is None or score * weight > best):
+                best = score * weight
+    return best
+
+
+async def index_recipe(db, recipe: dict):
+    await db[SEARCH_COLLECTION].replace_one({"_id": recipe["_id"]}, search_document(recipe), upsert=True)
+
+
+async def remove_recipe(db, recipe_id: str):
+    await db[SEARCH_COLLECTION].delete_one({"_id": recipe_id})
+
+
+async def reindex_user_recipes(db, user_id: str):
+    async for recipe in db["recipes"].find({"user_id": user_id}, {"name": 1, "ingredients.name": 1, "username": 1}):
+        await index_recipe(db, recipe)
+
+
+async def rebuild_search_index(db, batch_size: int = 500):
+    """Index every recipe, e.g. to backfill the side collection for existing data."""
+    operations = []
+    async for recipe in db["recipes"].find({}, {"name": 1, "ingredients.name": 1, "username": 1}):
+        document = search_document(recipe)
+        operations.append(ReplaceOne({"_id": document["_id"]}, document, upsert=True))
+        if len(operations) >= batch_size:
+            await db[SEARCH_COLLECTION].bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db[SEARCH_COLLECTION].bulk_write(operations, ordered=False)
+
+
+async def ensure_search_index(db):
+    """Backfill the search side collection when it is empty but recipes exist."""
+    if await db[SEARCH_COLLECTION].estimated_document_count() == 0 and await db["recipes"].estimated_document_count() > 0:
+        logger.info("Search index is empty, rebuilding it from the recipes collection")
+        await rebuild_search_index(db)
+
+
+def match_tiers(term: str) -> List[dict]:
+    """Filters on the side collection from the most to the least relevant matches of a term."""
+    substring = re.escape(term)
+    return [
+        {"name": {"$regex": f"^{substring}"}},
+        {"$or": [{field: {"$regex": substring}} for field in FIELD_WEIGHTS]},
+        {},
+    ]
+
+
+async def search_recipe_ids(db, search: str, limit: int = MAX_CANDIDATES) -> List[str]:
+    """Return the ids of the recipes matching a search term, most relevant first, among the best limit candidates."""
+    term = _normalize(search)
+    if not term:
+        return []
+
+    projection = {field: 1 for field in FIELD_WEIGHTS}
+    scores: Dict[str, float] = {}
+    previous = []
+    for tier in match_tiers(term):
+        query = {"grams": {"$all": query_grams(term)}, **tier}
+        if previous:
+            query["$nor"] = previous
+        async for document in db[SEARCH_COLLECTION].find(query, projection).limit(limit - len(scores)):
+            score = relevance(term, document)
+            if score is not None:
+                scores[document["_id"]] = score
+        if len(scores) >= limit:
+            break
+        previous.append(tier)
+
+    return sorted(scores, key=lambda recipe_id: (-scores[recipe_id], recipe_id))
@@ -1,10 +1,50 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
 import bcrypt
 
+from app.config import settings
+
+# bcrypt releases the GIL while hashing, so a small thread pool runs hashes in
+# parallel without blocking the event loop, and bounds how many run at once
+_executor = ThreadPoolExecutor(max_workers=settings.HASH_WORKERS, thread_name_prefix="bcrypt")
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    salt = bcrypt.gensalt(rounds or settings.BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+def hash_rounds(hashed_password: str) -> int:
+    """Return the work factor of a bcrypt hash, e.g. 12 for "$2b$12$..."."""
+    return int(hashed_password.split("$")[2])
+
+
+def needs_rehash(hashed_password: str, rounds: Optional[int] = None) -> bool:
+    # Hashes stronger than the configured work factor are kept, never downgraded
+    return hash_rounds(hashed_password) < (rounds or settings.BCRYPT_ROUNDS)
+
+
+async def hash_password_async(password: str, rounds: Optional[int] = None) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_executor, hash_password, password, rounds)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_executor, verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update(plain_password: str, hashed_password: str, rounds: Optional[int] = None) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a new hash if the stored one uses a lower work factor.
+
+    The new hash is None when the password is wrong or the stored hash is up to date.
+    """
+    if not await verify_password_async(plain_password, hashed_password):
+        return False, None
+    if needs_rehash(hashed_password, rounds):
+        return True, await hash_password_async(plain_password, rounds)
+    return True, None
@@ -0,0 +1,204 @@
+"""
+Ingredient based recipe similarity.
+
+Every recipe is reduced to the set of its normalized ingredient names and a
+MinHash signature of that set, kept in memory together with a few numeric
+attributes. Signatures are split into bands and hashed into LSH buckets, so
+the recipes sharing a bucket with a given one are exactly the candidates
+likely to have a high ingredient overlap (Jaccard similarity). Candidates are
+then scored exactly, mixing the ingredient overlap with how close their
+cooking time, difficulty and energy are.
+
+Ranked neighbours are cached per recipe, without visibility filtering, and
+filtered for the viewer on every request. Adding, updating or removing a
+recipe only changes the candidates of the recipes sharing one of its buckets,
+so only their cached results are dropped. Owners are identified by user id,
+so renaming a user needs no update.
+"""
+import hashlib
+import logging
+import random
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 64
+BANDS = 32  # Two rows per band: pairs above ~0.2 Jaccard similarity are usually candidates
+ROWS = NUM_PERMUTATIONS // BANDS
+
+# Number of neighbours kept in the per-recipe cache, the most a request can ask for
+MAX_NEIGHBOURS = 50
+
+INGREDIENT_WEIGHT = 0.8
+ATTRIBUTE_FIELDS = ("cooking_time", "difficulty", "energy")
+
+# Fields of a recipe document the index needs
+RECIPE_FIELDS = {"ingredients.name": 1, "is_public": 1, "user_id": 1, **{field: 1 for field in ATTRIBUTE_FIELDS}}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(1234)  # Fixed seed, so signatures do not change between restarts
+_PERMUTATIONS = [(_random.randrange(1, _MERSENNE_PRIME), _random.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def normalize_ingredient(name: Optional[str]) -> str:
+    """Lowercase an ingredient name, collapse its spaces and drop a plural ending."""
+    name = re.sub(r"\s+", " ", (name or "").lower()).strip()
+    if name.endswith("oes"):
+        return name[:-2]
+    if len(name) > 3 and name.endswith("s") and not name.endswith("ss"):
+        return name[:-1]
+    return name
+
+
+def ingredient_set(recipe: dict) -> frozenset:
+    names = (normalize_ingredient(ingredient.get("name")) for ingredient in recipe.get("ingredients") or [])
+    return frozenset(name for name in names if name)
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash(tokens: Iterable[str]) -> Tuple[int, ...]:
+    hashes = [_token_hash(token) for token in tokens]
+    if not hashes:
+        return ()
+    return tuple(min((a * value + b) % _MERSENNE_PRIME for value in hashes) for a, b in _PERMUTATIONS)
+
+
+def lsh_buckets(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)] if signature else []
+
+
+def attribute_similarity(first: Tuple[float, ...], second: Tuple[float, ...]) -> float:
+    """Average of min/max ratios of the numeric attributes, 1 when both are zero."""
+    total = 0.0
+    for a, b in zip(first, second):
+        high = max(a, b)
+        total += min(a, b) / high if high > 0 else 1.0
+    return total / len(ATTRIBUTE_FIELDS)
+
+
+class SimilarityEntry(NamedTuple):
+    ingredients: frozenset
+    attributes: Tuple[float, ...]
+    buckets: List[Tuple[int, Tuple[int, ...]]]
+    is_public: bool
+    user_id: Optional[str]
+
+
+class SimilarityIndex:
+    """In-memory MinHash/LSH index answering the most similar recipes of a recipe."""
+
+    def __init__(self):
+        self.entries: Dict[str, SimilarityEntry] = {}
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self._neighbours: Dict[str, List[str]] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def upsert(self, recipe: dict):
+        """Add a recipe to the index, or refresh it after an update."""
+        recipe_id = recipe["_id"]
+        previous = self.entries.get(recipe_id)
+
+        ingredients = ingredient_set(recipe)
+        if previous is not None and previous.ingredients == ingredients:
+            buckets = previous.buckets
+        else:
+            buckets = lsh_buckets(minhash(ingredients))
+
+        entry = SimilarityEntry(
+            ingredients=ingredients,
+            attributes=tuple(float(recipe.get(field) or 0) for field in ATTRIBUTE_FIELDS),
+            buckets=buckets,
+            is_public=recipe.get("is_public", True),
+            user_id=recipe.get("user_id"),
+        )
+
+        if previous is not None:
+            self._invalidate(previous)
+            self._unlink(recipe_id, previous)
+        self.entries[recipe_id] = entry
+        self._neighbours.pop(recipe_id, None)
+        for bucket in buckets:
+            self.buckets.setdefault(bucket, set()).add(recipe_id)
+        self._invalidate(entry)
+
+    def remove(self, recipe_id: str):
+        entry = self.entries.pop(recipe_id, None)
+        if entry is None:
+            return
+        self._invalidate(entry)
+        self._unlink(recipe_id, entry)
+        self._neighbours.pop(recipe_id, None)
+
+    def neighbours(self, recipe_id: str) -> List[str]:
+        """Ids of the recipes most similar to a recipe, best first, regardless of visibility."""
+        if recipe_id in self._neighbours:
+            return self._neighbours[recipe_id]
+
+        entry = self.entries.get(recipe_id)
+        if entry is None:
+            return []
+
+        candidates = set()
+        for bucket in entry.buckets:
+            candidates |= self.buckets.get(bucket, set())
+        candidates.discard(recipe_id)
+
+        scores = {candidate: self.score(entry, self.entries[candidate]) for candidate in candidates}
+        ranked = sorted(scores, key=lambda candidate: (-scores[candidate], candidate))[:MAX_NEIGHBOURS]
+        self._neighbours[recipe_id] = ranked
+        return ranked
+
+    def similar(self, recipe_id: str, limit: int, user_id: Optional[str] = None, following: Iterable[str] = ()) -> List[str]:
+        """Ids of the recipes most similar to a recipe that the given user can see.
+
+        A recipe is visible when it is public, owned by the user, or owned by
+        someone the user follows, given as user ids.
+        """
+        following = set(following)
+        visible = []
+        for candidate in self.neighbours(recipe_id):
+            entry = self.entries[candidate]
+            if entry.is_public or (user_id is not None and (entry.user_id == user_id or entry.user_id in following)):
+                visible.append(candidate)
+                if len(visible) == limit:
+                    break
+        return visible
+
+    @staticmethod
+    def score(first: SimilarityEntry, second: SimilarityEntry) -> float:
+        union = len(first.ingredients | second.ingredients)
+        jaccard = len(first.ingredients & second.ingredients) / union if union else 0.0
+        return INGREDIENT_WEIGHT * jaccard + (1 - INGREDIENT_WEIGHT) * attribute_similarity(first.attributes, second.attributes)
+
+    def _unlink(self, recipe_id: str, entry: SimilarityEntry):
+        for bucket in entry.buckets:
+            members = self.buckets.get(bucket)
+            if members is not None:
+                members.discard(recipe_id)
+                if not members:
+                    del self.buckets[bucket]
+
+    def _invalidate(self, entry: SimilarityEntry):
+        # Only recipes sharing a bucket can have this recipe among their candidates
+        for bucket in entry.buckets:
+            for recipe_id in self.buckets.get(bucket, ()):
+                self._neighbours.pop(recipe_id, None)
+
+
+async def build_similarity_index(db) -> SimilarityIndex:
+    index = SimilarityIndex()
+    async for recipe in db["recipes"].find({}, RECIPE_FIELDS):
+        index.upsert(recipe)
+    logger.info("Similarity index built with %d recipes", len(index))
+    return index
+
+
+def get_similarity(request: Request) -> SimilarityIndex:
+    return request.app.similarity
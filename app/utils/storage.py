@@ -0,0 +1,159 @@
+import asyncio
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import List
+from fastapi import HTTPException, Request, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+# Uploads are streamed in chunks of this size. GCS resumable uploads require
+# a multiple of 256 KiB.
+CHUNK_SIZE = 1024 * 1024
+
+
+class ImageStorage(ABC):
+    """Base class of the image upload backends, shared by all the routers.
+
+    Uploaded files are streamed chunk by chunk to the backend on the thread
+    pool, so neither the whole file nor a temporary copy is ever needed, and
+    the event loop never blocks on storage I/O.
+    """
+
+    def __init__(self, max_upload_bytes: int, upload_concurrency: int = 4):
+        self.max_upload_bytes = max_upload_bytes
+        self.upload_concurrency = upload_concurrency
+
+    def object_name(self, filename: str, prefix: str = "recipes") -> str:
+        stem, extension = os.path.splitext(filename or "image")
+        # Concurrent uploads of files with the same name must not share an object
+        return f"{prefix}/{stem.replace(' ', '_')}-{uuid.uuid4().hex}{extension}"
+
+    async def upload(self, file: UploadFile, prefix: str = "recipes") -> str:
+        """Store an uploaded file and return its public URL."""
+        name = self.object_name(file.filename, prefix)
+        writer = await run_in_threadpool(self._open, name, file.content_type)
+
+        try:
+            size = 0
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.max_upload_bytes:
+                    raise HTTPException(status_code=413, detail=f"File {file.filename} exceeds the maximum upload size")
+                await run_in_threadpool(writer.write, chunk)
+            await run_in_threadpool(writer.close)
+        except BaseException:
+            await run_in_threadpool(self._abort, name, writer)
+            raise
+
+        return self.public_url(name)
+
+    async def upload_many(self, files: List[UploadFile], prefix: str = "recipes") -> List[str]:
+        """Upload several files concurrently and return their URLs in the order of the files.
+
+        At most upload_concurrency files are uploaded at the same time. If any
+        upload fails, the files that did upload are deleted before the error
+        is raised, so a failed request leaves no orphaned images.
+        """
+        semaphore = asyncio.Semaphore(self.upload_concurrency)
+
+        async def upload_one(file: UploadFile) -> str:
+            async with semaphore:
+                return await self.upload(file, prefix)
+
+        results = await asyncio.gather(*(upload_one(file) for file in files), return_exceptions=True)
+
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            uploaded = [result for result in results if isinstance(result, str)]
+            await asyncio.gather(*(self.delete(url) for url in uploaded), return_exceptions=True)
+            raise errors[0]
+
+        return results
+
+    async def delete(self, url: str):
+        """Remove a previously uploaded file given its public URL."""
+        await run_in_threadpool(self._delete, url[len(self.public_url("")):])
+
+    @abstractmethod
+    def public_url(self, name: str) -> str:
+        """Return the public URL of a stored object."""
+
+    @abstractmethod
+    def _open(self, name: str, content_type: str | None):
+        """Return a writer for a new object, with write and close methods."""
+
+    @abstractmethod
+    def _abort(self, name: str, writer):
+        """Drop an upload that failed before its writer was closed."""
+
+    @abstractmethod
+    def _delete(self, name: str):
+        """Remove a stored object."""
+
+
+class GCSImageStorage(ImageStorage):
+    """Stores images in a Google Cloud Storage bucket through a single client."""
+
+    def __init__(self, project: str, bucket_name: str, max_upload_bytes: int, upload_concurrency: int = 4):
+        from google.cloud import storage
+
+        super().__init__(max_upload_bytes, upload_concurrency)
+        self.client = storage.Client(project=project)
+        # bucket() builds a reference without the get_bucket() round trip
+        self.bucket = self.client.bucket(bucket_name)
+
+    def public_url(self, name: str) -> str:
+        return f"https://storage.googleapis.com/{self.bucket.name}/{name}"
+
+    def _open(self, name: str, content_type: str | None):
+        blob = self.bucket.blob(name)
+        blob.content_type = content_type
+        return blob.open("wb", chunk_size=CHUNK_SIZE)
+
+    def _abort(self, name: str, writer):
+        # The object only exists once the writer is closed, so an unfinished
+        # upload is dropped by not closing it
+        pass
+
+    def _delete(self, name: str):
+        self.bucket.blob(name).delete()
+
+
+class LocalImageStorage(ImageStorage):
+    """Stores images in a local directory, standing in for GCS offline and in tests."""
+
+    def __init__(self, root: str, base_url: str, max_upload_bytes: int, upload_concurrency: int = 4):
+        super().__init__(max_upload_bytes, upload_concurrency)
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def public_url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split("/"))
+
+    def _open(self, name: str, content_type: str | None):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, "wb")
+
+    def _abort(self, name: str, writer):
+        writer.close()
+        self._delete(name)
+
+    def _delete(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+def create_storage(settings) -> ImageStorage:
+    if settings.STORAGE_BACKEND == "local" or settings.TEST_ENV:
+        return LocalImageStorage(settings.STORAGE_LOCAL_DIR, settings.STORAGE_LOCAL_URL, settings.MAX_UPLOAD_BYTES, settings.UPLOAD_CONCURRENCY)
+    return GCSImageStorage(settings.STORAGE_PROJECT, settings.STORAGE_BUCKET, settings.MAX_UPLOAD_BYTES, settings.UPLOAD_CONCURRENCY)
+
+
+def get_storage(request: Request) -> ImageStorage:
+    return request.app.storage
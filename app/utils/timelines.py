@@ -0,0 +1,180 @@
+"""
+Materialized following timelines.
+
+When a user posts a recipe, an entry is written to the timeline of each of
+their followers (fan-out on write), so the following feed of a user is a
+single range read on the (owner_id, creation_date, recipe_id) index instead
+of an $in over every followed user. Timelines keep only the newest
+TIMELINE_SIZE entries. A post only inserts entries, in bulk, and each timeline
+is trimmed when its owner reads the first page of their feed, so a post does
+not cost a trim per follower.
+
+Accounts with FANOUT_THRESHOLD followers or more are not fanned out, as one
+post would write that many entries. Their recipes are merged into the feed at
+read time instead (fan-out on read), which stays cheap because there are few
+of them.
+
+Entries only reference the recipe, so deleted recipes are dropped when the
+page is resolved, and changes to a recipe are seen without touching them.
+"""
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from pymongo import DESCENDING, UpdateOne
+
+from app.utils.follows import FOLLOWS_COLLECTION, edge_id
+from app.utils.pagination import encode_cursor, decode_cursor
+
+TIMELINES_COLLECTION = "timelines"
+TIMELINE_SIZE = 800
+FANOUT_THRESHOLD = 5000
+BATCH_SIZE = 500
+
+
+def _entry(owner_id: str, recipe: dict) -> UpdateOne:
+    return UpdateOne(
+        {"_id": f"{owner_id}:{recipe['_id']}"},
+        {"$setOnInsert": {
+            "owner_id": owner_id,
+            "recipe_id": recipe["_id"],
+            "author_id": recipe["user_id"],
+            "creation_date": recipe["creation_date"],
+        }},
+        upsert=True,
+    )
+
+
+async def trim_timeline(db, owner_id: str):
+    """Drop the entries of a timeline beyond the newest TIMELINE_SIZE."""
+    overflow = await db[TIMELINES_COLLECTION].find({"owner_id": owner_id}, {"_id": 1}) \
+        .sort([("creation_date", DESCENDING), ("recipe_id", DESCENDING)]) \
+        .skip(TIMELINE_SIZE).to_list(None)
+    if overflow:
+        await db[TIMELINES_COLLECTION].delete_many({"_id": {"$in": [entry["_id"] for entry in overflow]}})
+
+
+def fans_out(author: dict) -> bool:
+    return author.get("follower_count", 0) < FANOUT_THRESHOLD
+
+
+async def fan_out_recipe(db, recipe: dict):
+    """Add a new recipe to the timelines of its author's followers."""
+    author = await db["users"].find_one({"_id": recipe["user_id"]}, {"follower_count": 1})
+    if author is None or not fans_out(author):
+        return
+
+    edges = db[FOLLOWS_COLLECTION].find({"followee_id": recipe["user_id"]}, {"follower_id": 1})
+    batch = []
+    async for edge in edges:
+        batch.append(edge["follower_id"])
+        if len(batch) == BATCH_SIZE:
+            await _write_entries(db, batch, recipe)
+            batch = []
+    if batch:
+        await _write_entries(db, batch, recipe)
+
+
+async def _write_entries(db, owner_ids: List[str], recipe: dict):
+    await db[TIMELINES_COLLECTION].bulk_write([_entry(owner_id, recipe) for owner_id in owner_ids], ordered=False)
+
+
+async def add_author(db, owner_id: str, author_id: str):
+    """Backfill a timeline with the latest recipes of a newly followed user."""
+    author = await db["users"].find_one({"_id": author_id}, {"follower_count": 1})
+    if author is None or not fans_out(author):
+        return
+
+    recipes = await db["recipes"].find({"user_id": author_id}, {"user_id": 1, "creation_date": 1}) \
+        .sort([("creation_date", DESCENDING), ("_id", DESCENDING)]).limit(TIMELINE_SIZE).to_list(None)
+    if recipes:
+        await db[TIMELINES_COLLECTION].bulk_write([_entry(owner_id, recipe) for recipe in recipes], ordered=False)
+        await trim_timeline(db, owner_id)
+
+
+async def remove_author(db, owner_id: str, author_id: str):
+    """Remove the recipes of an unfollowed user from a timeline."""
+    await db[TIMELINES_COLLECTION].delete_many({"owner_id": owner_id, "author_id": author_id})
+
+
+async def remove_recipe(db, recipe_id: str):
+    await db[TIMELINES_COLLECTION].delete_many({"recipe_id": recipe_id})
+
+
+async def remove_user(db, user_id: str):
+    """Delete the timeline of a deleted user and their recipes in other timelines."""
+    await db[TIMELINES_COLLECTION].delete_many({"owner_id": user_id})
+    await db[TIMELINES_COLLECTION].delete_many({"author_id": user_id})
+
+
+async def rebuild_timeline(db, owner_id: str):
+    """Fill a timeline from scratch with the latest recipes of every followed user."""
+    async for edge in db[FOLLOWS_COLLECTION].find({"follower_id": owner_id}, {"followee_id": 1}):
+        await add_author(db, owner_id, edge["followee_id"])
+
+
+async def _followed_celebrities(db, owner_id: str) -> List[str]:
+    # Few users are above the threshold, so check the follow edge of each one
+    celebrities = await db["users"].find({"follower_count": {"$gte": FANOUT_THRESHOLD}}, {"_id": 1}).to_list(None)
+    if not celebrities:
+        return []
+    edges = await db[FOLLOWS_COLLECTION].find(
+        {"_id": {"$in": [edge_id(owner_id, celebrity["_id"]) for celebrity in celebrities]}},
+        {"followee_id": 1},
+    ).to_list(None)
+    return [edge["followee_id"] for edge in edges]
+
+
+def _after(id_field: str, last_date, last_id) -> dict:
+    # Resume a (creation_date DESC, id DESC) ordered scan after the given item
+    return {"$or": [
+        {"creation_date": {"$lt": last_date}},
+        {"creation_date": last_date, id_field: {"$lt": last_id}},
+    ]}
+
+
+async def timeline_page(db, owner_id: str, size: int, start: int = 0, cursor: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+    """Return the recipe ids of one page of a following feed, newest first, and the next cursor.
+
+    Pages are requested either by offset (start) or by cursor, where an empty
+    cursor requests the first page.
+    """
+    if not cursor and start == 0:
+        await trim_timeline(db, owner_id)
+
+    timeline_query = {"owner_id": owner_id}
+    recipes_query = None
+
+    celebrities = await _followed_celebrities(db, owner_id)
+    if celebrities:
+        recipes_query = {"user_id": {"$in": celebrities}}
+
+    if cursor:
+        state = decode_cursor(cursor)
+        if state.get("feed") != "following" or "date" not in state or "id" not in state:
+            raise HTTPException(status_code=400, detail="Cursor does not match the requested sorting")
+        timeline_query = {"$and": [timeline_query, _after("recipe_id", state["date"], state["id"])]}
+        if recipes_query:
+            recipes_query = {"$and": [recipes_query, _after("_id", state["date"], state["id"])]}
+
+    # Fetch one extra item to know whether there is a next page
+    limit = start + size + 1
+    items = [
+        (entry["creation_date"], entry["recipe_id"])
+        for entry in await db[TIMELINES_COLLECTION].find(timeline_query, {"creation_date": 1, "recipe_id": 1})
+            .sort([("creation_date", DESCENDING), ("recipe_id", DESCENDING)]).limit(limit).to_list(limit)
+    ]
+    if recipes_query:
+        items += [
+            (recipe["creation_date"], recipe["_id"])
+            for recipe in await db["recipes"].find(recipes_query, {"creation_date": 1})
+                .sort([("creation_date", DESCENDING), ("_id", DESCENDING)]).limit(limit).to_list(limit)
+        ]
+        # A user above the threshold may also have entries from before crossing it
+        items = sorted(set(items), reverse=True)
+
+    items = items[start:]
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        next_cursor = encode_cursor({"feed": "following", "date": items[-1][0], "id": items[-1][1]})
+
+    return [recipe_id for _, recipe_id in items], next_cursor
@@ -1,10 +1,20 @@
+import asyncio
 import jwt
+import hashlib
+import logging
+import time
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from typing import Dict, Optional
 import os
+import uuid
+
+from app.config import settings
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
@@ -12,11 +22,29 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 20160  # 14 days
 
+# Verified tokens are cached by digest, so a token sent again skips the HMAC
+# check and JSON decoding. Entries never outlive the token's exp claim.
+token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL)
+
+# Digests of revoked tokens mapped to their exp, checked before the cache and
+# reloaded every REVOKED_TOKENS_REFRESH seconds to see other instances' logouts
+revoked_tokens: Dict[bytes, float] = {}
+
+def credentials_exception() -> HTTPException:
+    # A new instance per raise, as concurrent requests would share its traceback
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 def create_access_token(data: dict, user_id: str, username: str, expires_delta: timedelta = None):
     to_encode = data.copy()
     to_encode["user_id"] = user_id
     to_encode["username"] = username
     to_encode["iat"] = datetime.utcnow()
+    # Unique per token, so a new login never reproduces a revoked token
+    to_encode["jti"] = uuid.uuid4().hex
     
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -26,23 +54,93 @@ def create_access_token(data: dict, user_id: str, username: str, expires_delta:
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> Optional[Dict[str, str]]:
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+def decode_token(token: str, digest: bytes) -> Dict[str, str]:
+    """Verify a token and return its user claims, caching them until the token expires."""
+    claims = token_cache.get(digest)
+    if claims is not None:
+        return claims
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except (InvalidTokenError, jwt.ExpiredSignatureError):
+        raise credentials_exception() from None
+
+    if payload.get("user_id") is None:
+        raise credentials_exception()
+
+    claims = {"user_id": payload["user_id"], "username": payload.get("username")}
+    token_cache.set(digest, claims, expires_at=payload.get("exp"))
+    return claims
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Optional[Dict[str, str]]:
+    # Async, so it runs on the event loop and the cache and the revocation list
+    # are never touched by several threads at once
     if token is None:
         # No token, user is not authenticated
         return None
 
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+    digest = token_digest(token)
+    if digest in revoked_tokens:
+        raise credentials_exception()
+
+    return dict(decode_token(token, digest))
+
+
+async def revoke_token(db, token: str):
+    """Reject a token from now on, e.g. on logout.
+
+    The revocation is stored until the token expires, so it survives restarts
+    through load_revoked_tokens.
+    """
+    digest = token_digest(token)
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False})
+    expires_at = payload.get("exp", time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+    now = time.time()
+    for revoked, revoked_expiry in list(revoked_tokens.items()):
+        if revoked_expiry <= now:
+            del revoked_tokens[revoked]
+    revoked_tokens[digest] = expires_at
+    token_cache.pop(digest)
+
+    await db["revoked_tokens"].replace_one(
+        {"_id": digest.hex()},
+        {"_id": digest.hex(), "expires_at": datetime.utcfromtimestamp(expires_at)},
+        upsert=True,
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("user_id")
-        username: str = payload.get("username")
-        if user_id is None:
-            raise credentials_exception
-        return {"user_id": user_id, "username": username}
-    except (InvalidTokenError, jwt.ExpiredSignatureError):
-        raise credentials_exception
+
+async def load_revoked_tokens(db):
+    """Load the revocations of the tokens that have not expired yet.
+
+    Revocations are only ever added, so the loaded ones are merged into the
+    list, and a logout on this instance that is not stored yet is kept.
+    """
+    loaded = {}
+    async for document in db["revoked_tokens"].find({"expires_at": {"$gt": datetime.utcnow()}}):
+        loaded[bytes.fromhex(document["_id"])] = (document["expires_at"] - datetime(1970, 1, 1)).total_seconds()
+
+    now = time.time()
+    for revoked, revoked_expiry in list(revoked_tokens.items()):
+        if revoked_expiry <= now:
+            del revoked_tokens[revoked]
+    revoked_tokens.update(loaded)
+
+
+async def refresh_revoked_tokens_periodically(db, interval: float):
+    """Reload the revocations every interval seconds, until cancelled.
+
+    Logouts on other instances are only stored in the database, so this bounds
+    how long their tokens are still accepted here.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await load_revoked_tokens(db)
+        except Exception:
+            logger.exception("Could not reload the revoked tokens")